@@ -0,0 +1,55 @@
+"""
+Benchmark do GeradorLote: vazão (orçamentos/s) vs. número de processos.
+
+Uso: python benchmarks/bench_batch.py [modelo.xlsx] [jobs] [itens]
+
+Gera o mesmo lote com 1, 2, 4, ... processos até ao número de núcleos. Como
+cada worker tem motor e cache de templates próprios, a vazão deve crescer
+quase linearmente até esgotar os núcleos.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.batch import GeradorLote, JobOrcamento
+
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+
+def _linhas(n: int):
+    linhas = [{"ITEM": "1", "DESCRICAO": "SERVIÇOS PRELIMINARES", "_NIVEL_FORCADO": "N1"}]
+    for i in range(1, n):
+        linhas.append({"ITEM": f"1.{i}", "CODIGO": str(1000 + i), "BANCO": "SINAPI",
+                       "DESCRICAO": f"SERVIÇO {i} " + "X" * (i % 120), "UNID": "m2",
+                       "QUANT": "2,5", "UNIT": "R$ 1.234,56", "_NIVEL_FORCADO": "ITEM"})
+    return linhas
+
+
+def main():
+    modelo = sys.argv[1] if len(sys.argv) > 1 else os.path.join("config", "templates", "MODELO_SUP(2025).xlsx")
+    num_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    itens = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    linhas = _linhas(itens)
+
+    workers = 1
+    base = None
+    while True:
+        jobs = [JobOrcamento(linhas, MAPA, {"nome_arquivo": f"bench_lote_{workers}_{i}", "bdi": 0.2882,
+                                            "calc_mode": "TRUNC"}, modelo) for i in range(num_jobs)]
+        inicio = time.perf_counter()
+        resultados = GeradorLote(max_workers=workers).gerar(jobs)
+        total = time.perf_counter() - inicio
+        vazao = num_jobs / total
+        base = base or vazao
+        falhas = sum(1 for r in resultados if not r.ok)
+        print(f"{workers:>3} proc: {total:7.2f}s  {vazao:6.2f} orç/s  x{vazao / base:4.2f}  falhas={falhas}")
+        if workers >= (os.cpu_count() or 1):
+            break
+        workers = min(workers * 2, os.cpu_count() or 1)
+
+
+if __name__ == "__main__":
+    main()
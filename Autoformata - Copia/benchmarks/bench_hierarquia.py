@@ -0,0 +1,65 @@
+"""
+Benchmark da ArvoreHierarquia: tempo de construção vs. número de linhas.
+
+Uso: python benchmarks/bench_hierarquia.py
+
+Monta orçamentos sintéticos (N1 > N2 > N3 > itens) de tamanho crescente e
+compara a passagem única com pilha com a varredura para a frente a partir de
+cada título (implementação antiga de _calcular_subtotais). O tempo por linha
+da árvore deve ficar constante, ou seja, escala linear.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.hierarquia import ArvoreHierarquia
+
+TAMANHOS = [2_000, 8_000, 32_000, 128_000]
+
+
+def _mapa(n: int):
+    mapa, niveis = [], ["N1"] + (["N2"] + (["N3"] + ["ITEM"] * 8) * 4) * 5
+    while len(mapa) < n:
+        for nivel in niveis:
+            mapa.append({'row': 25 + len(mapa), 'nivel': nivel})
+    return mapa[:n]
+
+
+def _varredura_antiga(mapa):
+    subtotais = {}
+    peso = {"N1": 1, "N2": 2, "N3": 3, "ITEM": 4}
+    for i, atual in enumerate(mapa):
+        if atual['nivel'] == "ITEM": continue
+        nivel_pai = peso.get(atual['nivel'], 1)
+        idx_fim = i
+        for j in range(i + 1, len(mapa)):
+            if peso.get(mapa[j]['nivel'], 4) <= nivel_pai: break
+            idx_fim = j
+        if idx_fim > i:
+            subtotais[atual['row']] = (mapa[i + 1]['row'], mapa[idx_fim]['row'])
+    return subtotais
+
+
+def _medir(func, mapa, repeticoes=3):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func(mapa)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    print(f"{'linhas':>8} | {'árvore (ms)':>11} | {'µs/linha':>8} | {'varredura (ms)':>14} | {'µs/linha':>8}")
+    for n in TAMANHOS:
+        mapa = _mapa(n)
+        t_arvore, arvore = _medir(lambda m: ArvoreHierarquia(m).intervalos(), mapa)
+        t_antiga, antiga = _medir(_varredura_antiga, mapa)
+        assert arvore == antiga
+        print(f"{n:>8} | {t_arvore * 1e3:>11.1f} | {t_arvore / n * 1e6:>8.2f} | {t_antiga * 1e3:>14.1f} | {t_antiga / n * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
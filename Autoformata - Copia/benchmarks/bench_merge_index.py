@@ -0,0 +1,77 @@
+"""
+Benchmark do MergeIndex: custo por linha escrita vs. número de mesclagens.
+
+Uso: python benchmarks/bench_merge_index.py
+
+Para cada quantidade de mesclagens no template, escreve 1000 linhas com o
+mesmo caminho do OrcamentoEngine (_limpar_mesclagem_linha + _safe_write nas
+8 colunas) e compara com a varredura linear antiga. Com o índice o custo por
+linha deve ficar estável; com a varredura cresce com o número de mesclagens.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from openpyxl.cell.cell import MergedCell
+
+from core.excel_handler import OrcamentoEngine
+from core.merge_index import MergeIndex
+
+LINHAS = 1000
+
+
+def _montar_planilha(num_merges: int):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    # Uma mesclagem a cada 10 linhas da área de dados (desfeitas ao escrever);
+    # as restantes ficam abaixo dela, como o cabeçalho/rodapé de um template.
+    for row in range(1, LINHAS + 1, 10):
+        ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=3)
+    for i in range(num_merges):
+        ws.merge_cells(start_row=LINHAS + 10 + i, start_column=4, end_row=LINHAS + 10 + i, end_column=8)
+    return wb, ws
+
+
+def _linear(ws, row):
+    """Caminho antigo: varredura de ws.merged_cells.ranges por linha e por célula."""
+    for merged in list(ws.merged_cells.ranges):
+        if merged.min_row <= row <= merged.max_row:
+            ws.unmerge_cells(str(merged))
+    for col in range(1, 9):
+        cell = ws.cell(row, col)
+        if isinstance(cell, MergedCell):
+            for merged in list(ws.merged_cells.ranges):
+                if cell.coordinate in merged:
+                    ws.unmerge_cells(str(merged))
+                    break
+            cell = ws.cell(row, col)
+        cell.value = row
+
+
+def _indexado(num_merges: int) -> float:
+    wb, ws = _montar_planilha(num_merges)
+    eng = OrcamentoEngine({})
+    eng.wb_out, eng.ws_out, eng.merges = wb, ws, MergeIndex(ws)
+    t0 = time.perf_counter()
+    for row in range(1, LINHAS + 1):
+        eng._limpar_mesclagem_linha(row)
+        for col in range(1, 9):
+            eng._safe_write(row, col, row)
+    return (time.perf_counter() - t0) / LINHAS
+
+
+def _varredura(num_merges: int) -> float:
+    wb, ws = _montar_planilha(num_merges)
+    t0 = time.perf_counter()
+    for row in range(1, LINHAS + 1):
+        _linear(ws, row)
+    return (time.perf_counter() - t0) / LINHAS
+
+
+if __name__ == "__main__":
+    print(f"{'mesclagens':>10} | {'índice (µs/linha)':>18} | {'varredura (µs/linha)':>20}")
+    for n in (100, 400, 1600, 6400):
+        print(f"{n:>10} | {_indexado(n) * 1e6:>18.1f} | {_varredura(n) * 1e6:>20.1f}")
@@ -7,11 +7,32 @@ import time
 import queue
 from pathlib import Path
 import pandas as pd
-import win32com.client
-import pythoncom
+
+# O Excel (COM) só é preciso como recurso para sintéticos que não são .xlsx
+try:
+    import win32com.client
+    import pythoncom
+    HAS_WIN32 = True
+except ImportError:
+    HAS_WIN32 = False
 
 from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML
+from core.batch import GeradorLote
+from core.fan_out import GeradorMultiModelo
+from core.budget_split import GeradorPorCapitulo
+from core.incremental import RegeneradorIncremental
+from core.disk_cache import DiskCache
+from core.result_cache import CacheGeracao
+from core.sanitize_cache import CacheSanitizados
+from core.sheet_cache import CacheTabelas
+from core.consolidation import Consolidador
+from core.sipac_reader import ler_tabela, linhas_preview
+from core.revision_diff import comparar_arquivos
+from core.timings import formatar_fases_lentas
 from core.database import DatabaseManager
+from core.sanitizer import ExcelSanitizer
+from core.exceptions import DataExtractionError, Win32ProcessError
 from core.paths import get_app_dir
 
 from utils.logger import Logger
@@ -47,6 +68,12 @@ class MainController:
         db_path = get_app_dir() / 'planify_history.db'
         db_config = {'database': {'nome_arquivo': str(db_path)}}
         self.db_manager = DatabaseManager(db_config)
+        # Resultados de gerações anteriores (xlsx/PDF) por hash das entradas
+        self.cache_resultados = DiskCache(get_app_dir() / "cache" / "resultados")
+        # Sintéticos já limpos, por hash do original
+        self.cache_sanitizados = CacheSanitizados(DiskCache(get_app_dir() / "cache" / "sanitizados", limite_bytes=256 * 1024 * 1024))
+        # Sintético lido uma vez: colunas, pré-visualização e revisões fatiam a mesma grade
+        self.cache_tabelas = CacheTabelas(DiskCache(get_app_dir() / "cache" / "tabelas", limite_bytes=256 * 1024 * 1024))
 
         self.sintetico_original_path = ""
         self.sintetico_limpo_path = ""
@@ -109,7 +136,7 @@ class MainController:
             return {}
 
     # ──────────────────────────────────────────────
-    #  LEITURA SEGURA (Win32COM Blindado)
+    #  LEITURA SEGURA (reparação do pacote; Win32COM como recurso)
     # ──────────────────────────────────────────────
 
     def iniciar_leitura_segura(self, original_path, on_success, on_error):
@@ -127,27 +154,66 @@ class MainController:
         ).start()
 
     def _limpar_planilha_sipac(self, caminho_original, on_success, on_error):
-        """Abre o ficheiro no próprio Excel invisível e guarda uma cópia limpa e sem erros."""
+        """
+        Guarda uma cópia limpa do sintético. O pacote é reparado no próprio
+        zip/XML (ExcelSanitizer.reparar_pacote); o Excel invisível só é usado
+        quando isso não é possível (ex.: .xls binário). Um sintético já
+        importado sai do cache de sanitizados, sem reparar de novo.
+        """
         temp_dir = get_app_dir() / "Output"
         temp_dir.mkdir(exist_ok=True)
 
-        caminho_copia = str(temp_dir / "temp_original_desbloqueado.xlsx")
+        caminho_limpo = str(temp_dir / "temp_sintetico_limpo.xlsx")
+        if os.path.exists(caminho_limpo):
+            try:
+                os.remove(caminho_limpo)
+            except Exception:
+                pass
+
         try:
-            shutil.copy2(caminho_original, caminho_copia)
-        except Exception as e:
+            self.cache_sanitizados.limpar(caminho_original, caminho_limpo, self._sanitizar)
+        except Win32ProcessError as e:
+            self.ui_queue.put({
+                'action': 'limpar_planilha_erro',
+                '_handler': on_error,
+                'erro_msg': str(e)
+            })
+            return
+        except OSError as e:
             self.ui_queue.put({
                 'action': 'limpar_planilha_erro',
                 '_handler': on_error,
-                'erro_msg': f"Falha ao tirar bloqueio de segurança: {e}"
+                'erro_msg': f"Falha ao ler o sintético: {e}"
             })
             return
 
-        caminho_limpo = str(temp_dir / "temp_sintetico_limpo.xlsx")
-        if os.path.exists(caminho_limpo):
-            try:
-                os.remove(caminho_limpo)
-            except Exception:
-                pass
+        self.sintetico_limpo_path = caminho_limpo
+        self.ui_queue.put({
+            'action': 'limpar_planilha_sucesso',
+            '_handler': on_success,
+            'path_limpo': caminho_limpo
+        })
+
+    def _sanitizar(self, caminho_original, caminho_limpo):
+        """Reparação direta do pacote; se não for um .xlsx, SaveAs pelo Excel (Win32ProcessError se falhar)."""
+        try:
+            ExcelSanitizer().reparar_pacote(caminho_original, caminho_limpo)
+        except DataExtractionError as e:
+            self.logger.warning(f"Reparação direta não aplicável ({e}); a usar o Excel.")
+            erro = self._salvar_pelo_excel(caminho_original, caminho_limpo)
+            if erro:
+                raise Win32ProcessError(erro, e)
+
+    def _salvar_pelo_excel(self, caminho_original, caminho_limpo):
+        """Recurso: abre uma cópia no Excel invisível e faz SaveAs .xlsx. Devolve a mensagem de erro ou None."""
+        if not HAS_WIN32:
+            return "Arquivo não pode ser reparado diretamente e o Excel (pywin32) não está disponível."
+
+        caminho_copia = str(Path(caminho_limpo).parent / "temp_original_desbloqueado.xlsx")
+        try:
+            shutil.copy2(caminho_original, caminho_copia)
+        except Exception as e:
+            return f"Falha ao tirar bloqueio de segurança: {e}"
 
         excel = None
         wb = None
@@ -166,19 +232,9 @@ class MainController:
             wb = None
             excel.Quit()
             excel = None
-
-            self.sintetico_limpo_path = caminho_limpo
-            self.ui_queue.put({
-                'action': 'limpar_planilha_sucesso',
-                '_handler': on_success,
-                'path_limpo': caminho_limpo
-            })
+            return None
         except Exception as e:
-            self.ui_queue.put({
-                'action': 'limpar_planilha_erro',
-                '_handler': on_error,
-                'erro_msg': f"Erro COM do Windows: {str(e)}"
-            })
+            return f"Erro COM do Windows: {str(e)}"
         finally:
             # Win32COM Blindado: garante fecho no finally
             if wb:
@@ -207,19 +263,11 @@ class MainController:
     def ler_colunas(self, line_num):
         if not self.sintetico_limpo_path:
             return []
-        df = None
         try:
-            df = pd.read_excel(self.sintetico_limpo_path,
-                               header=line_num, nrows=5)
-            cols = [str(c).strip() for c in df.columns if "Unnamed" not in str(c)]
-            return cols
+            return [c for c in self.cache_tabelas.colunas(self.sintetico_limpo_path, line_num) if "Unnamed" not in c]
         except Exception as e:
             print(f"Erro ao ler colunas: {e}")
             return []
-        finally:
-            if df is not None:
-                del df
-                gc.collect()
 
     # ──────────────────────────────────────────────
     #  PREVIEW
@@ -245,38 +293,8 @@ class MainController:
                            on_success, on_error):
         df = None
         try:
-            df = pd.read_excel(self.sintetico_limpo_path, header=line_num)
-            df.columns = [str(c).strip() for c in df.columns]
-
-            # Radar Inteligente: para quando encontra rodapé do orçamento
-            palavras_parada = ["TOTAL SEM BDI", "TOTAL DO BDI",
-                               "TOTAL GERAL", "VALOR GLOBAL", "CUSTO TOTAL"]
-
-            dados_linhas = []
-
-            for idx, row in df.iterrows():
-                desc_val = str(row.get(m_desc, 'nan')).strip()
-                desc_upper = desc_val.upper()
-
-                if any(p in desc_upper for p in palavras_parada):
-                    self.logger.info(
-                        f"🛑 Fim do orçamento detetado pelo radar na linha {line_num + idx + 2}.")
-                    break
-
-                if desc_val == 'nan' or desc_val == '' or desc_val == 'None':
-                    continue
-
-                unit_val = row.get(m_unit, 0)
-
-                dados_linhas.append({
-                    'index_excel': line_num + idx + 2,
-                    'item_val': row.get(m_item, ''),
-                    'desc_val': desc_val,
-                    'cod_val': row.get(m_cod, ''),
-                    'banco_val': row.get(m_banco, ''),
-                    'raw_row_data': row.to_dict(),
-                    'unit_val': unit_val
-                })
+            df = ler_tabela(self.sintetico_limpo_path, line_num, self.cache_tabelas)
+            dados_linhas = linhas_preview(df, line_num, m_item, m_desc, m_cod, m_banco, m_unit)
 
             self.ui_queue.put({
                 'action': 'carregar_preview_sucesso',
@@ -295,6 +313,30 @@ class MainController:
                 del df
                 gc.collect()
 
+    def comparar_revisoes(self, caminho_v1, caminho_v2, line_num, mapa, on_success, on_error):
+        """Itens adicionados, removidos e alterados entre duas versões do sintético, e a variação por capítulo."""
+        threading.Thread(
+            target=self._run_comparar_revisoes,
+            args=(caminho_v1, caminho_v2, line_num, mapa, on_success, on_error),
+            daemon=True
+        ).start()
+
+    def _run_comparar_revisoes(self, caminho_v1, caminho_v2, line_num, mapa, on_success, on_error):
+        try:
+            diff = comparar_arquivos(caminho_v1, caminho_v2, line_num, mapa, self.cache_tabelas)
+            self.ui_queue.put({
+                'action': 'comparar_revisoes_sucesso',
+                '_handler': on_success,
+                'diff': diff
+            })
+        except Exception as e:
+            self.logger.error(f"Erro ao comparar revisões: {e}")
+            self.ui_queue.put({
+                'action': 'comparar_revisoes_erro',
+                '_handler': on_error,
+                'erro_msg': f"Ocorreu um erro ao comparar as revisões:\n{str(e)}"
+            })
+
     # ──────────────────────────────────────────────
     #  GERAÇÃO DE ORÇAMENTO
     # ──────────────────────────────────────────────
@@ -308,7 +350,17 @@ class MainController:
 
     def _run_orcamento(self, d, m, p, modelo_path, on_progress, on_success, on_error):
         start_time = time.time()
-        eng = OrcamentoEngine({})
+        # Motor escolhido por geração: o XML escreve em streaming e não carrega o template no OpenPyXL
+        eng = OrcamentoEngineXML({}) if p.get("motor") == "XML" else OrcamentoEngine({})
+        cache = None
+        if GeradorPorCapitulo.precisa_dividir(d, p, m):
+            # Orçamento grande demais para um só arquivo: um workbook por capítulo N1 + resumo
+            eng = GeradorPorCapitulo(eng)
+        else:
+            # Nova geração do mesmo arquivo (cabeçalho editado, linhas reclassificadas):
+            # corrige só as células alteradas do arquivo anterior. Entradas idênticas
+            # a uma geração anterior nem chegam ao motor: o resultado vem do cache.
+            eng = cache = CacheGeracao(RegeneradorIncremental(eng), self.cache_resultados)
 
         def progress_callback(pct):
             self.ui_queue.put({
@@ -322,7 +374,13 @@ class MainController:
         pdf_msg = ""
         if ok and p.get("gerar_pdf", 0) == 1:
             self.logger.info("Iniciando conversão para PDF...")
-            ok_pdf, path_pdf, log_pdf = PDFExporter.converter_para_pdf(msg)
+            inicio_pdf = time.perf_counter()
+            converter = PDFExporter.converter_para_pdf
+            ok_pdf, path_pdf, log_pdf = cache.pdf(msg, extra_info, converter) if cache else converter(msg)
+            if 'tempos' in extra_info:
+                tempos, segundos = extra_info['tempos'], round(time.perf_counter() - inicio_pdf, 4)
+                tempos['fases']['pdf'] = segundos
+                tempos['total'] = round(tempos['total'] + segundos, 4)
             if ok_pdf:
                 self.logger.info(f"✅ PDF Gerado: {path_pdf}")
                 pdf_msg = f"\n\nPDF também gerado:\n{path_pdf}"
@@ -334,17 +392,8 @@ class MainController:
 
         if ok:
             try:
-                dados_historico = {
-                    'data_geracao': p.get('data'),
-                    'nome_obra': p.get('nome_arquivo'),
-                    'local': f"{p.get('campus')} - {p.get('setor')}",
-                    'bdi': p.get('bdi'),
-                    'valor_total': 0.0,
-                    'arquivo_saida': msg,
-                    'num_itens': len(d),
-                    'num_titulos': sum(1 for x in d if x.get('_NIVEL_FORCADO') != 'ITEM'),
-                    'duracao_processamento': round(duration, 2)
-                }
+                dados_historico = self.db_manager.montar_registro(p, d, msg, duration, extra_info.get('valor_total', 0.0),
+                                                                  tempos=extra_info.get('tempos'))
                 self.db_manager.inserir_orcamento(dados_historico)
                 self.logger.info("✅ Histórico salvo no banco de dados.")
             except Exception as e:
@@ -357,7 +406,8 @@ class MainController:
                 'duration': duration,
                 'info_data': p,
                 'raw_data': d,
-                'pdf_msg': pdf_msg
+                'pdf_msg': pdf_msg,
+                'tempos': extra_info.get('tempos')
             })
         else:
             self.ui_queue.put({
@@ -366,6 +416,113 @@ class MainController:
                 'msg': msg
             })
 
+    def gerar_lote(self, jobs, on_progress, on_success, on_error, max_workers=None):
+        """Gera vários orçamentos (lista de JobOrcamento) em processos paralelos."""
+        threading.Thread(
+            target=self._run_lote,
+            args=(jobs, on_progress, on_success, on_error, max_workers),
+            daemon=True
+        ).start()
+
+    def _run_lote(self, jobs, on_progress, on_success, on_error, max_workers):
+        def progress_callback(feitos, total):
+            self.ui_queue.put({
+                'action': 'gerar_lote_progresso',
+                '_handler': on_progress,
+                'percent': int(feitos / total * 100)
+            })
+
+        try:
+            resultados = GeradorLote(max_workers, self.db_manager).gerar(jobs, progress_callback)
+            self.ui_queue.put({
+                'action': 'gerar_lote_sucesso',
+                '_handler': on_success,
+                'resultados': resultados
+            })
+        except Exception as e:
+            self.logger.error(f"Erro no lote: {e}")
+            self.ui_queue.put({
+                'action': 'gerar_lote_erro',
+                '_handler': on_error,
+                'msg': str(e)
+            })
+
+    def gerar_multi_modelo(self, d, m, info, modelos, on_progress, on_success, on_error):
+        """Gera o mesmo orçamento em vários templates, preparando as linhas uma só vez."""
+        threading.Thread(
+            target=self._run_multi_modelo,
+            args=(d, m, info, modelos, on_progress, on_success, on_error),
+            daemon=True
+        ).start()
+
+    def _run_multi_modelo(self, d, m, p, modelos, on_progress, on_success, on_error):
+        def progress_callback(pct):
+            self.ui_queue.put({
+                'action': 'gerar_multi_modelo_progresso',
+                '_handler': on_progress,
+                'percent': pct
+            })
+
+        try:
+            resultados = GeradorMultiModelo(db_manager=self.db_manager).gerar(d, modelos, m, p, progress_callback)
+            self.ui_queue.put({
+                'action': 'gerar_multi_modelo_sucesso',
+                '_handler': on_success,
+                'resultados': resultados
+            })
+        except Exception as e:
+            self.logger.error(f"Erro na geração multi-modelo: {e}")
+            self.ui_queue.put({
+                'action': 'gerar_multi_modelo_erro',
+                '_handler': on_error,
+                'msg': str(e)
+            })
+
+    def consolidar_orcamentos(self, pasta, campus, mes, on_progress, on_success, on_error):
+        """Resume os orçamentos gerados numa pasta (filtrados por campus/mês) num só workbook."""
+        threading.Thread(
+            target=self._run_consolidacao,
+            args=(pasta, campus, mes, on_progress, on_success, on_error),
+            daemon=True
+        ).start()
+
+    def _run_consolidacao(self, pasta, campus, mes, on_progress, on_success, on_error):
+        caminhos = []
+
+        def progress_callback(feitos):
+            self.ui_queue.put({
+                'action': 'consolidar_progresso',
+                '_handler': on_progress,
+                'percent': int(feitos / max(len(caminhos), 1) * 100)
+            })
+
+        try:
+            caminhos = Consolidador.arquivos(pasta)
+            caminho, n = Consolidador().consolidar(caminhos, pasta, campus=campus, mes=mes, progress_callback=progress_callback)
+            self.ui_queue.put({
+                'action': 'consolidar_sucesso',
+                '_handler': on_success,
+                'msg': caminho,
+                'extra_info': {'orcamentos': n}
+            })
+        except Exception as e:
+            self.logger.error(f"Erro na consolidação: {e}")
+            self.ui_queue.put({
+                'action': 'consolidar_erro',
+                '_handler': on_error,
+                'msg': str(e)
+            })
+
+    # ──────────────────────────────────────────────
+    #  HISTÓRICO
+    # ──────────────────────────────────────────────
+
+    def relatorio_fases_lentas(self, ultimas=50):
+        """Fases mais lentas nas últimas gerações registadas (texto para log ou diálogo)."""
+        relatorio = formatar_fases_lentas(self.db_manager.fases_mais_lentas(ultimas))
+        self.logger.info(f"Fases mais lentas (últimas {ultimas} gerações):\n{relatorio}")
+        return relatorio
+
     # ──────────────────────────────────────────────
     #  SMART PARSER
     # ──────────────────────────────────────────────
@@ -0,0 +1,114 @@
+import os
+import re
+import time
+import tempfile
+from typing import List
+
+from utils.logger import Logger
+from core.exceptions import ExcelProcessError
+
+# Lock mais antigo que isto é de uma geração que morreu sem o remover
+_LOCK_EXPIRADO_S = 15 * 60
+
+
+class SaidaAtomica:
+    """
+    Ficheiro de saída gravado de forma atómica, com nome livre reservado.
+
+    O nome (Nome.xlsx, Nome_v1.xlsx, ...) é reservado criando `Nome.xlsx.lock`
+    com O_EXCL: duas gerações simultâneas com o mesmo nome_arquivo nunca ficam
+    com o mesmo destino. O conteúdo é escrito num temporário da mesma pasta e só
+    `concluir()` o coloca no nome final com `os.replace`, de modo que ninguém vê
+    um ficheiro a meio. Ao sair do `with` sem concluir, o temporário é apagado.
+
+        with SaidaAtomica("Output", "Orcamento") as saida:
+            wb.save(saida.temporario)
+            caminho = saida.concluir()
+    """
+
+    def __init__(self, pasta: str, nome_base: str, extensao: str = ".xlsx", max_versoes: int = 20):
+        self.pasta = pasta
+        self.nome_base = re.sub(r'[<>:"/\\|?*]', '', nome_base.strip()) or "Orcamento"
+        self.extensao = extensao
+        self.max_versoes = max_versoes
+        self.caminho: str = ""
+        self.temporario: str = ""
+        self._locks: List[str] = []
+        self._versao = 0
+
+    def __enter__(self) -> "SaidaAtomica":
+        os.makedirs(self.pasta, exist_ok=True)
+        self.caminho = self._reservar()
+        fd, self.temporario = tempfile.mkstemp(prefix=f"~{self.nome_base}.", suffix=self.extensao, dir=self.pasta)
+        os.close(fd)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.temporario and os.path.exists(self.temporario):
+            try:
+                os.remove(self.temporario)
+            except OSError:
+                pass
+        for lock in self._locks:
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
+        self._locks.clear()
+
+    def concluir(self) -> str:
+        """Move o temporário para o nome reservado e devolve o caminho final."""
+        while True:
+            try:
+                os.replace(self.temporario, self.caminho)
+                self.temporario = ""
+                return self.caminho
+            except PermissionError:
+                # Destino aberto no Excel (Windows): segue para a versão seguinte
+                Logger.warning(f"Arquivo '{os.path.basename(self.caminho)}' está aberto. Tentando outra versão...")
+                self._versao += 1
+                self.caminho = self._reservar()
+
+    # ──────────────────────────────────────────────
+    #  INTERNOS
+    # ──────────────────────────────────────────────
+
+    def _reservar(self) -> str:
+        while self._versao < self.max_versoes:
+            sufixo = "" if self._versao == 0 else f"_v{self._versao}"
+            caminho = os.path.join(self.pasta, f"{self.nome_base}{sufixo}{self.extensao}")
+            if not self._aberto_no_excel(caminho) and self._criar_lock(caminho + ".lock"):
+                return caminho
+            self._versao += 1
+        raise ExcelProcessError(f"Muitos arquivos '{self.nome_base}' bloqueados! Feche o aplicativo Excel.")
+
+    def _criar_lock(self, lock: str) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._lock_expirado(lock):
+                    return False
+                try:
+                    os.remove(lock)
+                except OSError:
+                    return False
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            self._locks.append(lock)
+            return True
+        return False
+
+    @staticmethod
+    def _lock_expirado(lock: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(lock) > _LOCK_EXPIRADO_S
+        except OSError:
+            return False
+
+    @staticmethod
+    def _aberto_no_excel(caminho: str) -> bool:
+        # O Excel cria "~$Nome.xlsx" ao lado do ficheiro enquanto o tem aberto
+        pasta, nome = os.path.split(caminho)
+        return os.path.exists(os.path.join(pasta, "~$" + nome))
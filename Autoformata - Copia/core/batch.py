@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Any, Callable
+
+from utils.logger import Logger
+from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML
+
+
+@dataclass
+class JobOrcamento:
+    """Especificação de uma geração: os mesmos argumentos de gerar_excel_final."""
+    linhas: List[Dict[str, Any]]
+    mapa_colunas: Dict[str, str]
+    info: Dict[str, Any]
+    modelo_path: str
+
+
+@dataclass
+class ResultadoJob:
+    indice: int
+    ok: bool
+    msg: str  # caminho do ficheiro gerado ou mensagem de erro
+    duracao: float
+    extra_info: Dict[str, Any] = field(default_factory=dict)
+    pid: int = 0
+
+
+# Um motor de cada tipo por processo worker (o TemplateCache também é por processo)
+_motores: Dict[str, OrcamentoEngine] = {}
+
+
+def _motor(tipo: str) -> OrcamentoEngine:
+    if tipo not in _motores:
+        _motores[tipo] = OrcamentoEngineXML({}) if tipo == "XML" else OrcamentoEngine({})
+    return _motores[tipo]
+
+
+def _executar_job(indice: int, job: JobOrcamento) -> ResultadoJob:
+    inicio = time.perf_counter()
+    try:
+        eng = _motor(job.info.get("motor", "OPENPYXL"))
+        ok, msg, extra_info = eng.gerar_excel_final(job.linhas, job.modelo_path, job.mapa_colunas, job.info)
+    except Exception as e:  # TemplateNotFoundError e afins não devem derrubar o lote
+        ok, msg, extra_info = False, str(e), {}
+    return ResultadoJob(indice, ok, msg, round(time.perf_counter() - inicio, 3), extra_info or {}, os.getpid())
+
+
+class GeradorLote:
+    """
+    Geração de vários orçamentos em paralelo, um job por processo.
+
+    O OpenPyXL é CPU-bound e segura o GIL, por isso cada worker é um processo com
+    o seu próprio motor e cache de templates. O número de workers, por omissão,
+    é o número de núcleos da máquina.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, db_manager=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.db_manager = db_manager
+
+    def gerar(self, jobs: List[JobOrcamento], progress_callback: Optional[Callable[[int, int], None]] = None) -> List[ResultadoJob]:
+        """Executa os jobs e devolve os resultados na ordem em que foram pedidos."""
+        if not jobs:
+            return []
+        jobs = self._nomes_unicos(jobs)
+        workers = min(self.max_workers, len(jobs))
+        Logger.info(f"Lote: {len(jobs)} orçamentos em {workers} processo(s)")
+
+        resultados: List[Optional[ResultadoJob]] = [None] * len(jobs)
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = {pool.submit(_executar_job, i, job): i for i, job in enumerate(jobs)}
+            for feitos, futuro in enumerate(as_completed(futuros), start=1):
+                i = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                except Exception as e:  # worker morto (BrokenProcessPool, MemoryError...)
+                    resultado = ResultadoJob(i, False, f"Erro crítico: {e}", 0.0)
+                resultados[i] = resultado
+                self._registrar(jobs[i], resultado)
+                if progress_callback:
+                    progress_callback(feitos, len(jobs))
+
+        total = time.perf_counter() - inicio
+        ok = sum(1 for r in resultados if r.ok)
+        Logger.info(f"Lote concluído: {ok}/{len(jobs)} em {total:.2f}s")
+        return resultados
+
+    @staticmethod
+    def _nomes_unicos(jobs: List[JobOrcamento]) -> List[JobOrcamento]:
+        """Jobs simultâneos com o mesmo nome_arquivo disputariam o mesmo ficheiro de saída."""
+        vistos: Dict[str, int] = {}
+        unicos = []
+        for job in jobs:
+            nome = job.info.get("nome_arquivo", "Orcamento")
+            n = vistos.get(nome, 0)
+            vistos[nome] = n + 1
+            if n:
+                job = JobOrcamento(job.linhas, job.mapa_colunas, {**job.info, "nome_arquivo": f"{nome}_{n + 1}"}, job.modelo_path)
+            unicos.append(job)
+        return unicos
+
+    def _registrar(self, job: JobOrcamento, resultado: ResultadoJob) -> None:
+        if not (self.db_manager and resultado.ok):
+            return
+        try:
+            self.db_manager.inserir_orcamento(
+                self.db_manager.montar_registro(job.info, job.linhas, resultado.msg, resultado.duracao,
+                                               resultado.extra_info.get('valor_total', 0.0),
+                                               tempos=resultado.extra_info.get('tempos')))
+        except Exception as e:
+            Logger.error(f"Erro ao salvar histórico do lote: {e}")
@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import zipfile
+from html import unescape
+from typing import Optional, Dict, List, Tuple, Any, Callable
+
+import openpyxl
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+from openpyxl.packaging.relationship import Relationship
+from openpyxl.workbook.external_link.external import (
+    ExternalLink, ExternalBook, ExternalSheetNames, ExternalSheetDataSet, ExternalSheetData, ExternalRow, ExternalCell)
+
+from utils.logger import Logger
+from core.excel_handler import OrcamentoEngine
+from core.atomic_output import SaidaAtomica
+from core.formula_eval import salvar_com_valores, nivel_compressao, totais_rodape, NOMES_TOTAIS
+from core.timings import CronometroFases
+from core.xml_engine import planilha_ativa
+
+# Limites por omissão a partir dos quais o orçamento é dividido (0 desliga o critério)
+LIMITE_LINHAS = 30000
+LIMITE_BYTES = 64 * 1024 * 1024
+# Estimativa do XML gerado por célula além do próprio texto (tags, referência, estilo)
+_BYTES_POR_CELULA = 40
+
+
+def nome_planilha_ativa(caminho: str) -> str:
+    """Nome da planilha ativa de um xlsx gravado (só o workbook.xml é lido)."""
+    with zipfile.ZipFile(caminho) as zf:
+        workbook_xml = zf.read("xl/workbook.xml").decode("utf-8")
+        rels_xml = zf.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+    alvo = planilha_ativa(workbook_xml, rels_xml)
+    for rel in re.findall(r'<Relationship\b[^>]*>', rels_xml):
+        destino = re.search(r'Target="([^"]+)"', rel).group(1)
+        if destino.lstrip("/") == alvo or f"xl/{destino}" == alvo:
+            rid = re.search(r'Id="([^"]+)"', rel).group(1)
+            sheet = re.search(rf'<sheet\b[^>]*r:id="{re.escape(rid)}"[^>]*>', workbook_xml).group(0)
+            return unescape(re.search(r'name="([^"]*)"', sheet).group(1))
+    raise ValueError(f"Planilha ativa não encontrada em '{os.path.basename(caminho)}'")
+
+
+class GeradorPorCapitulo:
+    """
+    Geração de orçamentos muito grandes dividida por capítulo N1.
+
+    Cada capítulo vira um workbook próprio, gerado e gravado pelo motor de forma
+    independente (um de cada vez), de modo que o pico de memória é o do maior
+    capítulo e não o do orçamento inteiro. No fim é gravado um workbook de resumo
+    cujos totais por capítulo são referências externas ao rodapé do respetivo
+    arquivo (com os valores em cache), mais a ligação para ele e o total
+    consolidado. Mesma interface de `gerar_excel_final` dos motores: o caminho
+    devolvido é o do resumo e extra_info['partes'] lista os arquivos dos capítulos.
+    """
+
+    def __init__(self, motor: OrcamentoEngine):
+        self.motor = motor
+
+    @staticmethod
+    def precisa_dividir(linhas: List[Dict[str, Any]], info: Dict[str, Any], mapa_colunas: Optional[Dict[str, str]] = None) -> bool:
+        """True se o orçamento passa do limite de linhas (info['dividir_linhas']) ou de bytes estimados (info['dividir_bytes'])."""
+        max_linhas = int(info.get('dividir_linhas', LIMITE_LINHAS) or 0)
+        max_bytes = int(info.get('dividir_bytes', LIMITE_BYTES) or 0)
+        if max_linhas and len(linhas) > max_linhas:
+            return True
+        if max_bytes:
+            colunas = list((mapa_colunas or {}).values())
+            estimado = 0
+            for row in linhas:
+                valores = [row.get(c) for c in colunas] if colunas else list(row.values())
+                estimado += sum(len(str(v)) for v in valores if v is not None) + _BYTES_POR_CELULA * len(valores)
+                if estimado > max_bytes:
+                    return True
+        return False
+
+    @staticmethod
+    def capitulos(linhas: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Linhas agrupadas por título N1 (o que vier antes do primeiro N1 fica no primeiro capítulo)."""
+        partes: List[List[Dict[str, Any]]] = [[]]
+        tem_titulo = False
+        for row in linhas:
+            if row.get("_NIVEL_FORCADO") == "N1":
+                if tem_titulo:
+                    partes.append([])
+                tem_titulo = True
+            partes[-1].append(row)
+        return [p for p in partes if p]
+
+    def gerar_excel_final(self, linhas_aprovadas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any], progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[bool, str, Dict[str, Any]]:
+        nome = info.get('nome_arquivo', 'Orcamento')
+        partes = self.capitulos(linhas_aprovadas)
+        total_linhas = max(1, len(linhas_aprovadas))
+        Logger.info(f"Orçamento dividido em {len(partes)} capítulo(s) ({len(linhas_aprovadas)} linhas)")
+
+        resumo: List[Dict[str, Any]] = []
+        feitas = 0
+        # Tempos somados dos capítulos; o resumo conta como gravação
+        cron = CronometroFases()
+        mesclagens = 0
+        for i, parte in enumerate(partes, start=1):
+            def progresso_parte(pct, base=feitas, tamanho=len(parte)):
+                if progress_callback:
+                    progress_callback(int((base + tamanho * pct / 100) / total_linhas * 100))
+
+            info_parte = {**info, 'nome_arquivo': f"{nome}_CAP{i:02d}"}
+            ok, msg, extra_info = self.motor.gerar_excel_final(parte, modelo_path, mapa_colunas, info_parte, progresso_parte)
+            # O workbook do capítulo já está gravado: não fica preso até ao próximo
+            self.motor.wb_out = self.motor.ws_out = None
+            if not ok:
+                return False, f"Capítulo {i}: {msg}", {}
+            for fase, segundos in extra_info.get('tempos', {}).get('fases', {}).items():
+                cron.adicionar(fase, segundos)
+            mesclagens += extra_info.get('tempos', {}).get('mesclagens', 0)
+            titulo = next((r for r in parte if r.get("_NIVEL_FORCADO") == "N1"), parte[0])
+            resumo.append({
+                'item': titulo.get(mapa_colunas.get("ITEM", "ITEM"), i),
+                'descricao': titulo.get(mapa_colunas.get("DESCRICAO", "DESCRICAO"), ''),
+                'linhas': len(parte),
+                'arquivo': msg,
+                'totais': extra_info.get('totais', {}),
+                # Onde estão os totais no arquivo do capítulo: o resumo referencia-os
+                'planilha': nome_planilha_ativa(msg),
+                'rodape': list(self.motor.linhas_rodape),
+            })
+            feitas += len(parte)
+
+        # Só a soma dos itens é somada entre capítulos; BDI e desconto são arredondados
+        # sobre o total, como no rodapé do orçamento inteiro
+        bdi, fator_desconto = float(info.get("bdi", 0.0)), self.motor._fator_desconto(info)
+        totais = totais_rodape(round(sum(p['totais'].get('total_sem_bdi', 0.0) for p in resumo), 2), bdi, fator_desconto)
+
+        inicio = time.perf_counter()
+        with cron.fase("gravacao"), SaidaAtomica(self.motor.output_dir, f"{nome}_RESUMO") as saida:
+            self._escrever_resumo(saida.temporario, nome, resumo, totais, bdi, fator_desconto, info)
+            save_path = saida.concluir()
+        Logger.info(f"✅ Resumo por capítulo: {save_path} ({time.perf_counter() - inicio:.2f}s)")
+
+        return True, save_path, {'valor_total': totais['total_geral'], 'totais': totais,
+                                 'partes': [p['arquivo'] for p in resumo],
+                                 'tempos': cron.relatorio(linhas=len(linhas_aprovadas), mesclagens=mesclagens)}
+
+    def _escrever_resumo(self, caminho: str, nome: str, resumo: List[Dict[str, Any]], totais: Dict[str, float],
+                         bdi: float, fator_desconto: float, info: Dict[str, Any]) -> None:
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "RESUMO"
+        negrito = Font(name="Arial", bold=True, size=10)
+
+        ws["A1"] = f"RESUMO POR CAPÍTULO - {nome}"
+        ws["A1"].font = Font(name="Arial", bold=True, size=12)
+        cabecalho = ["Item", "Capítulo", "Linhas", "Total sem BDI", "Total do BDI", "Total Geral",
+                     "Desconto", "Total com Desconto", "Arquivo"]
+        for col, texto in enumerate(cabecalho, start=1):
+            cell = ws.cell(3, col, texto)
+            cell.font = negrito
+            cell.alignment = Alignment(horizontal="center")
+
+        # Totais de cada capítulo: referências externas às linhas do rodapé do arquivo do
+        # capítulo (recalculadas pelo Excel se o capítulo mudar), com os valores já em cache
+        valores: Dict[str, float] = {}
+        row = 4
+        for n, parte in enumerate(resumo, start=1):
+            ws.cell(row, 1, parte['item'])
+            ws.cell(row, 2, parte['descricao'])
+            ws.cell(row, 3, parte['linhas'])
+            wb._external_links.append(self._ligacao_externa(parte))
+            planilha = parte['planilha'].replace("'", "''")
+            for col, (chave, linha_rodape) in enumerate(zip(NOMES_TOTAIS, parte['rodape']), start=4):
+                cell = ws.cell(row, col, f"='[{n}]{planilha}'!$H${linha_rodape}")
+                cell.number_format = self.motor.FMT_CONTABIL
+                valores[f"{get_column_letter(col)}{row}"] = parte['totais'].get(chave, 0.0)
+            arquivo = os.path.basename(parte['arquivo'])
+            link = ws.cell(row, 9, arquivo)
+            link.hyperlink = arquivo  # mesma pasta do resumo
+            link.style = "Hyperlink"
+            row += 1
+
+        # Linha de total consolidado: as fórmulas do rodapé (_formulas_rodape) sobre a soma
+        # dos totais sem BDI dos capítulos, com o valor já em cache
+        formulas = [f"=SUM(D4:D{row - 1})", f"=ROUNDDOWN(D{row}*{bdi}, 2)", f"=D{row}+E{row}",
+                    f"=ROUNDDOWN(F{row}*{fator_desconto}, 2)", f"=F{row}-G{row}"]
+        ws.cell(row, 1, "TOTAL").font = negrito
+        for col, (chave, formula) in enumerate(zip(NOMES_TOTAIS, formulas), start=4):
+            letra = get_column_letter(col)
+            cell = ws.cell(row, col, formula)
+            cell.number_format = self.motor.FMT_CONTABIL
+            cell.font = negrito
+            valores[f"{letra}{row}"] = totais[chave]
+
+        for letra, largura in zip("ABCDEFGHI", [10, 60, 10, 18, 18, 18, 18, 20, 40]):
+            ws.column_dimensions[letra].width = largura
+        salvar_com_valores(wb, caminho, valores, nivel_compressao(info.get('perfil_gravacao')))
+
+    @staticmethod
+    def _ligacao_externa(parte: Dict[str, Any]) -> ExternalLink:
+        """Parte xl/externalLinks do arquivo de um capítulo (mesma pasta do resumo), com os totais em cache."""
+        celulas = [ExternalRow(r=r, cell=[ExternalCell(r=f"H{r}", v=repr(float(parte['totais'].get(chave, 0.0))))])
+                   for chave, r in zip(NOMES_TOTAIS, parte['rodape'])]
+        livro = ExternalBook(sheetNames=ExternalSheetNames([parte['planilha']]),
+                             sheetDataSet=ExternalSheetDataSet([ExternalSheetData(sheetId=0, row=celulas)]), id="rId1")
+        link = ExternalLink(externalBook=livro)
+        link.file_link = Relationship(type="externalLinkPath", Target=os.path.basename(parte['arquivo']),
+                                      TargetMode="External", Id="rId1")
+        return link
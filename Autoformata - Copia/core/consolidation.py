@@ -0,0 +1,311 @@
+import os
+import re
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Tuple, Any, Callable, Iterable, Iterator
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from utils.logger import Logger
+from core.excel_handler import OrcamentoEngine
+from core.style_cache import StyleCache
+from core.atomic_output import SaidaAtomica
+from core.formula_eval import salvar_com_valores, NOMES_TOTAIS
+
+# Mesmo formato contábil que o motor usa na coluna H
+_FMT_CONTABIL = '_("R$"* #,##0.00_);_("R$"* (#,##0.00);_("R$"* "-"??_);_(@_)'
+_FILL_N1 = StyleCache.PALETA["N1"]["bg"]
+# Resumo de um orçamento dividido por capítulo (budget_split): conta como um só orçamento
+_RE_RESUMO_DIVIDIDO = re.compile(r"_RESUMO(_v\d+)?\.xlsx$", re.I)
+# Temporários do controller (sintético limpo/desbloqueado) gravados na mesma pasta
+_PREFIXOS_IGNORADOS = ("~", "CONSOLIDADO", "temp_")
+
+
+@dataclass
+class ResumoOrcamento:
+    """O que a consolidação extrai de um orçamento gerado."""
+    arquivo: str
+    cabecalho: Dict[str, str] = field(default_factory=dict)  # chave do info -> valor preenchido
+    capitulos: List[Tuple[Any, Any, Optional[float]]] = field(default_factory=list)  # (item, descrição, subtotal) dos N1
+    totais: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+class _Marcador(dict):
+    def get(self, chave, padrao=None):
+        return f"\x00{chave}\x00"
+
+
+def _padroes_cabecalho() -> List[Tuple[str, "re.Pattern"]]:
+    """
+    Expressões que reconhecem os campos do cabeçalho no texto das células,
+    derivadas dos próprios textos que o motor escreve (_campos_cabecalho):
+    "CAMPUS: {campus}" vira ^CAMPUS: (.*)$. Campos sem rótulo ficam de fora.
+    """
+    padroes = []
+    for _, texto, _ in OrcamentoEngine._campos_cabecalho(_Marcador()):
+        m = re.search(r"\x00(\w+)\x00", texto)
+        if m is None or m.start() == 0:
+            continue
+        prefixo, sufixo = texto[:m.start()].strip(), texto[m.end():].strip()
+        padroes.append((m.group(1), re.compile(rf"^{re.escape(prefixo)}\s*(.*?)\s*{re.escape(sufixo)}$", re.S)))
+    # Rótulos mais longos primeiro ("DATA DE EMISSÃO:" antes de um eventual "DATA:")
+    return sorted(padroes, key=lambda p: -len(p[1].pattern))
+
+
+_PADROES = _padroes_cabecalho()
+
+
+def ler_resumo(caminho: str, so_cabecalho: bool = False) -> Optional[ResumoOrcamento]:
+    """
+    Lê um orçamento gerado em modo read-only (linha a linha, valores em cache):
+    campos do cabeçalho, subtotais dos títulos N1 e as 5 linhas de totais do
+    rodapé. Devolve None se o arquivo não tiver a forma de um orçamento. O
+    resumo de um orçamento dividido é lido com ler_resumo_dividido.
+    """
+    if _RE_RESUMO_DIVIDIDO.search(caminho):
+        return ler_resumo_dividido(caminho)
+    try:
+        wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    except Exception as e:
+        Logger.warning(f"Consolidação: '{os.path.basename(caminho)}' ignorado ({e})")
+        return None
+
+    resumo = ResumoOrcamento(os.path.abspath(caminho))
+    fase = "cabecalho"
+    try:
+        for row in wb.active.iter_rows(max_col=8):
+            valores = [c.value for c in row] + [None] * (8 - len(row))
+            if fase == "cabecalho":
+                for valor in valores:
+                    if isinstance(valor, str):
+                        _ler_campo(valor.strip(), resumo.cabecalho)
+                desc = str(valores[3] or "").upper()
+                if 'DESCRIÇÃO' in desc or 'DISCRIMINAÇÃO' in desc:
+                    fase = "dados"
+                    if so_cabecalho:
+                        break
+            elif fase == "dados":
+                if str(valores[0] or "").strip().upper().startswith("TOTAL"):
+                    fase = "rodape"
+                elif valores[4] in (None, "") and _e_titulo_n1(row):
+                    resumo.capitulos.append((valores[0], valores[3], _numero(valores[7])))
+            if fase == "rodape":
+                resumo.totais[NOMES_TOTAIS[len(resumo.totais)]] = _numero(valores[7])
+                if len(resumo.totais) == len(NOMES_TOTAIS):
+                    break
+    finally:
+        wb.close()
+
+    if fase == "cabecalho":
+        return None
+    return resumo
+
+
+def partes_do_resumo(caminho: str) -> List[str]:
+    """Arquivos dos capítulos ligados no resumo de um orçamento dividido (coluna "Arquivo"), na ordem."""
+    try:
+        wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    except Exception:
+        return []
+    partes = []
+    try:
+        for valores in wb.active.iter_rows(min_row=4, max_col=9, values_only=True):
+            if str(valores[0] or "").strip().upper() == "TOTAL":
+                break
+            if len(valores) >= 9 and valores[8]:
+                partes.append(str(valores[8]))
+    finally:
+        wb.close()
+    return partes
+
+
+def ler_resumo_dividido(caminho: str) -> Optional[ResumoOrcamento]:
+    """
+    Orçamento dividido por capítulo lido pelo seu resumo: cada linha é um
+    capítulo (subtotal = total sem BDI) e a linha TOTAL dá os 5 totais; o
+    cabeçalho vem do primeiro capítulo, que o motor gerou com o mesmo info.
+    """
+    try:
+        wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    except Exception as e:
+        Logger.warning(f"Consolidação: '{os.path.basename(caminho)}' ignorado ({e})")
+        return None
+
+    resumo = ResumoOrcamento(os.path.abspath(caminho))
+    partes = []
+    try:
+        for valores in wb.active.iter_rows(min_row=4, max_col=9, values_only=True):
+            valores = list(valores) + [None] * (9 - len(valores))
+            if str(valores[0] or "").strip().upper() == "TOTAL":
+                resumo.totais = {k: _numero(v) for k, v in zip(NOMES_TOTAIS, valores[3:8])}
+                break
+            resumo.capitulos.append((valores[0], valores[1], _numero(valores[3])))
+            if valores[8]:
+                partes.append(str(valores[8]))
+    finally:
+        wb.close()
+
+    if not resumo.totais:
+        return None
+    primeira = os.path.join(os.path.dirname(caminho), partes[0]) if partes else None
+    if primeira and os.path.exists(primeira):
+        cabecalho = ler_resumo(primeira, so_cabecalho=True)
+        if cabecalho is not None:
+            resumo.cabecalho = cabecalho.cabecalho
+    return resumo
+
+
+def _ler_campo(texto: str, cabecalho: Dict[str, str]) -> None:
+    for chave, padrao in _PADROES:
+        m = padrao.match(texto)
+        if m:
+            cabecalho.setdefault(chave, m.group(1))
+            return
+
+
+def _e_titulo_n1(row) -> bool:
+    fill = getattr(row[0], "fill", None) if row else None
+    rgb = getattr(getattr(fill, "fgColor", None), "rgb", None)
+    return isinstance(rgb, str) and rgb.upper().endswith(_FILL_N1)
+
+
+def _numero(valor: Any) -> Optional[float]:
+    return float(valor) if isinstance(valor, (int, float)) and not isinstance(valor, bool) else None
+
+
+class Consolidador:
+    """
+    Resumo de muitos orçamentos gerados (por campus, por mês...) num só workbook.
+
+    Os arquivos são lidos em paralelo (um processo por núcleo, leitura
+    read-only) e o resumo é escrito num workbook write_only à medida que os
+    resultados chegam, por ordem. Só uma janela de leituras fica pendente de
+    cada vez: a memória não cresce com o número de arquivos consolidados.
+    """
+
+    CAMPOS_CABECALHO = [("campus", "Campus"), ("setor", "Setor"), ("servidor", "Servidor"),
+                        ("num_orcamento", "Nº"), ("processo", "Processo"), ("data", "Data")]
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    @staticmethod
+    def arquivos(pasta: str) -> List[str]:
+        """
+        Orçamentos .xlsx da pasta (sem temporários, arquivos abertos no Excel nem
+        consolidações). Um orçamento dividido por capítulo entra uma vez, pelo
+        seu _RESUMO: os _CAPxx ligados nele ficam de fora.
+        """
+        nomes = sorted(n for n in os.listdir(pasta)
+                       if n.lower().endswith(".xlsx") and not n.startswith(_PREFIXOS_IGNORADOS))
+        partes = set()
+        for n in nomes:
+            if _RE_RESUMO_DIVIDIDO.search(n):
+                partes.update(partes_do_resumo(os.path.join(pasta, n)))
+        return [os.path.join(pasta, n) for n in nomes if n not in partes]
+
+    def ler(self, caminhos: Iterable[str]) -> Iterator[ResumoOrcamento]:
+        """Resumos na ordem dos caminhos (arquivos que não são orçamentos ficam de fora)."""
+        caminhos = iter(caminhos)
+        janela = 2 * self.max_workers
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            pendentes = deque(pool.submit(ler_resumo, c) for _, c in zip(range(janela), caminhos))
+            while pendentes:
+                resumo = pendentes.popleft().result()
+                proximo = next(caminhos, None)
+                if proximo is not None:
+                    pendentes.append(pool.submit(ler_resumo, proximo))
+                if resumo is not None:
+                    yield resumo
+
+    def consolidar(self, caminhos: Iterable[str], pasta_saida: str = "Output", nome: str = "CONSOLIDADO", campus: Optional[str] = None, mes: Optional[str] = None, progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[str, int]:
+        """
+        Grava o resumo e devolve (caminho, número de orçamentos incluídos).
+        `campus` filtra por parte do nome do campus e `mes` ("MM/AAAA") pela data de elaboração.
+        """
+        inicio = time.perf_counter()
+        wb = openpyxl.Workbook(write_only=True)
+        ws_orc = wb.create_sheet("ORÇAMENTOS")
+        ws_cap = wb.create_sheet("CAPÍTULOS")
+        negrito = Font(name="Arial", bold=True, size=10)
+
+        def linha(ws, valores: List[Any], col_valores: Optional[int] = None, fonte: Optional[Font] = None) -> None:
+            """Acrescenta uma linha; da coluna col_valores em diante vai o formato contábil."""
+            cells = []
+            for col, valor in enumerate(valores, start=1):
+                cell = WriteOnlyCell(ws, value=valor)
+                if col_valores and col >= col_valores:
+                    cell.number_format = _FMT_CONTABIL
+                if fonte is not None:
+                    cell.font = fonte
+                cells.append(cell)
+            ws.append(cells)
+
+        n_cab = len(self.CAMPOS_CABECALHO)
+        for ws, larguras in ((ws_orc, [40] + [18] * (n_cab + len(NOMES_TOTAIS))), (ws_cap, [40, 10, 60, 18])):
+            for col, largura in enumerate(larguras, start=1):
+                ws.column_dimensions[get_column_letter(col)].width = largura
+        linha(ws_orc, ["Arquivo"] + [t for _, t in self.CAMPOS_CABECALHO] +
+              ["Total sem BDI", "Total do BDI", "Total Geral", "Desconto", "Total com Desconto"], fonte=negrito)
+        linha(ws_cap, ["Arquivo", "Item", "Capítulo", "Subtotal"], fonte=negrito)
+
+        somas = dict.fromkeys(NOMES_TOTAIS, 0.0)
+        incluidos = 0
+        for resumo in self.ler(caminhos):
+            cab = resumo.cabecalho
+            if campus and campus.upper() not in cab.get("campus", "").upper():
+                continue
+            if mes and not cab.get("data", "").endswith(mes):
+                continue
+            arquivo = os.path.basename(resumo.arquivo)
+            linha(ws_orc, [arquivo] + [cab.get(k, "") for k, _ in self.CAMPOS_CABECALHO] +
+                  [resumo.totais.get(k) for k in NOMES_TOTAIS], n_cab + 2)
+            for item, descricao, subtotal in resumo.capitulos:
+                linha(ws_cap, [arquivo, item, descricao, subtotal], 4)
+            for k in NOMES_TOTAIS:
+                somas[k] += resumo.totais.get(k) or 0.0
+            incluidos += 1
+            if progress_callback:
+                progress_callback(incluidos)
+
+        # Total geral: fórmulas sobre a coluna, com o valor já em cache
+        ultima = incluidos + 1
+        valores: Dict[str, float] = {}
+        totais_linha = []
+        for i, k in enumerate(NOMES_TOTAIS):
+            letra = get_column_letter(n_cab + 2 + i)
+            totais_linha.append(f"=SUM({letra}2:{letra}{ultima})")
+            valores[f"{letra}{ultima + 1}"] = round(somas[k], 2)
+        linha(ws_orc, ["TOTAL"] + [""] * n_cab + totais_linha, n_cab + 2, negrito)
+
+        with SaidaAtomica(pasta_saida, nome) as saida:
+            salvar_com_valores(wb, saida.temporario, valores)
+            caminho = saida.concluir()
+        Logger.info(f"✅ Consolidação: {incluidos} orçamento(s) em {caminho} ({time.perf_counter() - inicio:.2f}s)")
+        return caminho, incluidos
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Consolida os orçamentos gerados num só workbook.")
+    parser.add_argument("pasta", nargs="?", default="Output", help="pasta com os orçamentos (.xlsx)")
+    parser.add_argument("--campus", help="só orçamentos deste campus")
+    parser.add_argument("--mes", help="só orçamentos elaborados neste mês (MM/AAAA)")
+    parser.add_argument("--nome", default="CONSOLIDADO", help="nome do arquivo de resumo")
+    parser.add_argument("--workers", type=int, help="processos de leitura (padrão: núcleos)")
+    args = parser.parse_args(argv)
+
+    consolidador = Consolidador(args.workers)
+    caminho, n = consolidador.consolidar(Consolidador.arquivos(args.pasta), args.pasta, args.nome, args.campus, args.mes)
+    print(f"{n} orçamento(s) consolidados em {caminho}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import csv
+import json
+import math
+import tempfile
+from typing import Optional, Dict, List, Any, Iterable, Iterator
+
+# Parquet é opcional: sem o pyarrow ficam CSV e JSON Lines
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+from core.exceptions import ExcelProcessError
+
+CAMPOS = ["nivel", "item", "codigo", "banco", "descricao", "unidade", "quantidade", "preco_unitario", "total"]
+EXTENSOES = {"CSV": ".csv", "JSONL": ".jsonl", "PARQUET": ".parquet"}
+# Linhas acumuladas por row group do Parquet (o resto é escrito linha a linha)
+LINHAS_POR_GRUPO = 5000
+
+
+def texto_campo(valor: Any) -> Optional[str]:
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # códigos lidos pelo pandas como 1234.0
+    texto = str(valor).strip()
+    return texto or None
+
+
+def registros_orcamento(linhas: List[Dict[str, Any]], cols: Dict[str, str], qtds: List[Optional[float]], units: List[Optional[float]], valores_h: Dict[int, float], start_row: int) -> Iterator[Dict[str, Any]]:
+    """
+    Linhas classificadas como vão para o arquivo: nível, campos de texto,
+    quantidade e preço já convertidos e o total da coluna H (valor do item
+    ou subtotal do título). Gerado sob demanda, uma linha de cada vez.
+    """
+    for i, row_data in enumerate(linhas):
+        nivel = row_data.get("_NIVEL_FORCADO", "ITEM")
+        item = nivel == "ITEM"
+        yield {
+            "nivel": nivel,
+            "item": texto_campo(row_data.get(cols["ITEM"])),
+            "codigo": texto_campo(row_data.get(cols["CODIGO"])),
+            "banco": texto_campo(row_data.get(cols["BANCO"])),
+            "descricao": texto_campo(row_data.get(cols["DESCRICAO"])),
+            "unidade": texto_campo(row_data.get(cols["UNID"])) if item else None,
+            "quantidade": qtds[i] if item else None,
+            "preco_unitario": units[i] if item else None,
+            "total": valores_h.get(start_row + i),
+        }
+
+
+def exportar_registros(caminho_xlsx: str, formato: str, registros: Iterable[Dict[str, Any]]) -> str:
+    """
+    Grava os registros ao lado do .xlsx (mesmo nome, extensão do formato) e
+    devolve o caminho. O arquivo é escrito num temporário da mesma pasta e só
+    no fim substitui o anterior.
+    """
+    formato = str(formato).upper()
+    if formato not in EXTENSOES:
+        raise ExcelProcessError(f"Formato de exportação desconhecido: {formato}")
+    if formato == "PARQUET" and not HAS_PYARROW:
+        raise ExcelProcessError("Exportação Parquet requer o pacote pyarrow.")
+
+    destino = os.path.splitext(caminho_xlsx)[0] + EXTENSOES[formato]
+    fd, temporario = tempfile.mkstemp(prefix="~dados.", suffix=EXTENSOES[formato], dir=os.path.dirname(destino) or ".")
+    os.close(fd)
+    try:
+        if formato == "CSV":
+            with open(temporario, "w", encoding="utf-8", newline="") as f:
+                escritor = csv.DictWriter(f, fieldnames=CAMPOS)
+                escritor.writeheader()
+                for registro in registros:
+                    escritor.writerow(registro)
+        elif formato == "JSONL":
+            with open(temporario, "w", encoding="utf-8") as f:
+                for registro in registros:
+                    f.write(json.dumps(registro, ensure_ascii=False))
+                    f.write("\n")
+        else:
+            _gravar_parquet(temporario, registros)
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return destino
+
+
+def _gravar_parquet(caminho: str, registros: Iterable[Dict[str, Any]]) -> None:
+    texto = pa.string()
+    schema = pa.schema([(c, texto) for c in CAMPOS[:6]] + [(c, pa.float64()) for c in CAMPOS[6:]])
+    with pq.ParquetWriter(caminho, schema) as escritor:
+        grupo: List[Dict[str, Any]] = []
+        for registro in registros:
+            grupo.append(registro)
+            if len(grupo) >= LINHAS_POR_GRUPO:
+                escritor.write_table(pa.Table.from_pylist(grupo, schema=schema))
+                grupo.clear()
+        if grupo:
+            escritor.write_table(pa.Table.from_pylist(grupo, schema=schema))
@@ -44,24 +44,62 @@ class DatabaseManager:
                         duracao_processamento REAL
                     )
                 ''')
+                # Tempos por fase de cada geração (extra_info['tempos'])
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS fases_geracao (
+                        orcamento_id INTEGER REFERENCES orcamentos(id),
+                        fase TEXT,
+                        segundos REAL
+                    )
+                ''')
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_fases_orcamento ON fases_geracao (orcamento_id)")
+                # Bases criadas antes das contagens de linhas e mesclagens
+                colunas = {row[1] for row in cursor.execute("PRAGMA table_info(orcamentos)")}
+                for coluna in ("num_linhas", "num_mesclagens"):
+                    if coluna not in colunas:
+                        cursor.execute(f"ALTER TABLE orcamentos ADD COLUMN {coluna} INTEGER")
                 conn.commit()
         except sqlite3.Error as e:
             Logger.error(f"Erro Crítico de DB Init: {e}")
             raise PlanifyError("Falha na inicialização do Banco de Dados", e)
 
+    @staticmethod
+    def montar_registro(info: Dict[str, Any], linhas: List[Dict[str, Any]], arquivo_saida: str, duracao: float, valor_total: float = 0.0, tempos: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Monta o registo de histórico de uma geração a partir do info, das linhas aprovadas e dos tempos por fase."""
+        tempos = tempos or {}
+        return {
+            'data_geracao': info.get('data'),
+            'nome_obra': info.get('nome_arquivo'),
+            'local': f"{info.get('campus')} - {info.get('setor')}",
+            'bdi': info.get('bdi'),
+            'valor_total': valor_total,
+            'arquivo_saida': arquivo_saida,
+            'num_itens': len(linhas),
+            'num_titulos': sum(1 for x in linhas if x.get('_NIVEL_FORCADO') != 'ITEM'),
+            'duracao_processamento': round(duracao, 2),
+            'num_linhas': tempos.get('linhas', len(linhas)),
+            'num_mesclagens': tempos.get('mesclagens'),
+            'fases': tempos.get('fases', {})
+        }
+
     def inserir_orcamento(self, dados: Dict[str, Any]) -> None:
         try:
             with sqlite3.connect(self.db_name) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO orcamentos 
-                    (data_geracao, nome_obra, local, bdi, valor_total, arquivo_saida, num_itens, num_titulos, duracao_processamento)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    (data_geracao, nome_obra, local, bdi, valor_total, arquivo_saida, num_itens, num_titulos, duracao_processamento,
+                     num_linhas, num_mesclagens)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     dados.get('data_geracao'), dados.get('nome_obra'), dados.get('local'),
                     dados.get('bdi', 0.0), dados.get('valor_total', 0.0), dados.get('arquivo_saida'),
-                    dados.get('num_itens', 0), dados.get('num_titulos', 0), dados.get('duracao_processamento', 0.0)
+                    dados.get('num_itens', 0), dados.get('num_titulos', 0), dados.get('duracao_processamento', 0.0),
+                    dados.get('num_linhas'), dados.get('num_mesclagens')
                 ))
+                orcamento_id = cursor.lastrowid
+                cursor.executemany("INSERT INTO fases_geracao (orcamento_id, fase, segundos) VALUES (?, ?, ?)",
+                                   [(orcamento_id, fase, segundos) for fase, segundos in dados.get('fases', {}).items()])
                 conn.commit()
         except sqlite3.Error as e:
             Logger.error(f"Erro de Inserção de Relatório DB: {e}")
@@ -88,6 +126,33 @@ class DatabaseManager:
             Logger.error(f"Erro em DB buscar_estatisticas: {e}")
             return {'total_orcamentos': 0, 'valor_total_processado': 0.0, 'media_itens': 0.0, 'ultimo_orcamento': None}
 
+    def fases_mais_lentas(self, ultimas: int = 50) -> List[Dict[str, Any]]:
+        """
+        Relatório das fases nas últimas gerações, da mais lenta para a mais rápida
+        em média: execuções, média, máximo e fração do tempo total medido.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT fase, COUNT(*) AS execucoes, AVG(segundos) AS media, MAX(segundos) AS maximo,
+                           SUM(segundos) AS soma
+                    FROM fases_geracao
+                    WHERE orcamento_id IN (SELECT id FROM orcamentos ORDER BY id DESC LIMIT ?)
+                    GROUP BY fase
+                    ORDER BY media DESC
+                ''', (ultimas,))
+                linhas = [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            Logger.error(f"Erro em DB fases_mais_lentas: {e}")
+            return []
+
+        total = sum(l['soma'] for l in linhas) or 1.0
+        for l in linhas:
+            l['percentual'] = round(100.0 * l.pop('soma') / total, 1)
+        return linhas
+
     def buscar_orcamentos(self, limite: int = 20) -> List[Dict[str, Any]]:
         try:
             with sqlite3.connect(self.db_name) as conn:
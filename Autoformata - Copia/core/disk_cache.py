@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple, Any
+
+from utils.logger import Logger
+from core.template_cache import sha256_arquivo
+
+_META = "meta.json"
+
+
+@dataclass
+class EntradaCache:
+    chave: str
+    arquivos: Dict[str, str]  # nome lógico ("xlsx", "pdf"...) -> caminho dentro do cache
+    meta: Dict[str, Any]
+
+
+class DiskCache:
+    """
+    Cache de arquivos em disco endereçado por uma chave de conteúdo (hash hex).
+
+    Cada entrada é uma pasta <pasta>/<chave[:2]>/<chave>/ com os arquivos e um
+    meta.json que guarda o SHA-256 e o tamanho de cada um: na leitura o hash é
+    conferido e uma entrada corrompida ou mexida é descartada (conta como
+    falta). As entradas são montadas numa pasta temporária e só depois
+    renomeadas, de modo que ninguém lê uma entrada a meio.
+
+    O mtime do meta.json é o último acesso: entradas sem uso há mais de
+    `idade_maxima_s` saem, e acima de `limite_bytes` saem as menos usadas
+    recentemente (LRU).
+    """
+
+    def __init__(self, pasta: str, limite_bytes: int = 512 * 1024 * 1024, idade_maxima_s: float = 30 * 24 * 3600):
+        self.pasta = str(pasta)
+        self.limite_bytes = limite_bytes
+        self.idade_maxima_s = idade_maxima_s
+        self._lock = threading.Lock()
+
+    # ──────────────────────────────────────────────
+    #  LEITURA
+    # ──────────────────────────────────────────────
+
+    def obter(self, chave: str, verificar: bool = True) -> Optional[EntradaCache]:
+        """Entrada da chave com os arquivos conferidos (None se faltar ou não bater com o hash guardado)."""
+        pasta = self._pasta_entrada(chave)
+        meta = self._ler_meta(pasta)
+        if meta is None:
+            return None
+        arquivos = {}
+        for nome, registro in meta.get("arquivos", {}).items():
+            caminho = os.path.join(pasta, registro["arquivo"])
+            try:
+                intacto = os.path.getsize(caminho) == registro["bytes"] and \
+                    (not verificar or sha256_arquivo(caminho) == registro["sha256"])
+            except OSError:
+                intacto = False
+            if not intacto:
+                Logger.warning(f"Cache: entrada {chave[:12]} corrompida ({nome}), descartada")
+                self.remover(chave)
+                return None
+            arquivos[nome] = caminho
+        try:
+            os.utime(os.path.join(pasta, _META))  # último acesso (LRU)
+        except OSError:
+            pass
+        return EntradaCache(chave, arquivos, meta.get("meta", {}))
+
+    # ──────────────────────────────────────────────
+    #  ESCRITA
+    # ──────────────────────────────────────────────
+
+    def guardar(self, chave: str, arquivos: Dict[str, str], meta: Optional[Dict[str, Any]] = None) -> bool:
+        """Copia os arquivos (nome lógico -> caminho) para uma nova entrada. False se não foi possível."""
+        destino = self._pasta_entrada(chave)
+        try:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            temporaria = tempfile.mkdtemp(prefix="~", dir=os.path.dirname(destino))
+        except OSError as e:
+            Logger.warning(f"Cache: não foi possível guardar {chave[:12]} ({e})")
+            return False
+        try:
+            registros = {nome: self._copiar_para(temporaria, nome, caminho) for nome, caminho in arquivos.items()}
+            self._gravar_meta(temporaria, {"arquivos": registros, "meta": meta or {}, "criado": time.time()})
+            with self._lock:
+                if os.path.isdir(destino):
+                    shutil.rmtree(destino, ignore_errors=True)
+                os.replace(temporaria, destino)
+        except OSError as e:
+            Logger.warning(f"Cache: não foi possível guardar {chave[:12]} ({e})")
+            return False
+        finally:
+            shutil.rmtree(temporaria, ignore_errors=True)
+        self.expulsar()
+        return True
+
+    def acrescentar(self, chave: str, nome: str, caminho: str) -> bool:
+        """Junta um arquivo a uma entrada existente (ex.: o PDF gerado depois do xlsx)."""
+        pasta = self._pasta_entrada(chave)
+        with self._lock:
+            dados = self._ler_meta(pasta)
+            if dados is None:
+                return False
+            try:
+                dados["arquivos"][nome] = self._copiar_para(pasta, nome, caminho)
+                self._gravar_meta(pasta, dados)
+            except OSError as e:
+                Logger.warning(f"Cache: não foi possível acrescentar {nome} a {chave[:12]} ({e})")
+                return False
+        self.expulsar()
+        return True
+
+    def copiar(self, entrada: EntradaCache, nome: str, destino: str) -> str:
+        """Copia um arquivo da entrada para `destino` (substituição atómica) e devolve o destino."""
+        pasta = os.path.dirname(os.path.abspath(destino))
+        fd, temporario = tempfile.mkstemp(prefix="~cache.", dir=pasta)
+        os.close(fd)
+        try:
+            shutil.copyfile(entrada.arquivos[nome], temporario)
+            os.replace(temporario, destino)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        return destino
+
+    def remover(self, chave: str) -> None:
+        with self._lock:
+            shutil.rmtree(self._pasta_entrada(chave), ignore_errors=True)
+
+    # ──────────────────────────────────────────────
+    #  EXPULSÃO
+    # ──────────────────────────────────────────────
+
+    def expulsar(self) -> int:
+        """Aplica a idade máxima e o limite de tamanho; devolve quantas entradas saíram."""
+        entradas = self._entradas()
+        agora = time.time()
+        removidas = 0
+        total = sum(tamanho for _, _, tamanho in entradas)
+        # Mais antigas primeiro: as sem uso há muito tempo e depois as menos usadas até caber no limite
+        for chave, acesso, tamanho in sorted(entradas, key=lambda e: e[1]):
+            if agora - acesso <= self.idade_maxima_s and total <= self.limite_bytes:
+                break
+            self.remover(chave)
+            total -= tamanho
+            removidas += 1
+        if removidas:
+            Logger.info(f"Cache: {removidas} entrada(s) expulsas ({total / 1024 / 1024:.1f} MB em uso)")
+        return removidas
+
+    def tamanho(self) -> int:
+        return sum(tamanho for _, _, tamanho in self._entradas())
+
+    def _entradas(self) -> List[Tuple[str, float, int]]:
+        """(chave, último acesso, bytes) de cada entrada completa."""
+        entradas = []
+        if not os.path.isdir(self.pasta):
+            return entradas
+        for prefixo in os.scandir(self.pasta):
+            if not prefixo.is_dir():
+                continue
+            for entrada in os.scandir(prefixo.path):
+                if not entrada.is_dir() or entrada.name.startswith("~"):
+                    continue
+                try:
+                    acesso = os.stat(os.path.join(entrada.path, _META)).st_mtime
+                    tamanho = sum(f.stat().st_size for f in os.scandir(entrada.path) if f.is_file())
+                except OSError:
+                    continue
+                entradas.append((entrada.name, acesso, tamanho))
+        return entradas
+
+    # ──────────────────────────────────────────────
+    #  INTERNOS
+    # ──────────────────────────────────────────────
+
+    def _pasta_entrada(self, chave: str) -> str:
+        return os.path.join(self.pasta, chave[:2], chave)
+
+    @staticmethod
+    def _ler_meta(pasta: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(pasta, _META), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _gravar_meta(pasta: str, dados: Dict[str, Any]) -> None:
+        fd, temporario = tempfile.mkstemp(prefix="~meta.", dir=pasta)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(temporario, os.path.join(pasta, _META))
+
+    @staticmethod
+    def _copiar_para(pasta: str, nome: str, caminho: str) -> Dict[str, Any]:
+        arquivo = nome + os.path.splitext(caminho)[1]
+        destino = os.path.join(pasta, arquivo)
+        shutil.copyfile(caminho, destino)
+        return {"arquivo": arquivo, "sha256": sha256_arquivo(destino), "bytes": os.path.getsize(destino)}
@@ -1,17 +1,27 @@
-import pandas as pd
+import numpy as np
 import openpyxl
 import os
-import shutil
-import re
-import math
+import time
 from copy import copy
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl.styles import Font
+from openpyxl.styles.cell_style import StyleArray
 from openpyxl.cell.cell import MergedCell, Cell
 from openpyxl.utils import range_boundaries, get_column_letter
 from typing import Optional, Dict, List, Tuple, Any, Callable, Union
 
 from utils.logger import Logger
 from core.exceptions import ExcelProcessError, DataExtractionError, TemplateNotFoundError
+from core.merge_index import MergeIndex
+from core.style_cache import StyleCache
+from core.template_cache import TemplateCache
+from core.template_layout import LayoutTemplate, obter_layout
+from core.atomic_output import SaidaAtomica
+from core.hierarquia import ArvoreHierarquia
+from core.formula_eval import AvaliadorOrcamento, salvar_com_valores, nivel_compressao, PERFIL_PADRAO
+from core.data_export import registros_orcamento, exportar_registros
+from core.row_height import EstimadorAltura, largura_coluna_px
+from core.number_parser import converter_numero, converter_coluna, aplicar_precisao, para_lista
+from core.timings import CronometroFases
 
 class OrcamentoEngine:
     def __init__(self, config: Dict[str, Any] = None):
@@ -21,12 +31,24 @@ class OrcamentoEngine:
         
         self.wb_out: Optional[openpyxl.Workbook] = None
         self.ws_out: Optional[openpyxl.worksheet.worksheet.Worksheet] = None
-        self.wb_src: Optional[openpyxl.Workbook] = None
-        self.ws_src: Optional[openpyxl.worksheet.worksheet.Worksheet] = None
+        self.merges: Optional[MergeIndex] = None
+        self.estilos: Optional[StyleCache] = None
+        self.arvore: Optional[ArvoreHierarquia] = None
+        self.alturas: Optional[EstimadorAltura] = None
+        self.numeros: Tuple[List[Optional[float]], List[Optional[float]]] = ([], [])
+        self.valores_h: Dict[int, float] = {}  # linha -> valor calculado da coluna H
+        self.linhas_rodape: List[int] = []  # linhas das 5 fórmulas de totais do rodapé (coluna H)
+        self.layout: Optional[LayoutTemplate] = None
+        # Preparo das linhas partilhado entre motores (core.fan_out.LinhasPreparadas), se houver
+        self.preparo: Optional[Any] = None
+        # Tempos por fase da geração em curso (vão para extra_info['tempos'])
+        self.cronometro: CronometroFases = CronometroFases()
         
         self.info: Dict[str, Any] = {}
         self.mapa_colunas: Dict[str, str] = {}
         self.FMT_CONTABIL: str = '_("R$"* #,##0.00_);_("R$"* (#,##0.00);_("R$"* "-"??_);_(@_)'
+        self.FMT_NUM: str = '0.00'
+        self.FMT_MOEDA: str = '"R$ "#,##0.00'
 
     def gerar_excel_final(self, linhas_aprovadas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any], progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[bool, str, Dict[str, Any]]:
         Logger.info(">>> PLANIFY ENGINE V50: TYPED & SAFE <<<")
@@ -36,28 +58,39 @@ class OrcamentoEngine:
         if not os.path.exists(modelo_path):
             raise TemplateNotFoundError(f"Template '{modelo_path}' não foi encontrado.")
 
+        self.cronometro = cron = CronometroFases()
         try:
-            ok, save_path = self._preparar_arquivo(modelo_path)
-            if not ok: 
-                return False, save_path, {}
-            
-            self._processar_cabecalho()
-
-            start_row = self._encontrar_inicio_tabela()
-            current_row, mapa_linhas = self._processar_itens(linhas_aprovadas, start_row, progress_callback)
-            self._inserir_formulas_totais(mapa_linhas)
-            self._processar_rodape(current_row, start_row)
-            
-            try:
-                if self.wb_out:
-                    self.wb_out.save(save_path)
-            except PermissionError as e:
-                raise ExcelProcessError(f"O arquivo '{save_path}' está aberto em outro programa. Feche-o e tente novamente.", e)
+            with self._reservar_saida() as saida:
+                with cron.fase("preparo"):
+                    self._preparar_arquivo(modelo_path)
+                with cron.fase("cabecalho"):
+                    self._processar_cabecalho()
+
+                start_row = self._encontrar_inicio_tabela()
+                with cron.fase("itens"):
+                    current_row, mapa_linhas = self._processar_itens(linhas_aprovadas, start_row, progress_callback)
+                with cron.fase("formulas"):
+                    self._inserir_formulas_totais(mapa_linhas)
+                with cron.fase("rodape"):
+                    self._processar_rodape(current_row, start_row)
+                with cron.fase("formulas"):
+                    valores_h, totais = self._avaliar_formulas([m['nivel'] for m in mapa_linhas], start_row, current_row)
 
-            if self.wb_src:
-                self.wb_src.close()
+                try:
+                    with cron.fase("gravacao"):
+                        inicio_gravacao = time.perf_counter()
+                        salvar_com_valores(self.wb_out, saida.temporario, {f"H{r}": v for r, v in valores_h.items()},
+                                           nivel_compressao(self.info.get('perfil_gravacao')))
+                        save_path = saida.concluir()
+                    gravacao = self._relatorio_gravacao(save_path, inicio_gravacao)
+                except PermissionError as e:
+                    raise ExcelProcessError(f"O arquivo '{saida.caminho}' está aberto em outro programa. Feche-o e tente novamente.", e)
+
+            with cron.fase("dados"):
+                dados = self._exportar_dados(save_path, linhas_aprovadas, start_row)
+            tempos = cron.relatorio(linhas=len(linhas_aprovadas), mesclagens=len(self.ws_out.merged_cells.ranges))
             Logger.info(f"✅ Concluído: {save_path}")
-            return True, save_path, {}
+            return True, save_path, {'valor_total': totais['total_geral'], 'totais': totais, 'gravacao': gravacao, 'dados': dados, 'tempos': tempos}
 
         except ExcelProcessError as e:
             Logger.error(f"Erro ExcelProcessError: {e}")
@@ -73,82 +106,75 @@ class OrcamentoEngine:
     def _cleanup(self) -> None:
         """Limpa as referências de workbook caso dê erro para não prender arquivos."""
         try:
-            if self.wb_src: self.wb_src.close()
             if self.wb_out: self.wb_out.close()
         except:
             pass
 
-    def _preparar_arquivo(self, modelo_path: str) -> Tuple[bool, str]:
-        """Cria cópia do modelo. Retorna o sucesso e o path salvo."""
-        nome_base = self.info.get('nome_arquivo', 'Orcamento').strip()
-        nome_base = re.sub(r'[<>:"/\\|?*]', '', nome_base)
-        
-        tentativas = 0
-        save_path = ""
-        
-        while tentativas < 20:
-            sufixo = "" if tentativas == 0 else f"_v{tentativas}"
-            nome_final = f"{nome_base}{sufixo}.xlsx"
-            save_path = os.path.join(self.output_dir, nome_final)
-            
-            if os.path.exists(save_path):
-                try:
-                    with open(save_path, 'a+'): pass
-                except IOError:
-                    Logger.warning(f"Arquivo '{nome_final}' está aberto. Tentando v{tentativas+1}...")
-                    tentativas += 1
-                    continue
-            break
-        
-        if tentativas >= 20:
-            raise ExcelProcessError(f"Muitos arquivos '{nome_base}' bloqueados! Feche o aplicativo Excel.")
-        
+    def _preparar_arquivo(self, modelo_path: str) -> None:
+        """Cria a cópia de trabalho do modelo (a partir do TemplateCache), só em memória."""
         try:
-            shutil.copy(modelo_path, save_path)
-            self.wb_out = openpyxl.load_workbook(save_path)
+            # O rodapé vem do retrato guardado no layout: nenhum segundo workbook fica em memória
+            self.layout = obter_layout(modelo_path)
+            # A cópia vem vazia da linha de dados para baixo: itens e rodapé são escritos
+            # uma única vez na posição final, sem delete_rows nem deslocar linhas.
+            self.wb_out = TemplateCache.copia(modelo_path, ate_linha=self.layout.start_row)
             self.ws_out = self.wb_out.active
-            self.wb_src = openpyxl.load_workbook(modelo_path)
-            self.ws_src = self.wb_src.active
-            return True, save_path
+            self.merges = MergeIndex(self.ws_out)
+            self.estilos = StyleCache(self.wb_out)
+            self.alturas = self._criar_estimador_altura()
         except Exception as e:
             raise ExcelProcessError(f"Falha ao carregar e copiar template: {e}")
 
+    def _relatorio_gravacao(self, save_path: str, inicio: float) -> Dict[str, Any]:
+        """Perfil usado, tempo de gravação e tamanho final (vai para extra_info['gravacao'])."""
+        perfil = str(self.info.get('perfil_gravacao') or PERFIL_PADRAO).upper()
+        relatorio = {'perfil': perfil, 'segundos': round(time.perf_counter() - inicio, 3),
+                     'bytes': os.path.getsize(save_path)}
+        Logger.info(f"Gravação {perfil}: {relatorio['segundos']:.2f}s, {relatorio['bytes'] / 1024:.0f} KB")
+        return relatorio
+
+    def _reservar_saida(self) -> SaidaAtomica:
+        """Nome livre (Nome.xlsx, Nome_v1.xlsx, ...) na pasta Output, gravado de forma atómica."""
+        return SaidaAtomica(self.output_dir, self.info.get('nome_arquivo', 'Orcamento'))
+
     def _processar_cabecalho(self) -> None:
-        info = self.info
-        self._write_cell('A8', f"CAMPUS: {info.get('campus', '')}", bold=True)
-        self._write_cell('A9', f"SETOR:  {info.get('setor', '')}", bold=True)
-        self._write_cell('A10', f"SERVIDOR: {info.get('servidor', '')}", bold=True)
-        self._write_cell('A13', f"ORÇAMENTO ELABORADO POR: {info.get('elaborador', '')}", bold=True)
-        self._write_cell('A14', f"ESTAGIÁRIO: {info.get('estagiario', '')}", bold=True)
-        self._write_cell('C15', info.get('descricao_header', '').upper(), bold=False)
-        self._write_cell('A18', f"DATA DE ELABORAÇÃO DO ORÇAMENTO: {info.get('data', '')} (VALIDADE: 45 DIAS)", bold=True)
-        self._write_cell('E18', f"CÓDIGO ORÇAFASCIO:  {info.get('orcafascio', '')}", bold=True)
-        self._write_cell('E21', f"NÚMERO DO PROCESSO:  {info.get('processo', '')}", bold=True)
-        self._write_cell('D22', f"FISCAL DO SERVIÇO: {info.get('fiscal', '')}", bold=True)
-        
-        self._write_cell('C20', f"Nº {info.get('num_orcamento', '')}", bold=True)
-        self._write_cell('D20', f"DATA DE EMISSÃO: {info.get('data_emissao', '')}", bold=True)
-        self._write_cell('D21', f"DATA DE INÍCIO: {info.get('data_inicio', '')}", bold=True)
-        self._write_cell('E20', f"PRAZO: {info.get('prazo', '')}", bold=True)
-        self._write_cell('G20', f"EMPENHO: {info.get('empenho', '')}", bold=True)
+        for coord, texto, bold in self._campos_cabecalho(self.info):
+            self._write_cell(coord, texto, bold=bold)
+
+    @staticmethod
+    def _campos_cabecalho(info: Dict[str, Any]) -> List[Tuple[str, str, bool]]:
+        """Campos do cabeçalho preenchidos a partir do info: (célula, texto, negrito)."""
+        return [
+            ('A8', f"CAMPUS: {info.get('campus', '')}", True),
+            ('A9', f"SETOR:  {info.get('setor', '')}", True),
+            ('A10', f"SERVIDOR: {info.get('servidor', '')}", True),
+            ('A13', f"ORÇAMENTO ELABORADO POR: {info.get('elaborador', '')}", True),
+            ('A14', f"ESTAGIÁRIO: {info.get('estagiario', '')}", True),
+            ('C15', info.get('descricao_header', '').upper(), False),
+            ('A18', f"DATA DE ELABORAÇÃO DO ORÇAMENTO: {info.get('data', '')} (VALIDADE: 45 DIAS)", True),
+            ('E18', f"CÓDIGO ORÇAFASCIO:  {info.get('orcafascio', '')}", True),
+            ('E21', f"NÚMERO DO PROCESSO:  {info.get('processo', '')}", True),
+            ('D22', f"FISCAL DO SERVIÇO: {info.get('fiscal', '')}", True),
+
+            ('C20', f"Nº {info.get('num_orcamento', '')}", True),
+            ('D20', f"DATA DE EMISSÃO: {info.get('data_emissao', '')}", True),
+            ('D21', f"DATA DE INÍCIO: {info.get('data_inicio', '')}", True),
+            ('E20', f"PRAZO: {info.get('prazo', '')}", True),
+            ('G20', f"EMPENHO: {info.get('empenho', '')}", True),
+        ]
 
     def _encontrar_inicio_tabela(self) -> int:
-        start_row = 15
-        if not self.ws_out: return start_row
-        for r in range(1, 50):
-            val = str(self.ws_out.cell(r, 4).value).upper()
-            if 'DESCRIÇÃO' in val or 'DISCRIMINAÇÃO' in val:
-                start_row = r + 1
-                break
-        return start_row
+        """Linha inicial da tabela, já resolvida no layout compilado do template."""
+        return self.layout.start_row if self.layout else 15
 
     def _processar_itens(self, linhas_aprovadas: List[Dict[str, Any]], start_row: int, progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[int, List[Dict[str, Any]]]:
-        FMT_NUM = '0.00'
-        FMT_MOEDA = '"R$ "#,##0.00'
         calc_mode = self.info.get('calc_mode', 'EXACT')
         altura_base = self.info.get('altura_linha', 24.75)
 
-        cols = {k: self.mapa_colunas.get(k, k) for k in ["ITEM","CODIGO","BANCO","DESCRICAO","UNID","QUANT","UNIT"]}
+        cols = self._colunas_mapeadas()
+        qtds, units = self._valores_numericos(linhas_aprovadas, cols, calc_mode)
+        self.numeros = (qtds, units)
+        alturas = self._alturas_linhas(linhas_aprovadas, cols, altura_base)
         mapa_linhas_escritas: List[Dict[str, Any]] = []
         current_row = start_row
         total_linhas = len(linhas_aprovadas)
@@ -156,6 +182,7 @@ class OrcamentoEngine:
         for i, row_data in enumerate(linhas_aprovadas):
             self._limpar_mesclagem_linha(current_row)
             nivel = row_data.get("_NIVEL_FORCADO", "ITEM")
+            self._aplicar_estilo_template(current_row)
 
             self._safe_write(current_row, 1, row_data.get(cols["ITEM"], ''))
             self._safe_write(current_row, 2, row_data.get(cols["CODIGO"], ''))
@@ -164,23 +191,17 @@ class OrcamentoEngine:
 
             if nivel == "ITEM":
                 self._safe_write(current_row, 5, row_data.get(cols["UNID"], ''))
-                try:
-                    qtd_raw = self._parse_num(row_data.get(cols["QUANT"]))
-                    unit_raw = self._parse_num(row_data.get(cols["UNIT"]))
-                    qtd_final = self._aplicar_precisao(qtd_raw, calc_mode)
-                    unit_final = self._aplicar_precisao(unit_raw, calc_mode)
-                except Exception as e:
-                    raise DataExtractionError(f"Erro de extração numérica na linha excel {current_row}: {e}")
-
-                if qtd_final is not None: self._safe_write(current_row, 6, qtd_final, FMT_NUM)
-                if unit_final is not None: self._safe_write(current_row, 7, unit_final, FMT_MOEDA)
+                qtd_final, unit_final = qtds[i], units[i]
+
+                if qtd_final is not None: self._safe_write(current_row, 6, qtd_final, self.FMT_NUM)
+                if unit_final is not None: self._safe_write(current_row, 7, unit_final, self.FMT_MOEDA)
                 self._safe_write(current_row, 8, f"=ROUNDDOWN(F{current_row}*G{current_row}, 2)", self.FMT_CONTABIL)
                 mapa_linhas_escritas.append({'row': current_row, 'nivel': 'ITEM'})
             else:
                 mapa_linhas_escritas.append({'row': current_row, 'nivel': nivel})
 
             self._aplicar_estilo_hierarquico(current_row, nivel)
-            self._ajustar_altura_linha(current_row, row_data.get(cols["DESCRICAO"],''), altura_base)
+            self.ws_out.row_dimensions[current_row].height = alturas[i]
             current_row += 1
 
             if progress_callback and total_linhas > 0:
@@ -189,42 +210,121 @@ class OrcamentoEngine:
 
         return current_row, mapa_linhas_escritas
 
+    def _conteudo_linha(self, row: int, row_data: Dict[str, Any], cols: Dict[str, str], numeros: Tuple[Optional[float], Optional[float]], subtotal: Optional[Tuple[int, int]]) -> Tuple[str, Dict[int, Any], Dict[int, str], bool]:
+        """
+        O que vai em cada coluna (1-8) de uma linha da tabela: (nível, valores,
+        formatos numéricos, fonte de total na coluna H). `subtotal` é o intervalo
+        somado por um título, se tiver filhos.
+        """
+        nivel = row_data.get("_NIVEL_FORCADO", "ITEM")
+        valores: Dict[int, Any] = {
+            1: row_data.get(cols["ITEM"], ''),
+            2: row_data.get(cols["CODIGO"], ''),
+            3: row_data.get(cols["BANCO"], ''),
+            4: row_data.get(cols["DESCRICAO"], ''),
+        }
+        formatos: Dict[int, str] = {}
+        fonte_total = False
+
+        if nivel == "ITEM":
+            valores[5] = row_data.get(cols["UNID"], '')
+            qtd_final, unit_final = numeros
+            if qtd_final is not None:
+                valores[6], formatos[6] = qtd_final, self.FMT_NUM
+            if unit_final is not None:
+                valores[7], formatos[7] = unit_final, self.FMT_MOEDA
+            valores[8], formatos[8] = f"=ROUNDDOWN(F{row}*G{row}, 2)", self.FMT_CONTABIL
+        elif subtotal:
+            valores[8], formatos[8] = f"=SUBTOTAL(9, H{subtotal[0]}:H{subtotal[1]})", self.FMT_CONTABIL
+            fonte_total = True
+        return nivel, valores, formatos, fonte_total
+
+    def _colunas_mapeadas(self) -> Dict[str, str]:
+        return {k: self.mapa_colunas.get(k, k) for k in ["ITEM","CODIGO","BANCO","DESCRICAO","UNID","QUANT","UNIT"]}
+
+    def _valores_numericos(self, linhas: List[Dict[str, Any]], cols: Dict[str, str], calc_mode: str) -> Tuple[List[Optional[float]], List[Optional[float]]]:
+        """Quantidades e preços unitários de todas as linhas, convertidos de uma vez e já com a precisão do modo de cálculo."""
+        if self.preparo is not None and self.preparo.linhas is linhas:
+            return self.preparo.qtds, self.preparo.units
+        try:
+            qtds = aplicar_precisao(converter_coluna([r.get(cols["QUANT"]) for r in linhas]), calc_mode)
+            units = aplicar_precisao(converter_coluna([r.get(cols["UNIT"]) for r in linhas]), calc_mode)
+            return para_lista(qtds), para_lista(units)
+        except Exception as e:
+            raise DataExtractionError(f"Erro de extração numérica: {e}")
+
     def _processar_rodape(self, current_row: int, start_row: int) -> None:
         ultima_linha_dados = current_row - 1
         if not self.ws_out: return
-        max_row_planilha = max(self.ws_out.max_row, 200)
-        self._limpar_area_total(current_row, max_row_planilha)
-
-        target_start_row = current_row 
-        self._copiar_bloco_excel(26, 51, target_start_row)
-        
-        bdi_val = float(self.info.get("bdi", 0.0))
-        fator_desconto = 0.19 if abs(bdi_val - 0.2882) < 0.001 else 0.0601
+        # Abaixo dos itens a cópia está vazia: o bloco vai direto para a posição final
+        target_start_row = current_row
+        self._copiar_rodape(target_start_row)
 
-        r1, r2, r3, r4, r5 = [target_start_row + i for i in range(5)]
         font_bold = Font(name="Arial", bold=True, size=10)
+        formulas = self._formulas_rodape(target_start_row, start_row, ultima_linha_dados)
+        for r, formula in formulas.items():
+            self._safe_write(r, 8, formula)
 
-        self._safe_write(r1, 8, f"=SUBTOTAL(9, H{start_row}:H{ultima_linha_dados})")
-        self._safe_write(r2, 8, f"=ROUNDDOWN(H{r1}*{bdi_val}, 2)")
-        self._safe_write(r3, 8, f"=H{r1}+H{r2}")
-        self._safe_write(r4, 8, f"=ROUNDDOWN(H{r3}*{fator_desconto}, 2)") 
-        self._safe_write(r5, 8, f"=H{r3}-H{r4}")
-
-        for r in [r1, r2, r3, r4, r5]:
+        for r in formulas:
             self.ws_out.row_dimensions[r].height = 30.0
             c = self.ws_out.cell(r, 8)
             c.number_format = self.FMT_CONTABIL
             c.font = font_bold
 
+    def _formulas_rodape(self, target_start_row: int, start_row: int, ultima_linha_dados: int) -> Dict[int, str]:
+        """Fórmulas da coluna H das 5 linhas de totais do rodapé (linha -> fórmula)."""
+        bdi_val = float(self.info.get("bdi", 0.0))
+        fator_desconto = self._fator_desconto()
+
+        r1, r2, r3, r4, r5 = [target_start_row + i for i in range(5)]
+        return {
+            r1: f"=SUBTOTAL(9, H{start_row}:H{ultima_linha_dados})",
+            r2: f"=ROUNDDOWN(H{r1}*{bdi_val}, 2)",
+            r3: f"=H{r1}+H{r2}",
+            r4: f"=ROUNDDOWN(H{r3}*{fator_desconto}, 2)",
+            r5: f"=H{r3}-H{r4}",
+        }
+
+    def _fator_desconto(self, info: Optional[Dict[str, Any]] = None) -> float:
+        bdi_val = float((self.info if info is None else info).get("bdi", 0.0))
+        return 0.19 if abs(bdi_val - 0.2882) < 0.001 else 0.0601
+
+    def _avaliar_formulas(self, niveis: List[str], start_row: int, linha_rodape: int) -> Tuple[Dict[int, float], Dict[str, float]]:
+        """Valores da coluna H (itens, subtotais e rodapé) e totais do orçamento, calculados sem o Excel."""
+        qtds, units = self.numeros
+        avaliador = AvaliadorOrcamento(start_row, niveis, qtds, units)
+        if self.arvore is not None:
+            avaliador.subtotais(self.arvore)
+        linhas_rodape = sorted(self._formulas_rodape(linha_rodape, start_row, linha_rodape - 1))
+        totais = avaliador.rodape(linhas_rodape, float(self.info.get("bdi", 0.0)), self._fator_desconto())
+        self.valores_h = avaliador.valores
+        self.linhas_rodape = linhas_rodape
+        return avaliador.valores, totais
+
+    def _exportar_dados(self, save_path: str, linhas: List[Dict[str, Any]], start_row: int) -> Optional[str]:
+        """Linhas classificadas em CSV/JSONL/Parquet ao lado do .xlsx, se info['exportar_dados'] pedir."""
+        formato = self.info.get('exportar_dados')
+        if not formato:
+            return None
+        qtds, units = self.numeros
+        registros = registros_orcamento(linhas, self._colunas_mapeadas(), qtds, units, self.valores_h, start_row)
+        try:
+            caminho = exportar_registros(save_path, formato, registros)
+        except (ExcelProcessError, OSError) as e:
+            # O .xlsx já está gravado: a falha da exportação não invalida a geração
+            Logger.error(f"Erro ao exportar dados ({formato}): {e}")
+            return None
+        Logger.info(f"Dados exportados: {caminho}")
+        return caminho
+
     def _safe_write(self, row: int, col: int, value: Any, number_format: Optional[str] = None) -> None:
         if not self.ws_out: return
         try:
             cell = self.ws_out.cell(row, col)
             if isinstance(cell, MergedCell):
-                for merged in list(self.ws_out.merged_cells.ranges):
-                    if cell.coordinate in merged:
-                        self.ws_out.unmerge_cells(str(merged))
-                        break
+                merged = self.merges.encontrar(row, col)
+                if merged is not None:
+                    self.merges.desmesclar(merged)
                 cell = self.ws_out.cell(row, col)
             
             if isinstance(cell, MergedCell):
@@ -238,12 +338,11 @@ class OrcamentoEngine:
     def _write_cell(self, coord: str, text: Any, bold: bool = True) -> None:
         if not self.ws_out: return
         try:
-            cell = self.ws_out[coord]
+            cell = self.ws_out[self.layout.ancoras.get(coord, coord) if self.layout else coord]
             if isinstance(cell, MergedCell):
-                for merged in self.ws_out.merged_cells.ranges:
-                    if cell.coordinate in merged:
-                        cell = self.ws_out.cell(merged.min_row, merged.min_col)
-                        break
+                merged = self.merges.encontrar(cell.row, cell.column)
+                if merged is not None:
+                    cell = self.ws_out.cell(merged.min_row, merged.min_col)
             
             cell.value = text
             if cell.font:
@@ -255,38 +354,32 @@ class OrcamentoEngine:
 
     def _aplicar_estilo_hierarquico(self, row: int, nivel: str) -> None:
         if not self.ws_out: return
-        paleta = {
-            "N1": {"bg": "9BC2E6", "bold": True, "size": 11},
-            "N2": {"bg": "BDD7EE", "bold": True, "size": 11},
-            "N3": {"bg": "DDEBF7", "bold": True, "size": 11},
-            "ITEM": {"bg": "FFFFFF", "bold": False, "size": 10}
-        }
-        estilo = paleta.get(nivel, paleta["ITEM"])
-        fill = PatternFill("solid", fgColor=estilo["bg"])
-        font = Font(name="Arial", bold=estilo["bold"], size=estilo["size"])
-        side = Side(style="thin")
-        border = Border(left=side, right=side, top=side, bottom=side)
         for c in range(1, 9):
             try:
                 cell = self.ws_out.cell(row, c)
                 if isinstance(cell, MergedCell): continue
-                cell.fill = fill
-                cell.font = font
-                cell.border = border
-                h = "center"
-                if c == 4: h = "left"
-                if c == 8: h = "right"
-                cell.alignment = Alignment(horizontal=h, vertical="center", wrap_text=(c==4))
+                self.estilos.aplicar(cell, nivel, c)
             except: 
                 pass
 
-    def _ajustar_altura_linha(self, row: int, desc_txt: Any, altura_base: float) -> None:
-        if not self.ws_out: return
-        desc_txt = str(desc_txt)
-        num_chars = len(desc_txt)
-        linhas_estimadas = max(1, math.ceil(num_chars / 85))
-        altura_final = altura_base if linhas_estimadas == 1 else max(altura_base, float(linhas_estimadas * 15))
-        self.ws_out.row_dimensions[row].height = altura_final
+    def _alturas_linhas(self, linhas: List[Dict[str, Any]], cols: Dict[str, str], altura_base: float) -> List[float]:
+        """Altura de cada linha da tabela (vinda do preparo partilhado, se for para estas linhas)."""
+        def calcular() -> List[float]:
+            return [self._calcular_altura_linha(r.get(cols["DESCRICAO"], ''), altura_base, r.get("_NIVEL_FORCADO", "ITEM"))
+                    for r in linhas]
+        if self.preparo is not None and self.preparo.linhas is linhas:
+            return self.preparo.alturas((self.alturas.largura_px, altura_base), calcular)
+        return calcular()
+
+    def _calcular_altura_linha(self, desc_txt: Any, altura_base: float, nivel: str = "ITEM") -> float:
+        """Altura para a descrição quebrada na coluna D, com a fonte do nível (ver StyleCache.PALETA)."""
+        estilo = StyleCache.PALETA.get(nivel, StyleCache.PALETA["ITEM"])
+        return self.alturas.altura(desc_txt, altura_base, estilo["size"], estilo["bold"])
+
+    def _criar_estimador_altura(self) -> EstimadorAltura:
+        """Estimador com a largura real da coluna D e a fonte padrão do template."""
+        layout = self.layout
+        return EstimadorAltura(largura_coluna_px(layout.largura('D'), layout.fonte_padrao, layout.tamanho_fonte))
 
     def _aplicar_precisao(self, valor: Optional[float], modo: str) -> Optional[float]:
         if valor is None: return None
@@ -294,109 +387,61 @@ class OrcamentoEngine:
             val_float = float(valor)
         except (ValueError, TypeError): 
             return None
-            
-        if modo == "TRUNC":
-            # Truncando exatamente em 2 casas decimais, seguro matematicamente.
-            return math.floor(val_float * 100) / 100.0
-        elif modo == "ROUND": 
-            return round(val_float, 2)
-        else: 
-            return val_float
-
-    def _limpar_area_total(self, row_inicio: int, row_fim: int) -> None:
-        if not self.ws_out: return
-        for merged in list(self.ws_out.merged_cells.ranges):
-            if merged.max_row >= row_inicio:
-                try: self.ws_out.unmerge_cells(str(merged))
-                except: pass
-        rows_to_delete = row_fim - row_inicio + 1
-        if rows_to_delete > 0:
-            self.ws_out.delete_rows(row_inicio, rows_to_delete)
+        return para_lista(aplicar_precisao(np.array([val_float]), modo))[0]
+
+    def _aplicar_estilo_template(self, row: int) -> None:
+        """Estilo que a linha tinha no template (a cópia de trabalho chega sem células na área de dados)."""
+        paleta = self.layout.paleta
+        for col, estilo in self.layout.estilos_da_linha(row).items():
+            self.ws_out.cell(row, col)._style = StyleArray(paleta[estilo])
 
     def _limpar_mesclagem_linha(self, row: int) -> None:
         if not self.ws_out: return
-        for merged in list(self.ws_out.merged_cells.ranges):
-            if row >= merged.min_row and row <= merged.max_row:
-                try: self.ws_out.unmerge_cells(str(merged))
-                except: pass
+        for merged in self.merges.na_linha(row):
+            self.merges.desmesclar(merged)
 
-    def _copiar_bloco_excel(self, r_ini: int, r_fim: int, r_tgt_ini: int) -> None:
-        if not self.ws_out or not self.ws_src: return
+    def _copiar_rodape(self, r_tgt_ini: int) -> None:
+        """Escreve o bloco do rodapé a partir de r_tgt_ini (valores, estilos, alturas e mesclagens do layout)."""
+        if not self.ws_out: return
+        layout = self.layout
+        r_ini, r_fim = layout.rodape
         offset = r_tgt_ini - r_ini
         for row in range(r_ini, r_fim + 1):
-            tgt_row = row + offset
-            self.ws_out.row_dimensions[tgt_row].height = self.ws_src.row_dimensions[row].height
-            for col in range(1, self.ws_src.max_column + 1):
-                cell_src = self.ws_src.cell(row, col)
-                cell_tgt = self.ws_out.cell(tgt_row, col)
-                if isinstance(cell_tgt, MergedCell):
-                     for m in self.ws_out.merged_cells.ranges:
-                         if cell_tgt.coordinate in m: 
-                             self.ws_out.unmerge_cells(str(m))
-                             break
-                     cell_tgt = self.ws_out.cell(tgt_row, col)
-                cell_tgt.value = cell_src.value
-                if cell_src.has_style:
-                    cell_tgt.font = copy(cell_src.font)
-                    cell_tgt.border = copy(cell_src.border)
-                    cell_tgt.fill = copy(cell_src.fill)
-                    cell_tgt.number_format = cell_src.number_format
-                    cell_tgt.alignment = copy(cell_src.alignment)
-        for merged in self.ws_src.merged_cells.ranges:
-            min_c, min_r, max_c, max_r = range_boundaries(str(merged))
-            if min_r >= r_ini and max_r <= r_fim:
-                new_min_r = min_r + offset
-                new_max_r = max_r + offset
-                coord_start = f"{get_column_letter(min_c)}{new_min_r}"
-                coord_end = f"{get_column_letter(max_c)}{new_max_r}"
-                try: self.ws_out.merge_cells(f"{coord_start}:{coord_end}")
-                except ValueError: pass
+            self.ws_out.row_dimensions[row + offset].height = layout.rodape_alturas.get(row)
+        for row, col, valor, estilo in layout.rodape_celulas:
+            cell = self.ws_out.cell(row + offset, col)
+            cell.value = valor
+            if estilo is not None:
+                cell._style = StyleArray(layout.paleta[estilo])
+        for coord in layout.rodape_merges:
+            min_c, min_r, max_c, max_r = range_boundaries(coord)
+            try: self.merges.mesclar(f"{get_column_letter(min_c)}{min_r + offset}:{get_column_letter(max_c)}{max_r + offset}")
+            except ValueError: pass
 
     def _inserir_formulas_totais(self, mapa: List[Dict[str, Any]]) -> None:
         if not self.ws_out: return
         try:
-            total_rows = len(mapa)
-            peso = {"N1": 1, "N2": 2, "N3": 3, "ITEM": 4}
-            for i, atual in enumerate(mapa):
-                if atual['nivel'] == "ITEM": continue
-                row_pai = atual['row']
-                nivel_pai = peso.get(atual['nivel'], 1)
-                idx_fim = i
-                for j in range(i + 1, total_rows):
-                    prox = mapa[j]
-                    if peso.get(prox['nivel'], 4) <= nivel_pai: break
-                    idx_fim = j
-                if idx_fim > i:
-                    r_ini = mapa[i+1]['row']
-                    r_fim = mapa[idx_fim]['row']
-                    self._safe_write(row_pai, 8, f"=SUBTOTAL(9, H{r_ini}:H{r_fim})", self.FMT_CONTABIL)
-                    cell = self.ws_out.cell(row_pai, 8)
-                    if not isinstance(cell, MergedCell):
-                        cell.font = Font(bold=True)
+            self.arvore = self._arvore(mapa)
+            for no in self.arvore.titulos:
+                if no.primeira is None: continue
+                self._safe_write(no.row, 8, f"=SUBTOTAL(9, H{no.primeira}:H{no.ultima})", self.FMT_CONTABIL)
+                cell = self.ws_out.cell(no.row, 8)
+                if not isinstance(cell, MergedCell):
+                    cell.font = Font(bold=True)
         except Exception as e: 
             Logger.error(f"Erro ao inserir totais sub-hierárquicos: {e}")
 
-    def _parse_num(self, val: Any) -> Optional[float]:
-        """Conversor seguro: deteta float/int nativo do Pandas e preserva."""
-        if val is None:
-            return None
-        try:
-            if pd.isna(val):
-                return None
-        except (TypeError, ValueError):
-            pass
-            
-        if isinstance(val, (int, float)):
-            return float(val)
+    def _calcular_subtotais(self, mapa: List[Dict[str, Any]]) -> Dict[int, Tuple[int, int]]:
+        """Para cada título com filhos, o intervalo de linhas (r_ini, r_fim) que ele soma."""
+        self.arvore = self._arvore(mapa)
+        return self.arvore.intervalos()
 
-        try:
-            s = str(val).upper().replace('R$', '').strip()
-            if not s or s == 'NAN' or s == 'NONE':
-                return None
-            if ',' in s and '.' in s:
-                s = s.replace('.', '').replace(',', '.')
-            elif ',' in s:
-                s = s.replace(',', '.')
-            return float(s)
-        except (ValueError, TypeError):
-            return None
\ No newline at end of file
+    def _arvore(self, mapa: List[Dict[str, Any]]) -> ArvoreHierarquia:
+        preparo = self.preparo
+        if preparo is not None and mapa and [m['nivel'] for m in mapa] == preparo.niveis:
+            return preparo.arvore(mapa[0]['row'])
+        return ArvoreHierarquia(mapa)
+
+    def _parse_num(self, val: Any) -> Optional[float]:
+        """Conversor seguro de um valor isolado (ver core.number_parser)."""
+        return converter_numero(val)
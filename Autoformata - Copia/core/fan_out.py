@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, List, Tuple, Any, Callable
+
+from utils.logger import Logger
+from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML
+from core.hierarquia import ArvoreHierarquia
+from core.batch import ResultadoJob
+
+
+class LinhasPreparadas:
+    """
+    Trabalho sobre as linhas aprovadas que não depende do template, feito uma
+    vez e partilhado pelos motores de uma geração multi-modelo: conversão
+    numérica, níveis, árvore de subtotais (por linha inicial da tabela) e
+    alturas de linha (por largura útil da coluna D e altura base).
+
+    Os motores usam-no só para a mesma lista de linhas (comparada por identidade).
+    """
+
+    def __init__(self, motor: OrcamentoEngine, linhas: List[Dict[str, Any]]):
+        self.linhas = linhas
+        self.qtds, self.units = motor._valores_numericos(linhas, motor._colunas_mapeadas(),
+                                                         motor.info.get('calc_mode', 'EXACT'))
+        self.niveis = [d.get("_NIVEL_FORCADO", "ITEM") for d in linhas]
+        self._arvores: Dict[int, ArvoreHierarquia] = {}
+        self._alturas: Dict[Tuple[Any, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def arvore(self, start_row: int) -> ArvoreHierarquia:
+        with self._lock:
+            if start_row not in self._arvores:
+                self._arvores[start_row] = ArvoreHierarquia(
+                    [{'row': start_row + i, 'nivel': n} for i, n in enumerate(self.niveis)])
+            return self._arvores[start_row]
+
+    def alturas(self, chave: Tuple[Any, ...], calcular: Callable[[], List[float]]) -> List[float]:
+        # Sob o lock: um segundo template com a mesma coluna D espera e reaproveita
+        with self._lock:
+            if chave not in self._alturas:
+                self._alturas[chave] = calcular()
+            return self._alturas[chave]
+
+
+class GeradorMultiModelo:
+    """
+    Gera o mesmo orçamento em vários templates (ex.: PRUMO e SUP) de uma vez.
+
+    As linhas são preparadas uma única vez (LinhasPreparadas) e cada template
+    é escrito pelo seu próprio motor numa thread: o preparo é partilhado sem
+    cópia e a compressão do zip e a escrita em disco de um template correm
+    enquanto outro monta as linhas. Cada arquivo recebe o nome do template
+    como sufixo (Nome_MODELO_SUP(2025).xlsx).
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, db_manager=None):
+        self.max_workers = max_workers
+        self.db_manager = db_manager
+
+    def gerar(self, linhas_aprovadas: List[Dict[str, Any]], modelos: List[str], mapa_colunas: Dict[str, str], info: Dict[str, Any], progress_callback: Optional[Callable[[int], None]] = None) -> List[ResultadoJob]:
+        """Um ResultadoJob por template, na ordem de `modelos` (msg = caminho gerado ou erro)."""
+        if not modelos:
+            return []
+        inicio = time.perf_counter()
+        motores = [self._motor(info, mapa_colunas) for _ in modelos]
+        preparo = LinhasPreparadas(motores[0], linhas_aprovadas)
+        for motor in motores:
+            motor.preparo = preparo
+
+        nome = info.get('nome_arquivo', 'Orcamento')
+        progresso = [0] * len(modelos)
+        lock = threading.Lock()
+
+        def executar(i: int) -> ResultadoJob:
+            def progresso_modelo(pct: int) -> None:
+                if progress_callback:
+                    with lock:
+                        progresso[i] = pct
+                        total = sum(progresso) // len(modelos)
+                    progress_callback(total)
+
+            info_modelo = {**info, 'nome_arquivo': f"{nome}_{os.path.splitext(os.path.basename(modelos[i]))[0]}"}
+            t0 = time.perf_counter()
+            try:
+                ok, msg, extra_info = motores[i].gerar_excel_final(linhas_aprovadas, modelos[i], mapa_colunas, info_modelo, progresso_modelo)
+            except Exception as e:  # TemplateNotFoundError de um template não derruba os outros
+                ok, msg, extra_info = False, str(e), {}
+            resultado = ResultadoJob(i, ok, msg, round(time.perf_counter() - t0, 3), extra_info or {}, os.getpid())
+            self._registrar(info_modelo, linhas_aprovadas, resultado)
+            return resultado
+
+        resultados: List[Optional[ResultadoJob]] = [None] * len(modelos)
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(modelos)) as pool:
+            futuros = {pool.submit(executar, i): i for i in range(len(modelos))}
+            for futuro in as_completed(futuros):
+                resultados[futuros[futuro]] = futuro.result()
+
+        ok = sum(1 for r in resultados if r.ok)
+        Logger.info(f"Multi-modelo: {ok}/{len(modelos)} templates em {time.perf_counter() - inicio:.2f}s")
+        return resultados
+
+    @staticmethod
+    def _motor(info: Dict[str, Any], mapa_colunas: Dict[str, str]) -> OrcamentoEngine:
+        motor = OrcamentoEngineXML({}) if info.get("motor") == "XML" else OrcamentoEngine({})
+        motor.info = info
+        motor.mapa_colunas = mapa_colunas
+        return motor
+
+    def _registrar(self, info: Dict[str, Any], linhas: List[Dict[str, Any]], resultado: ResultadoJob) -> None:
+        if not (self.db_manager and resultado.ok):
+            return
+        try:
+            self.db_manager.inserir_orcamento(
+                self.db_manager.montar_registro(info, linhas, resultado.msg, resultado.duracao,
+                                               resultado.extra_info.get('valor_total', 0.0),
+                                               tempos=resultado.extra_info.get('tempos')))
+        except Exception as e:
+            Logger.error(f"Erro ao salvar histórico multi-modelo: {e}")
@@ -0,0 +1,138 @@
+import math
+import re
+import zipfile
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_DOWN
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+from openpyxl.writer.excel import ExcelWriter
+
+from core.hierarquia import ArvoreHierarquia
+
+# Linhas de totais do rodapé, na ordem em que aparecem (chaves de extra_info['totais'])
+NOMES_TOTAIS = ["total_sem_bdi", "total_bdi", "total_geral", "desconto", "total_com_desconto"]
+
+
+def rounddown(valor: float, casas: int = 2) -> float:
+    """ROUNDDOWN do Excel: o valor é lido com 15 algarismos significativos e truncado em direção a zero."""
+    if not math.isfinite(valor):
+        return valor
+    return float(Decimal(f"{valor:.15g}").quantize(Decimal(1).scaleb(-casas), rounding=ROUND_DOWN))
+
+
+class AvaliadorOrcamento:
+    """
+    Avalia em Python o subconjunto de fórmulas que o motor escreve na coluna H:
+
+    - ITEM:     ROUNDDOWN(F*G, 2)              (célula vazia conta como 0)
+    - Títulos:  SUBTOTAL(9, H{a}:H{b})         (ignora os SUBTOTAL aninhados: soma só itens)
+    - Rodapé:   SUBTOTAL dos itens, ROUNDDOWN(total*BDI), soma, ROUNDDOWN(geral*desconto), diferença
+
+    O resultado alimenta os valores em cache das células (lidos sem o Excel
+    recalcular) e os totais devolvidos em extra_info.
+    """
+
+    def __init__(self, start_row: int, niveis: List[str], qtds: List[Optional[float]], units: List[Optional[float]]):
+        self.start_row = start_row
+        self.valores: Dict[int, float] = {}  # linha -> valor de H
+        itens = [0.0] * len(niveis)
+        for i, nivel in enumerate(niveis):
+            if nivel == "ITEM":
+                itens[i] = rounddown((qtds[i] or 0.0) * (units[i] or 0.0))
+                self.valores[start_row + i] = itens[i]
+        # Somas acumuladas dos itens (em ordem de linha, como o Excel soma o intervalo)
+        self._acumulado = [0.0] + list(accumulate(itens))
+        self.total_itens = round(self._acumulado[-1], 2)
+
+    def soma_itens(self, r_ini: int, r_fim: int) -> float:
+        """SUBTOTAL(9, H{r_ini}:H{r_fim}) sobre a área de dados."""
+        i, j = r_ini - self.start_row, r_fim - self.start_row + 1
+        # Parcelas em centavos: o arredondamento só remove o ruído binário da soma
+        return round(self._acumulado[j] - self._acumulado[i], 2)
+
+    def subtotais(self, arvore: ArvoreHierarquia) -> None:
+        for no in arvore.titulos:
+            if no.primeira is not None:
+                self.valores[no.row] = self.soma_itens(no.primeira, no.ultima)
+
+    def rodape(self, linhas: List[int], bdi: float, fator_desconto: float) -> Dict[str, float]:
+        """Valores das 5 linhas de totais do rodapé (na ordem de _formulas_rodape)."""
+        totais = totais_rodape(self.total_itens, bdi, fator_desconto)
+        self.valores.update(zip(linhas, totais.values()))
+        return totais
+
+
+def totais_rodape(total_sem_bdi: float, bdi: float, fator_desconto: float) -> Dict[str, float]:
+    """Totais do rodapé a partir da soma dos itens, com os arredondamentos das fórmulas de _formulas_rodape."""
+    total_bdi = rounddown(total_sem_bdi * bdi)
+    total_geral = round(total_sem_bdi + total_bdi, 2)
+    desconto = rounddown(total_geral * fator_desconto)
+    total_com_desconto = round(total_geral - desconto, 2)
+    return dict(zip(NOMES_TOTAIS, [total_sem_bdi, total_bdi, total_geral, desconto, total_com_desconto]))
+
+
+# ──────────────────────────────────────────────
+#  GRAVAÇÃO COM VALORES EM CACHE (OpenPyXL)
+# ──────────────────────────────────────────────
+
+_RE_FORMULA_VAZIA = re.compile(rb'<c r="([A-Z]+\d+)"([^>]*)><f>([^<]*)</f>(?:<v\s*/>|<v></v>)')
+_BLOCO = 1 << 20
+
+# Nível do deflate por perfil de gravação: FAST para rascunhos, COMPACT para a entrega final
+PERFIS_GRAVACAO = {"FAST": 1, "BALANCED": 6, "COMPACT": 9}
+PERFIL_PADRAO = "BALANCED"
+
+
+def nivel_compressao(perfil: Optional[str]) -> int:
+    return PERFIS_GRAVACAO.get(str(perfil or PERFIL_PADRAO).upper(), PERFIS_GRAVACAO[PERFIL_PADRAO])
+
+
+class _ZipComValores(zipfile.ZipFile):
+    """
+    ZipFile usado pelo ExcelWriter do OpenPyXL que, ao gravar a planilha indicada,
+    preenche o <v> vazio das fórmulas com os valores calculados. O XML é
+    processado em blocos, sem ser carregado inteiro em memória.
+    """
+
+    def __init__(self, *args, planilha: str = "", valores: Optional[Dict[str, float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._planilha = planilha
+        self._valores = valores or {}
+
+    def write(self, filename, arcname=None, *args, **kwargs):
+        if arcname != self._planilha or not self._valores:
+            return super().write(filename, arcname, *args, **kwargs)
+        with open(filename, "rb") as origem, self.open(arcname, "w", force_zip64=True) as destino:
+            resto = b""
+            while True:
+                bloco = origem.read(_BLOCO)
+                dados = resto + bloco
+                if not bloco:
+                    destino.write(self._injetar(dados))
+                    break
+                corte = dados.rfind(b"</c>") + 4 if b"</c>" in dados else 0
+                destino.write(self._injetar(dados[:corte]))
+                resto = dados[corte:]
+
+    def _injetar(self, dados: bytes) -> bytes:
+        def trocar(m):
+            coord, attrs, formula = m.groups()
+            valor = self._valores.get(coord.decode())
+            if valor is None:
+                return m.group(0)
+            return b'<c r="%s"%s><f>%s</f><v>%s</v>' % (coord, attrs, formula, repr(float(valor)).encode())
+        return _RE_FORMULA_VAZIA.sub(trocar, dados)
+
+
+def salvar_com_valores(wb, caminho: str, valores: Dict[str, float], compresslevel: Optional[int] = None) -> None:
+    """
+    Equivalente a `wb.save(caminho)` gravando os valores em cache das fórmulas da
+    planilha ativa. `compresslevel` (1-9) troca tempo de gravação por tamanho.
+    """
+    # O ExcelWriter numera as planilhas pela posição (sheet1.xml, sheet2.xml...)
+    planilha = f"xl/worksheets/sheet{wb.worksheets.index(wb.active) + 1}.xml"
+    archive = _ZipComValores(caminho, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=compresslevel,
+                             planilha=planilha, valores=valores)
+    wb.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, archive).save()
@@ -0,0 +1,82 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# Quanto menor o peso, mais alto o nível. Títulos com nível desconhecido contam como N1.
+PESO_NIVEL = {"N1": 1, "N2": 2, "N3": 3, "ITEM": 4}
+
+
+class NoHierarquia:
+    """Título (N1/N2/N3) e o seu bloco. Os itens ficam só como números de linha."""
+
+    __slots__ = ("row", "nivel", "peso", "primeira", "ultima", "filhos", "itens")
+
+    def __init__(self, row: int, nivel: str, peso: int):
+        self.row = row
+        self.nivel = nivel
+        self.peso = peso
+        self.primeira: Optional[int] = None  # primeira linha abaixo do título que ele soma
+        self.ultima: Optional[int] = None    # última linha do bloco do título
+        self.filhos: List["NoHierarquia"] = []  # subtítulos diretos
+        self.itens: List[int] = []  # linhas de ITEM diretamente abaixo do título
+
+    def __repr__(self) -> str:
+        return f"NoHierarquia({self.nivel} row={self.row} bloco={self.primeira}..{self.ultima})"
+
+
+class ArvoreHierarquia:
+    """
+    Árvore N1 > N2 > N3 > ITEM das linhas escritas, construída numa única passagem.
+
+    Mantém uma pilha com os títulos abertos (pesos estritamente crescentes): cada
+    linha fecha os títulos de peso maior ou igual ao seu e pendura-se no título
+    que fica no topo. O bloco de um título vai da linha seguinte até à linha
+    anterior àquela que o fecha, ou até ao fim.
+    """
+
+    def __init__(self, mapa: List[Dict[str, Any]]):
+        self.raizes: List[NoHierarquia] = []
+        self.titulos: List[NoHierarquia] = []
+        self.itens_soltos: List[int] = []  # itens antes do primeiro título
+
+        pilha: List[NoHierarquia] = []
+        anterior: Optional[int] = None
+        for entrada in mapa:
+            nivel, row = entrada['nivel'], entrada['row']
+
+            if nivel == "ITEM":
+                # Um item nunca fecha títulos: só entra no bloco do título aberto
+                if pilha:
+                    pai = pilha[-1]
+                    if pai.primeira is None:
+                        pai.primeira = row
+                    pai.itens.append(row)
+                else:
+                    self.itens_soltos.append(row)
+                anterior = row
+                continue
+
+            no = NoHierarquia(row, nivel, PESO_NIVEL.get(nivel, 1))
+            while pilha and pilha[-1].peso >= no.peso:
+                self._fechar(pilha.pop(), anterior)
+
+            if pilha:
+                pai = pilha[-1]
+                if pai.primeira is None:
+                    pai.primeira = row
+                pai.filhos.append(no)
+            else:
+                self.raizes.append(no)
+            pilha.append(no)
+            self.titulos.append(no)
+            anterior = row
+
+        while pilha:
+            self._fechar(pilha.pop(), anterior)
+
+    @staticmethod
+    def _fechar(no: NoHierarquia, ultima_linha: Optional[int]) -> None:
+        if no.primeira is not None:
+            no.ultima = ultima_linha
+
+    def intervalos(self) -> Dict[int, Tuple[int, int]]:
+        """Para cada título com filhos, o intervalo de linhas (primeira, ultima) do SUBTOTAL."""
+        return {no.row: (no.primeira, no.ultima) for no in self.titulos if no.primeira is not None}
@@ -0,0 +1,309 @@
+import os
+import re
+import math
+import time
+import threading
+import zipfile
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple, Any, Callable
+
+from openpyxl.utils import range_boundaries, column_index_from_string
+
+from utils.logger import Logger
+from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML, planilha_ativa, _RE_ROW, _RE_CELL, _RE_REF, _RE_ROW_NUM
+from core.atomic_output import SaidaAtomica
+from core.template_layout import obter_layout
+from core.formula_eval import nivel_compressao
+from core.timings import CronometroFases
+from core.exceptions import ExcelProcessError
+
+# Acima desta fração de linhas alteradas a geração completa compensa
+FRACAO_MAXIMA = 0.3
+
+_RE_ABERTURA = re.compile(r'<row\b[^>]*?/?>')
+
+
+@dataclass
+class RetratoGeracao:
+    """Entradas já resolvidas de uma geração: o que o diff compara com a seguinte."""
+    caminho: str
+    assinatura: Tuple[int, int]  # (mtime_ns, tamanho) do arquivo gravado
+    modelo_sha: str
+    start_row: int
+    cabecalho: Dict[Tuple[int, int], str]  # célula de origem do campo -> texto
+    # Por linha da tabela: (nível, valores por coluna, formatos por coluna, fonte de total em H, altura, valor de H)
+    linhas: List[Tuple[str, Dict[int, Any], Dict[int, str], bool, float, Optional[float]]]
+    rodape: Dict[int, Tuple[str, Optional[float]]]  # linha -> (fórmula de H, valor)
+    totais: Dict[str, float]
+
+
+# Última geração de cada arquivo de saída (por processo): (pasta, nome_arquivo) -> retrato
+_retratos: Dict[Tuple[str, str], RetratoGeracao] = {}
+_lock = threading.Lock()
+
+
+def _assinatura(caminho: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _sem_nan(valor: Any) -> Any:
+    # NaN (células vazias lidas pelo pandas) nunca é igual a si mesmo e vira célula vazia de qualquer forma
+    return None if isinstance(valor, float) and math.isnan(valor) else valor
+
+
+class RegeneradorIncremental:
+    """
+    Regeneração que corrige o arquivo anterior em vez de o refazer do template.
+
+    Guarda, por arquivo de saída, as entradas já resolvidas da última geração
+    (textos do cabeçalho, conteúdo e altura de cada linha, fórmulas e valores
+    da coluna H). Na geração seguinte com o mesmo nome, template e número de
+    linhas, compara as novas entradas com essas e reescreve no XML da planilha
+    só as células que mudaram: campos do cabeçalho, linhas da tabela, fórmulas
+    de subtotal dos títulos afetados e totais do rodapé. As demais partes do
+    zip são copiadas como estão. Nos outros casos (primeira geração, arquivo
+    mexido fora do programa, muitas linhas alteradas...) delega no motor.
+
+    Mesma interface de `gerar_excel_final` dos motores; info['incremental'] = False
+    força a geração completa.
+    """
+
+    def __init__(self, motor: OrcamentoEngine):
+        self.motor = motor
+
+    @property
+    def output_dir(self) -> str:
+        return self.motor.output_dir
+
+    def gerar_excel_final(self, linhas_aprovadas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any], progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[bool, str, Dict[str, Any]]:
+        motor = self.motor
+        chave = (os.path.abspath(motor.output_dir), info.get('nome_arquivo', 'Orcamento'))
+        novo = None
+        cron = CronometroFases()
+        if os.path.exists(modelo_path):
+            try:
+                with cron.fase("retrato"):
+                    novo = self._retratar(linhas_aprovadas, modelo_path, mapa_colunas, info)
+            except Exception as e:
+                Logger.warning(f"Entradas não comparáveis, geração completa: {e}")
+
+        with _lock:
+            anterior = _retratos.get(chave)
+        if novo is not None and anterior is not None and info.get('incremental', True):
+            resultado = self._atualizar(anterior, novo, linhas_aprovadas, progress_callback, cron)
+            if resultado is not None:
+                with _lock:
+                    _retratos[chave] = novo
+                return resultado
+
+        ok, msg, extra_info = motor.gerar_excel_final(linhas_aprovadas, modelo_path, mapa_colunas, info, progress_callback)
+        if ok and 'tempos' in extra_info and "retrato" in cron.fases:
+            # O retrato feito para a comparação também entra no tempo da geração completa
+            tempos, retrato = extra_info['tempos'], round(cron.fases["retrato"], 4)
+            tempos['fases'] = {"retrato": retrato, **tempos['fases']}
+            tempos['total'] = round(tempos['total'] + retrato, 4)
+        with _lock:
+            if ok and novo is not None and _assinatura(msg):
+                novo.caminho, novo.assinatura = msg, _assinatura(msg)
+                _retratos[chave] = novo
+            else:
+                _retratos.pop(chave, None)
+        return ok, msg, extra_info
+
+    @staticmethod
+    def limpar() -> None:
+        with _lock:
+            _retratos.clear()
+
+    # ──────────────────────────────────────────────
+    #  ENTRADAS RESOLVIDAS
+    # ──────────────────────────────────────────────
+
+    def _retratar(self, linhas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any]) -> RetratoGeracao:
+        """O que o motor escreveria para estas entradas, célula a célula (sem gerar nada)."""
+        motor = self.motor
+        motor.info = info
+        motor.mapa_colunas = mapa_colunas
+        motor.layout = layout = obter_layout(modelo_path)
+        motor.alturas = motor._criar_estimador_altura()
+        start_row = layout.start_row
+
+        cabecalho = {}
+        for coord, texto, _ in motor._campos_cabecalho(info):
+            min_c, min_r, _, _ = range_boundaries(layout.ancoras.get(coord, coord))
+            cabecalho[(min_r, min_c)] = texto
+
+        cols = motor._colunas_mapeadas()
+        qtds, units = motor._valores_numericos(linhas, cols, info.get('calc_mode', 'EXACT'))
+        motor.numeros = (qtds, units)
+        niveis = [d.get("_NIVEL_FORCADO", "ITEM") for d in linhas]
+        subtotais = motor._calcular_subtotais([{'row': start_row + i, 'nivel': n} for i, n in enumerate(niveis)])
+        current_row = start_row + len(linhas)
+        valores_h, totais = motor._avaliar_formulas(niveis, start_row, current_row)
+
+        altura_base = info.get('altura_linha', 24.75)
+        conteudo = []
+        for i, row_data in enumerate(linhas):
+            row = start_row + i
+            nivel, valores, formatos, fonte_total = motor._conteudo_linha(row, row_data, cols, (qtds[i], units[i]), subtotais.get(row))
+            altura = motor._calcular_altura_linha(valores[4], altura_base, nivel)
+            conteudo.append((nivel, {c: _sem_nan(v) for c, v in valores.items()}, formatos, fonte_total, altura, valores_h.get(row)))
+
+        rodape = {r: (f, valores_h.get(r)) for r, f in motor._formulas_rodape(current_row, start_row, current_row - 1).items()}
+        return RetratoGeracao("", (0, 0), layout.sha256, start_row, cabecalho, conteudo, rodape, totais)
+
+    @staticmethod
+    def _motivo_completa(anterior: RetratoGeracao, novo: RetratoGeracao) -> Optional[str]:
+        if anterior.modelo_sha != novo.modelo_sha:
+            return "template diferente"
+        if len(anterior.linhas) != len(novo.linhas):
+            return "número de linhas mudou"
+        if _assinatura(anterior.caminho) != anterior.assinatura:
+            return "arquivo anterior alterado ou removido"
+        return None
+
+    # ──────────────────────────────────────────────
+    #  CORREÇÃO DO ARQUIVO
+    # ──────────────────────────────────────────────
+
+    def _atualizar(self, anterior: RetratoGeracao, novo: RetratoGeracao, linhas: List[Dict[str, Any]], progress_callback: Optional[Callable[[int], None]], cron: CronometroFases) -> Optional[Tuple[bool, str, Dict[str, Any]]]:
+        motivo = self._motivo_completa(anterior, novo)
+        alteradas = [i for i, (a, b) in enumerate(zip(anterior.linhas, novo.linhas)) if a != b]
+        if motivo is None and len(alteradas) > FRACAO_MAXIMA * max(1, len(novo.linhas)):
+            motivo = f"{len(alteradas)} linhas alteradas"
+        if motivo is not None:
+            Logger.info(f"Regeneração completa: {motivo}")
+            return None
+
+        motor = self.motor
+        inicio = time.perf_counter()
+        try:
+            with SaidaAtomica(motor.output_dir, motor.info.get('nome_arquivo', 'Orcamento')) as saida:
+                with zipfile.ZipFile(anterior.caminho) as zin:
+                    with cron.fase("correcao"):
+                        planilha = planilha_ativa(zin.read("xl/workbook.xml").decode("utf-8"),
+                                                  zin.read("xl/_rels/workbook.xml.rels").decode("utf-8"))
+                        xml = self._corrigir_planilha(zin.read(planilha).decode("utf-8"), anterior, novo, alteradas)
+                    if xml is None:
+                        Logger.info("Regeneração completa: o arquivo anterior não tem um estilo ou célula de que a correção precisa")
+                        return None
+                    nivel = nivel_compressao(motor.info.get('perfil_gravacao'))
+                    with cron.fase("gravacao"), \
+                            zipfile.ZipFile(saida.temporario, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=nivel) as zout:
+                        for item in zin.infolist():
+                            dados = xml.encode("utf-8") if item.filename == planilha else zin.read(item.filename)
+                            zout.writestr(item, dados, compresslevel=nivel)
+                with cron.fase("gravacao"):
+                    save_path = saida.concluir()
+        except (OSError, KeyError, zipfile.BadZipFile, ExcelProcessError) as e:
+            Logger.warning(f"Correção incremental falhou, geração completa: {e}")
+            return None
+
+        novo.caminho, novo.assinatura = save_path, _assinatura(save_path)
+        gravacao = motor._relatorio_gravacao(save_path, inicio)
+        # motor.numeros e motor.valores_h ficaram com as novas entradas em _retratar
+        with cron.fase("dados"):
+            dados = motor._exportar_dados(save_path, linhas, novo.start_row)
+        tempos = cron.relatorio(linhas=len(novo.linhas), mesclagens=xml.count("<mergeCell "))
+        if progress_callback:
+            progress_callback(100)
+        Logger.info(f"✅ Atualizado: {save_path} ({len(alteradas)} linha(s) reescrita(s))")
+        return True, save_path, {'valor_total': novo.totais['total_geral'], 'totais': novo.totais,
+                                 'gravacao': gravacao, 'dados': dados, 'tempos': tempos,
+                                 'incremental': {'linhas': len(alteradas)}}
+
+    def _corrigir_planilha(self, xml: str, anterior: RetratoGeracao, novo: RetratoGeracao, alteradas: List[int]) -> Optional[str]:
+        """XML da planilha com as células alteradas reescritas (None se o arquivo não tiver a forma esperada)."""
+        linhas_xml = {int(_RE_ROW_NUM.search(m.group(0)).group(1)): m for m in _RE_ROW.finditer(xml)}
+        # linha -> {coluna: (valor, valor em cache, estilo ou None para manter o da célula)}
+        celulas: Dict[int, Dict[int, Tuple[Any, Optional[float], Optional[int]]]] = {}
+        alturas: Dict[int, float] = {}
+
+        for origem, texto in novo.cabecalho.items():
+            if anterior.cabecalho.get(origem) != texto:
+                celulas.setdefault(origem[0], {})[origem[1]] = (texto, None, None)
+
+        doadoras: Dict[Tuple[Any, ...], Optional[int]] = {}
+        for i in alteradas:
+            row = novo.start_row + i
+            nivel, valores, formatos, fonte_total, altura, valor_h = novo.linhas[i]
+            alturas[row] = altura
+            for col in range(1, 9):
+                estilo = None
+                chave = self._chave_estilo(novo.linhas[i], row, col)
+                if chave != self._chave_estilo(anterior.linhas[i], row, col):
+                    # O estilo muda (título reclassificado, fórmula nova...): vem de uma célula
+                    # que já o tinha no arquivo
+                    if chave not in doadoras:
+                        doadoras[chave] = self._doadora(anterior, chave, col, linhas_xml)
+                    estilo = doadoras[chave]
+                    if estilo is None:
+                        return None
+                celulas.setdefault(row, {})[col] = (valores.get(col), valor_h if col == 8 else None, estilo)
+
+        for row, (formula, valor) in novo.rodape.items():
+            if anterior.rodape.get(row) != (formula, valor):
+                celulas.setdefault(row, {})[8] = (formula, valor, None)
+
+        if any(row not in linhas_xml for row in celulas):
+            return None
+        partes = []
+        fim = 0
+        for row in sorted(celulas):
+            m = linhas_xml[row]
+            nova = self._corrigir_linha(m.group(0), row, celulas[row], alturas.get(row))
+            if nova is None:
+                return None
+            partes.append(xml[fim:m.start()])
+            partes.append(nova)
+            fim = m.end()
+        partes.append(xml[fim:])
+        return "".join(partes)
+
+    @staticmethod
+    def _corrigir_linha(raw: str, row: int, alvos: Dict[int, Tuple[Any, Optional[float], Optional[int]]], altura: Optional[float]) -> Optional[str]:
+        abertura = _RE_ABERTURA.match(raw).group(0)
+        abertura = abertura[:-2] + ">" if abertura.endswith("/>") else abertura
+        if altura is not None:
+            if 'ht="' in abertura:
+                abertura = re.sub(r'\bht="[^"]*"', f'ht="{altura}"', abertura)
+            else:
+                abertura = abertura[:-1] + f' ht="{altura}" customHeight="1">'
+
+        atuais = {}
+        for c in _RE_CELL.findall(raw):
+            ref = _RE_REF.search(c)
+            atuais[column_index_from_string(ref.group(1))] = c
+        for col, (valor, cache, estilo) in alvos.items():
+            if estilo is None:
+                if col not in atuais:
+                    return None
+                estilo = OrcamentoEngineXML._attr_s(atuais[col])
+            atuais[col] = OrcamentoEngineXML._celula(row, col, valor, estilo, cache)
+        return abertura + "".join(atuais[c] for c in sorted(atuais)) + "</row>"
+
+    def _chave_estilo(self, conteudo: Tuple, row: int, col: int) -> Tuple[Any, ...]:
+        """O que decide o estilo da célula (ver _xf_nivel e StyleCache): coluna, estilo do template, nível, formato e fonte de total."""
+        nivel, _, formatos, fonte_total, _, _ = conteudo
+        return col, self.motor.layout.estilos_da_linha(row).get(col), nivel, formatos.get(col), fonte_total and col == 8
+
+    def _doadora(self, anterior: RetratoGeracao, chave: Tuple[Any, ...], col: int, linhas_xml: Dict[int, Any]) -> Optional[int]:
+        """Estilo (s) de uma célula da mesma coluna que no arquivo anterior já tinha o estilo pedido."""
+        for i, conteudo in enumerate(anterior.linhas):
+            row = anterior.start_row + i
+            if self._chave_estilo(conteudo, row, col) != chave:
+                continue
+            m = linhas_xml.get(row)
+            if m is None:
+                continue
+            for c in _RE_CELL.findall(m.group(0)):
+                ref = _RE_REF.search(c)
+                if column_index_from_string(ref.group(1)) == col:
+                    return OrcamentoEngineXML._attr_s(c)
+        return None
+
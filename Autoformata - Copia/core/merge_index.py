@@ -0,0 +1,94 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from openpyxl.worksheet.merge import MergedCellRange
+
+
+class MergeIndex:
+    """
+    Índice de intervalos das células mescladas de uma worksheet, chaveado por linha.
+
+    O OpenPyXL guarda as mesclagens num set e todas as consultas ("esta célula
+    está mesclada?", "qual range a contém?") varrem a coleção inteira. Aqui cada
+    linha aponta para os ranges que a cobrem, ordenados pela coluna inicial, e a
+    consulta é uma busca binária. O índice é construído uma vez ao carregar o
+    workbook e mantido em dia por `mesclar()` / `desmesclar()`.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        # linha -> [(min_col, max_col, range)] ordenado por min_col
+        self._por_linha: Dict[int, List[Tuple[int, int, MergedCellRange]]] = {}
+        self._inicios: Dict[int, List[int]] = {}
+        for merged in ws.merged_cells.ranges:
+            self._indexar(merged)
+
+    def __len__(self) -> int:
+        return len(self.ws.merged_cells.ranges)
+
+    # ──────────────────────────────────────────────
+    #  CONSULTAS
+    # ──────────────────────────────────────────────
+
+    def encontrar(self, row: int, col: int) -> Optional[MergedCellRange]:
+        """Retorna o range mesclado que contém (row, col), ou None."""
+        inicios = self._inicios.get(row)
+        if not inicios:
+            return None
+        pos = bisect_right(inicios, col) - 1
+        if pos < 0:
+            return None
+        min_c, max_c, merged = self._por_linha[row][pos]
+        return merged if min_c <= col <= max_c else None
+
+    def na_linha(self, row: int) -> List[MergedCellRange]:
+        """Ranges que cobrem a linha indicada."""
+        return [m for _, _, m in self._por_linha.get(row, ())]
+
+    # ──────────────────────────────────────────────
+    #  ALTERAÇÕES (mantêm worksheet e índice sincronizados)
+    # ──────────────────────────────────────────────
+
+    def mesclar(self, coord: str) -> MergedCellRange:
+        """Equivalente a `ws.merge_cells(coord)`, sem a varredura linear do OpenPyXL."""
+        merged = MergedCellRange(self.ws, coord)
+        existente = self.encontrar(merged.min_row, merged.min_col)
+        if existente is not None and existente.coord == merged.coord:
+            return existente
+        self.ws.merged_cells.ranges.add(merged)
+        self.ws._clean_merge_range(merged)
+        self._indexar(merged)
+        return merged
+
+    def desmesclar(self, merged: MergedCellRange) -> None:
+        """Equivalente a `ws.unmerge_cells(str(merged))` para um range já indexado."""
+        self.ws.merged_cells.ranges.discard(merged)
+        cells = merged.cells
+        next(cells)  # a célula superior esquerda mantém valor e estilo
+        for row, col in cells:
+            self.ws._cells.pop((row, col), None)
+        self._desindexar(merged)
+
+    # ──────────────────────────────────────────────
+    #  INTERNOS
+    # ──────────────────────────────────────────────
+
+    def _indexar(self, merged: MergedCellRange) -> None:
+        for row in range(merged.min_row, merged.max_row + 1):
+            inicios = self._inicios.setdefault(row, [])
+            pos = bisect_right(inicios, merged.min_col)
+            inicios.insert(pos, merged.min_col)
+            self._por_linha.setdefault(row, []).insert(pos, (merged.min_col, merged.max_col, merged))
+
+    def _desindexar(self, merged: MergedCellRange) -> None:
+        for row in range(merged.min_row, merged.max_row + 1):
+            inicios = self._inicios.get(row)
+            if not inicios:
+                continue
+            pos = bisect_left(inicios, merged.min_col)
+            if pos < len(inicios) and self._por_linha[row][pos][2].coord == merged.coord:
+                del inicios[pos]
+                del self._por_linha[row][pos]
+            if not inicios:
+                del self._por_linha[row]
+                del self._inicios[row]
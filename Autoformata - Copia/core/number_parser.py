@@ -0,0 +1,99 @@
+import math
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def converter_numero(val: Any) -> Optional[float]:
+    """Conversor seguro de um valor: preserva float/int nativo do Pandas e lê texto pt-BR ("R$ 1.500,20")."""
+    if val is None:
+        return None
+    try:
+        if pd.isna(val):
+            return None
+    except (TypeError, ValueError):
+        pass
+
+    if isinstance(val, (int, float)):
+        return float(val)
+
+    try:
+        s = str(val).upper().replace('R$', '').strip()
+        if not s or s == 'NAN' or s == 'NONE':
+            return None
+        if ',' in s and '.' in s:
+            s = s.replace('.', '').replace(',', '.')
+        elif ',' in s:
+            s = s.replace(',', '.')
+        return float(s)
+    except (ValueError, TypeError):
+        return None
+
+
+def converter_coluna(valores: Iterable[Any]) -> np.ndarray:
+    """
+    Versão vetorizada de `converter_numero` para uma coluna inteira (QUANT, UNIT).
+    Retorna um array float64 com NaN onde o valor não é numérico.
+
+    Números nativos e texto são tratados em bloco pelo Pandas; os poucos valores
+    que o caminho vetorizado não reconhece (tipos exóticos, "1e3" com vírgula,
+    etc.) passam pelo conversor escalar, para que o resultado seja sempre igual.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(list(valores), dtype=object)
+    serie = serie.reset_index(drop=True)
+    if serie.dtype != object:
+        return pd.to_numeric(serie, errors='coerce').to_numpy(dtype=np.float64)
+
+    tipos = serie.map(type)
+    eh_texto = (tipos == str).to_numpy()
+    eh_nativo = tipos.isin((float, int, bool, np.float64, np.float32, np.int64, np.int32)).to_numpy()
+
+    resultado = np.full(len(serie), np.nan)
+    if eh_nativo.any():
+        resultado[eh_nativo] = serie[eh_nativo].astype(np.float64).to_numpy()
+
+    if eh_texto.any():
+        texto = serie[eh_texto].str.upper().str.replace('R$', '', regex=False).str.strip()
+        milhar = texto.str.contains(',', regex=False) & texto.str.contains('.', regex=False)
+        texto = texto.where(~milhar, texto.str.replace('.', '', regex=False))
+        texto = texto.str.replace(',', '.', regex=False)
+        convertido = pd.to_numeric(texto, errors='coerce').to_numpy(dtype=np.float64, copy=True)
+        vazio = texto.isin(('', 'NAN', 'NONE')).to_numpy()
+        convertido[vazio] = np.nan
+        resultado[eh_texto] = convertido
+
+        # Texto que o float() do Python aceita mas o to_numeric não ("1_000", "infinity"...)
+        restantes = np.flatnonzero(eh_texto)[np.isnan(convertido) & ~vazio]
+        for i in restantes:
+            v = converter_numero(serie.iat[i])
+            resultado[i] = np.nan if v is None else v
+
+    for i in np.flatnonzero(~(eh_texto | eh_nativo)):
+        v = converter_numero(serie.iat[i])
+        resultado[i] = np.nan if v is None else v
+    return resultado
+
+
+def aplicar_precisao(valores: np.ndarray, modo: str) -> np.ndarray:
+    """TRUNC/ROUND/EXACT em 2 casas sobre o array inteiro (NaN continua NaN)."""
+    valores = np.asarray(valores, dtype=np.float64)
+    if modo == "TRUNC":
+        with np.errstate(invalid='ignore'):
+            return np.floor(valores * 100) / 100.0
+    if modo == "ROUND":
+        # np.round arredonda o produto x*100 (com erro binário); nos casos a meio
+        # caminho usa-se o round() do Python, que arredonda o valor exato.
+        escalado = valores * 100
+        resultado = np.rint(escalado) / 100
+        with np.errstate(invalid='ignore'):
+            empate = np.abs(np.abs(escalado - np.trunc(escalado)) - 0.5) < 1e-6
+        for i in np.flatnonzero(empate):
+            resultado[i] = round(float(valores[i]), 2)
+        return resultado
+    return valores.copy()
+
+
+def para_lista(valores: np.ndarray) -> List[Optional[float]]:
+    """Array -> lista de float, com None no lugar de NaN/infinito (células ficam vazias)."""
+    return [float(v) if math.isfinite(v) else None for v in valores.tolist()]
@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+from typing import Optional, Dict, List, Tuple, Any, Callable
+
+import numpy as np
+
+from utils.logger import Logger
+from core.atomic_output import SaidaAtomica
+from core.disk_cache import DiskCache
+from core.template_cache import sha256_arquivo
+from core.timings import CronometroFases
+
+# Sobe quando os motores passam a escrever outra coisa para as mesmas entradas
+VERSAO_CACHE = 1
+# Campos do info que não mudam o conteúdo do arquivo gerado
+_INFO_IGNORADA = {"nome_arquivo", "gerar_pdf", "incremental", "cache"}
+# Partes do extra_info que são da execução, não do resultado
+_EXTRA_DA_EXECUCAO = {"dados", "tempos", "incremental", "cache", "gravacao"}
+
+
+def _canonico(valor: Any) -> Any:
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return str(valor)  # datas do pandas e outros tipos: o texto é estável
+
+
+def chave_geracao(linhas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any]) -> str:
+    """
+    SHA-256 das entradas canonizadas (linhas, mapeamento, info sem o nome do
+    arquivo) e dos bytes do template: a mesma chave gera o mesmo arquivo.
+    """
+    h = hashlib.sha256()
+    h.update(f"v{VERSAO_CACHE}\0{sha256_arquivo(modelo_path)}\0".encode())
+    entradas = {"mapa": mapa_colunas, "info": {k: v for k, v in info.items() if k not in _INFO_IGNORADA}}
+    h.update(json.dumps(entradas, sort_keys=True, default=_canonico, ensure_ascii=False).encode("utf-8"))
+    for linha in linhas:
+        h.update(b"\n")
+        h.update(json.dumps(linha, sort_keys=True, default=_canonico, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+class CacheGeracao:
+    """
+    Resultado de gerações anteriores reaproveitado quando as entradas são as mesmas.
+
+    A chave é o hash do conteúdo (chave_geracao). Num acerto o xlsx guardado,
+    e a exportação de dados se houver, é copiado para o nome reservado na
+    pasta de saída, sem correr o motor. Numa falta o gerador envolvido corre e
+    o resultado fica no cache. O PDF entra na mesma entrada quando é pedido
+    (ver `pdf`). Mesma interface de `gerar_excel_final` dos motores;
+    info['cache'] = False gera de novo (e substitui a entrada).
+    """
+
+    def __init__(self, gerador: Any, cache: DiskCache):
+        self.gerador = gerador
+        self.cache = cache
+
+    @property
+    def output_dir(self) -> str:
+        return self.gerador.output_dir
+
+    def gerar_excel_final(self, linhas_aprovadas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any], progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[bool, str, Dict[str, Any]]:
+        cron = CronometroFases()
+        chave = None
+        if os.path.exists(modelo_path):
+            with cron.fase("cache"):
+                chave = chave_geracao(linhas_aprovadas, modelo_path, mapa_colunas, info)
+                entrada = self.cache.obter(chave) if info.get('cache', True) else None
+            if entrada is not None and "xlsx" in entrada.arquivos:
+                return self._restaurar(entrada, info, cron, progress_callback)
+
+        ok, msg, extra_info = self.gerador.gerar_excel_final(linhas_aprovadas, modelo_path, mapa_colunas, info, progress_callback)
+        if ok and chave is not None and 'partes' not in extra_info:
+            arquivos = {"xlsx": msg}
+            if extra_info.get('dados'):
+                arquivos["dados"] = extra_info['dados']
+            resultado = {k: v for k, v in extra_info.items() if k not in _EXTRA_DA_EXECUCAO}
+            resultado['mesclagens'] = extra_info.get('tempos', {}).get('mesclagens')
+            self.cache.guardar(chave, arquivos, {'extra_info': resultado, 'linhas': len(linhas_aprovadas)})
+            extra_info['cache'] = {'chave': chave, 'acerto': False}
+        return ok, msg, extra_info
+
+    def pdf(self, caminho_xlsx: str, extra_info: Dict[str, Any], converter: Callable[[str], Tuple[bool, str, str]]) -> Tuple[bool, str, str]:
+        """
+        PDF do arquivo gerado: copiado do cache se a entrada já o tiver, senão
+        convertido por `converter` (ex.: PDFExporter.converter_para_pdf) e guardado.
+        """
+        chave = extra_info.get('cache', {}).get('chave')
+        entrada = self.cache.obter(chave) if chave else None
+        if entrada is not None and "pdf" in entrada.arquivos:
+            destino = os.path.splitext(os.path.abspath(caminho_xlsx))[0] + ".pdf"
+            try:
+                return True, self.cache.copiar(entrada, "pdf", destino), "PDF copiado do cache"
+            except OSError as e:
+                Logger.warning(f"Cache: PDF não copiado ({e}), a converter")
+        ok, caminho_pdf, mensagem = converter(caminho_xlsx)
+        if ok and chave:
+            self.cache.acrescentar(chave, "pdf", caminho_pdf)
+        return ok, caminho_pdf, mensagem
+
+    def _restaurar(self, entrada, info: Dict[str, Any], cron: CronometroFases, progress_callback: Optional[Callable[[int], None]]) -> Tuple[bool, str, Dict[str, Any]]:
+        with cron.fase("cache"):
+            with SaidaAtomica(self.output_dir, info.get('nome_arquivo', 'Orcamento')) as saida:
+                self.cache.copiar(entrada, "xlsx", saida.temporario)
+                save_path = saida.concluir()
+            extra_info = dict(entrada.meta.get('extra_info', {}))
+            mesclagens = extra_info.pop('mesclagens', None)
+            extra_info['dados'] = None
+            if "dados" in entrada.arquivos:
+                extensao = os.path.splitext(entrada.arquivos["dados"])[1]
+                extra_info['dados'] = self.cache.copiar(entrada, "dados", os.path.splitext(save_path)[0] + extensao)
+        extra_info['cache'] = {'chave': entrada.chave, 'acerto': True}
+        extra_info['tempos'] = cron.relatorio(linhas=entrada.meta.get('linhas', 0), mesclagens=mesclagens)
+        if progress_callback:
+            progress_callback(100)
+        Logger.info(f"✅ Concluído (cache): {save_path}")
+        return True, save_path, extra_info
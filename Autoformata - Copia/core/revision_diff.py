@@ -0,0 +1,137 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Tuple, Any
+
+from utils.logger import Logger
+from core.number_parser import converter_coluna, para_lista
+from core.formula_eval import rounddown
+from core.data_export import texto_campo
+from core.sipac_reader import ler_tabela, linhas_preview
+from core.sheet_cache import CacheTabelas
+
+# Campos cujo hash decide se um item mudou entre as revisões
+CAMPOS_COMPARADOS = ("descricao", "banco", "unidade", "quantidade", "unitario")
+
+
+@dataclass
+class ItemRevisao:
+    """Uma linha do sintético numa revisão, com os campos já normalizados."""
+    item: Optional[str]
+    codigo: Optional[str]
+    descricao: Optional[str]
+    banco: Optional[str]
+    unidade: Optional[str]
+    quantidade: Optional[float]
+    unitario: Optional[float]
+    linha_excel: int
+    capitulo: Optional[str] = None
+    assinatura: int = 0
+
+    @property
+    def valor(self) -> float:
+        """Valor da linha como o motor o calcula (ROUNDDOWN(quant*unit, 2)); títulos valem 0."""
+        if self.quantidade is None or self.unitario is None:
+            return 0.0
+        return rounddown(self.quantidade * self.unitario)
+
+
+@dataclass
+class Alteracao:
+    antes: ItemRevisao
+    depois: ItemRevisao
+    campos: List[str]
+
+
+@dataclass
+class DiffRevisao:
+    adicionados: List[ItemRevisao] = field(default_factory=list)
+    removidos: List[ItemRevisao] = field(default_factory=list)
+    alterados: List[Alteracao] = field(default_factory=list)
+    capitulos: Dict[str, Tuple[float, float]] = field(default_factory=dict)  # capítulo -> (valor v1, valor v2)
+
+    @property
+    def sem_alteracoes(self) -> bool:
+        return not (self.adicionados or self.removidos or self.alterados)
+
+    def delta_capitulos(self) -> Dict[str, float]:
+        """Variação de valor por capítulo (v2 - v1), só dos capítulos que mudaram."""
+        return {cap: round(v2 - v1, 2) for cap, (v1, v2) in self.capitulos.items() if round(v2 - v1, 2) != 0}
+
+
+def itens_revisao(dados_linhas: List[Dict[str, Any]], m_unid: str, m_quant: str) -> List[ItemRevisao]:
+    """
+    Linhas da pré-visualização (sipac_reader.linhas_preview) como itens de
+    revisão. A quantidade é convertida numa só passagem; o capítulo é o
+    primeiro segmento do número do item ("2.3.1" -> "2"), herdado pelas
+    linhas sem número.
+    """
+    qtds = para_lista(converter_coluna([d['raw_row_data'].get(m_quant) for d in dados_linhas]))
+    itens = []
+    capitulo = None
+    for d, qtd in zip(dados_linhas, qtds):
+        item = texto_campo(d['item_val'])
+        if item:
+            capitulo = item.split(".")[0]
+        novo = ItemRevisao(item, texto_campo(d['cod_val']), texto_campo(d['desc_val']), texto_campo(d['banco_val']),
+                           texto_campo(d['raw_row_data'].get(m_unid)), qtd, d['unit_val'], d['index_excel'], capitulo)
+        novo.assinatura = hash(tuple(getattr(novo, c) for c in CAMPOS_COMPARADOS))
+        itens.append(novo)
+    return itens
+
+
+def _indice(itens: List[ItemRevisao]) -> Dict[Tuple[Optional[str], Optional[str], int], ItemRevisao]:
+    """Tabela de hash por (item, código, ocorrência): repetições da mesma chave casam pela ordem."""
+    indice = {}
+    ocorrencias: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+    for it in itens:
+        chave = (it.item, it.codigo)
+        n = ocorrencias.get(chave, 0)
+        ocorrencias[chave] = n + 1
+        indice[chave + (n,)] = it
+    return indice
+
+
+def comparar(itens_v1: List[ItemRevisao], itens_v2: List[ItemRevisao]) -> DiffRevisao:
+    """
+    Diferença entre duas revisões por junção de hash: cada lado vira uma
+    tabela por (item, código) e cada linha é procurada uma vez na outra. Os
+    campos só são comparados um a um quando as assinaturas diferem.
+    """
+    diff = DiffRevisao()
+    indice_v1 = _indice(itens_v1)
+    indice_v2 = _indice(itens_v2)
+
+    for chave, novo in indice_v2.items():
+        antigo = indice_v1.get(chave)
+        if antigo is None:
+            diff.adicionados.append(novo)
+        elif antigo.assinatura != novo.assinatura:
+            campos = [c for c in CAMPOS_COMPARADOS if getattr(antigo, c) != getattr(novo, c)]
+            if campos:  # colisão de hash não conta como alteração
+                diff.alterados.append(Alteracao(antigo, novo, campos))
+    diff.removidos = [it for chave, it in indice_v1.items() if chave not in indice_v2]
+
+    valores: Dict[str, List[float]] = {}
+    for lado, itens in enumerate((itens_v1, itens_v2)):
+        for it in itens:
+            valores.setdefault(it.capitulo or "", [0.0, 0.0])[lado] += it.valor
+    diff.capitulos = {cap: (round(v1, 2), round(v2, 2)) for cap, (v1, v2) in valores.items()}
+    return diff
+
+
+def comparar_arquivos(caminho_v1: str, caminho_v2: str, line_num: int, mapa_colunas: Dict[str, str], tabelas: Optional[CacheTabelas] = None) -> DiffRevisao:
+    """Lê as duas revisões com o leitor da pré-visualização e compara (mesma linha de cabeçalho e mapeamento)."""
+    inicio = time.perf_counter()
+    m = mapa_colunas
+    revisoes = []
+    for caminho in (caminho_v1, caminho_v2):
+        df = ler_tabela(caminho, line_num, tabelas)
+        linhas = linhas_preview(df, line_num, m.get("ITEM"), m.get("DESCRICAO"), m.get("CODIGO"), m.get("BANCO"), m.get("UNIT"))
+        revisoes.append(itens_revisao(linhas, m.get("UNID"), m.get("QUANT")))
+        del df
+    leitura = time.perf_counter() - inicio
+
+    diff = comparar(*revisoes)
+    Logger.info(f"Revisões: +{len(diff.adicionados)} -{len(diff.removidos)} ~{len(diff.alterados)} "
+                f"(leitura {leitura:.2f}s, comparação {time.perf_counter() - inicio - leitura:.2f}s)")
+    return diff
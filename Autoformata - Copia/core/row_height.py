@@ -0,0 +1,104 @@
+import math
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+# Larguras AFM da Helvetica (métrica idêntica à da Arial), em milésimos de em,
+# para os caracteres 32..126. Letras acentuadas usam a largura da letra base.
+_ASCII = "".join(chr(c) for c in range(32, 127))
+_LARGURAS_REGULAR = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_LARGURAS_NEGRITO = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_EXTRAS = {"º": 365, "ª": 370, "°": 400, "²": 333, "³": 333, "½": 834, "×": 584, "–": 556,
+           "—": 1000, "“": 333, "”": 333, "‘": 222, "’": 222, "•": 350, "€": 556, "µ": 556}
+_BASE_ACENTOS = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ",
+                              "aaaaaeeeeiiiiooooouuuucnAAAAAEEEEIIIIOOOOOUUUUCN")
+_LARGURAS = {
+    False: {**dict(zip(_ASCII, _LARGURAS_REGULAR)), **_EXTRAS},
+    True: {**dict(zip(_ASCII, _LARGURAS_NEGRITO)), **_EXTRAS},
+}
+_LARGURA_PADRAO = 556
+
+# Altura de linha que o Excel usa para a Arial em cada tamanho (pt)
+_ALTURA_LINHA = {8: 11.25, 9: 12.0, 10: 12.75, 11: 14.25, 12: 15.0, 14: 18.0, 16: 20.25}
+# Largura do algarismo da fonte padrão do workbook, em em (define a unidade da largura de coluna)
+_LARGURA_DIGITO = {"calibri": 0.507, "arial": 0.556}
+_MARGEM_CELULA_PX = 5
+
+
+@lru_cache(maxsize=65536)
+def _largura_palavra(palavra: str, negrito: bool) -> int:
+    tabela = _LARGURAS[negrito]
+    return sum(tabela.get(c, _LARGURA_PADRAO) for c in palavra.translate(_BASE_ACENTOS))
+
+
+@lru_cache(maxsize=65536)
+def _contar_linhas(texto: str, negrito: bool, largura_util: int) -> int:
+    """Linhas ocupadas pelo texto com quebra automática (largura em milésimos de em)."""
+    espaco = _largura_palavra(" ", negrito)
+    linhas = 0
+    for paragrafo in texto.split("\n"):
+        linhas += 1
+        atual = 0
+        for palavra in paragrafo.split(" "):
+            largura = _largura_palavra(palavra, negrito)
+            if atual and atual + espaco + largura <= largura_util:
+                atual += espaco + largura
+                continue
+            if atual:
+                linhas += 1
+            # Palavra maior que a coluna: o Excel quebra-a a meio
+            while largura > largura_util:
+                linhas += 1
+                largura -= largura_util
+            atual = largura
+    return linhas
+
+
+def largura_coluna_px(largura: float, fonte_padrao: str = "Calibri", tamanho_padrao: float = 11) -> int:
+    """Largura de coluna do Excel (em caracteres) convertida para píxeis a 96 DPI."""
+    digito = _LARGURA_DIGITO.get(fonte_padrao.lower(), _LARGURA_DIGITO["arial"])
+    mdw = max(1, round(digito * tamanho_padrao * 96 / 72))
+    return int(((256 * largura + int(128 / mdw)) / 256) * mdw)
+
+
+class EstimadorAltura:
+    """
+    Altura de linha para descrições com quebra automática, a partir das métricas
+    da fonte (Arial) e da largura real da coluna D do template.
+
+    Os resultados são memorizados por (texto, negrito, largura útil), e as
+    larguras de palavra também: descrições e palavras repetidas não custam nada.
+    """
+
+    def __init__(self, largura_px: int):
+        self.largura_px = max(1, largura_px - _MARGEM_CELULA_PX)
+        self._largura_util: Dict[Tuple[float, bool], int] = {}
+
+    def linhas(self, texto: Any, tamanho: float = 10, negrito: bool = False) -> int:
+        chave = (tamanho, negrito)
+        largura_util = self._largura_util.get(chave)
+        if largura_util is None:
+            # Largura da coluna em milésimos de em da fonte, para comparar com as tabelas AFM
+            largura_util = int(self.largura_px * 1000 / (tamanho * 96 / 72))
+            self._largura_util[chave] = largura_util
+        return _contar_linhas(str(texto), negrito, largura_util)
+
+    def altura(self, texto: Any, altura_base: float, tamanho: float = 10, negrito: bool = False) -> float:
+        linhas = self.linhas(texto, tamanho, negrito)
+        if linhas <= 1:
+            return altura_base
+        altura_linha = _ALTURA_LINHA.get(tamanho) or math.ceil(tamanho * 1.275 / 0.75) * 0.75
+        return max(altura_base, linhas * altura_linha)
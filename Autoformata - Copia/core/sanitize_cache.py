@@ -0,0 +1,52 @@
+import os
+import hashlib
+import time
+from typing import Tuple, Callable, Any
+
+from utils.logger import Logger
+from core.disk_cache import DiskCache
+from core.template_cache import sha256_arquivo
+
+# Sobe quando a reparação do sintético (ExcelSanitizer.reparar_pacote) muda de resultado
+VERSAO_SANITIZADOR = 1
+
+
+def chave_sanitizado(caminho_original: str) -> str:
+    """SHA-256 dos bytes do sintético original, com a versão do sanitizador."""
+    return hashlib.sha256(f"s{VERSAO_SANITIZADOR}\0{sha256_arquivo(caminho_original)}".encode()).hexdigest()
+
+
+class CacheSanitizados:
+    """
+    Cópias limpas de sintéticos já importados, por hash do original.
+
+    O mesmo export do SIPAC é importado várias vezes (depois de uma falha, ao
+    reabrir o programa, ao reclassificar): num acerto a cópia limpa guardada é
+    copiada para o destino e a sanitização não corre. Numa falta `sanitizar`
+    corre e o resultado entra no cache. Limite de tamanho e LRU são os do
+    DiskCache envolvido.
+    """
+
+    def __init__(self, cache: DiskCache):
+        self.cache = cache
+
+    def limpar(self, caminho_original: str, caminho_limpo: str, sanitizar: Callable[[str, str], Any]) -> Tuple[str, bool]:
+        """
+        Deixa em `caminho_limpo` a cópia limpa de `caminho_original`.
+        `sanitizar(original, limpo)` só é chamado numa falta e os seus erros
+        propagam-se. Devolve (chave, acerto).
+        """
+        inicio = time.perf_counter()
+        chave = chave_sanitizado(caminho_original)
+        entrada = self.cache.obter(chave)
+        if entrada is not None and "xlsx" in entrada.arquivos:
+            try:
+                self.cache.copiar(entrada, "xlsx", caminho_limpo)
+                Logger.info(f"Sintético limpo do cache em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+                return chave, True
+            except OSError as e:
+                Logger.warning(f"Cache: sintético limpo não copiado ({e}), a sanitizar de novo")
+
+        sanitizar(caminho_original, caminho_limpo)
+        self.cache.guardar(chave, {"xlsx": caminho_limpo}, {"original": os.path.basename(caminho_original)})
+        return chave, False
@@ -1,9 +1,26 @@
 import pandas as pd
 import os
-from typing import Tuple, Dict, Any, Optional
+import re
+import tempfile
+import zipfile
+from typing import Tuple, Dict, Any, Optional, Set
+from xml.sax.saxutils import unescape
 from utils.logger import Logger
 from core.exceptions import DataExtractionError
 
+# Reparação ao nível do zip/XML (sem abrir o Excel)
+_RE_EXTERNAL_REFS = re.compile(r'<externalReferences\b[^>]*?(?:/>|>.*?</externalReferences>)', re.S)
+_RE_DEFINED_NAME = re.compile(r'<definedName\b[^>]*?(?:/>|>(.*?)</definedName>)', re.S)
+_RE_DEFINED_NAMES_VAZIO = re.compile(r'<definedNames\b[^>]*?(?:/>|>\s*</definedNames>)')
+_RE_PROTECAO_WB = re.compile(r'<(?:workbookProtection|fileSharing)\b[^>]*?(?:/>|>.*?</(?:workbookProtection|fileSharing)>)', re.S)
+_RE_PROTECAO_WS = re.compile(r'<sheetProtection\b[^>]*?(?:/>|>.*?</sheetProtection>)|<protectedRanges\b.*?</protectedRanges>', re.S)
+_RE_F_SHARED = re.compile(r'<f\b[^>]*\bt="shared"[^>]*?(?:/>|>.*?</f>)', re.S)
+_RE_F_EXTERNA = re.compile(r'<f\b[^>]*>[^<]*\[\d+\][^<]*</f>')
+_RE_SHEET_NOME = re.compile(r'<sheet\b[^>]*\bname="([^"]*)"')
+_RE_REF_PLANILHA = re.compile(r"(?:'((?:[^']|'')+)'|([^\s'!,()=+\-*/&;<>]+))!")
+_RE_RELATIONSHIP = re.compile(r'<Relationship\b[^>]*?/>')
+_RE_OVERRIDE = re.compile(r'<Override\b[^>]*?/>')
+
 class ExcelSanitizer:
     def __init__(self, config: Optional[Dict[str, Any]] = None):
         self.config: Dict[str, Any] = config or {}
@@ -51,6 +68,115 @@ class ExcelSanitizer:
             Logger.error(msg)
             return False, msg, 0
 
+    # ──────────────────────────────────────────────
+    #  REPARAÇÃO DO PACOTE (substitui o SaveAs pelo Excel)
+    # ──────────────────────────────────────────────
+
+    def reparar_pacote(self, input_path: str, output_path: str) -> Dict[str, int]:
+        """
+        Grava em `output_path` uma cópia limpa do .xlsx exportado pelo SIPAC,
+        reparada direto no zip/XML, sem abrir o Excel:
+        - ligações externas (xl/externalLinks, relações e <externalReferences>) removidas;
+        - nomes definidos quebrados (#REF!, livros externos [n], planilhas inexistentes) removidos;
+        - proteção do livro, das planilhas e recomendação de só leitura retiradas;
+        - fórmulas partilhadas e fórmulas que apontam para livros externos trocadas
+          pelo valor em cache; sem calcChain.
+        Os valores em cache não mudam: pandas e openpyxl leem o mesmo que no original.
+        Devolve as contagens do que foi reparado. DataExtractionError se o arquivo
+        não for um pacote .xlsx (ex.: .xls binário), caso em que resta o Excel.
+        """
+        if not zipfile.is_zipfile(input_path):
+            raise DataExtractionError("Arquivo não é um pacote .xlsx (zip); a reparação direta não se aplica.")
+
+        relatorio = {'links_externos': 0, 'nomes_removidos': 0, 'protecoes': 0, 'formulas': 0}
+        pasta = os.path.dirname(os.path.abspath(output_path))
+        fd, temporario = tempfile.mkstemp(prefix="~limpo.", suffix=".xlsx", dir=pasta)
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(input_path) as zin:
+                nomes = zin.namelist()
+                remover = {n for n in nomes if n.startswith("xl/externalLinks/") or n == "xl/calcChain.xml"}
+                relatorio['links_externos'] = sum(1 for n in remover if re.match(r'xl/externalLinks/[^/]+\.xml$', n))
+
+                with zipfile.ZipFile(temporario, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+                    for item in zin.infolist():
+                        nome = item.filename
+                        if nome in remover:
+                            continue
+                        dados = zin.read(nome)
+                        if nome == "xl/workbook.xml":
+                            dados = self._reparar_workbook(dados.decode("utf-8"), relatorio).encode("utf-8")
+                        elif nome == "xl/_rels/workbook.xml.rels":
+                            dados = self._sem_relacoes(dados.decode("utf-8"), ("/externalLink", "/calcChain")).encode("utf-8")
+                        elif nome == "[Content_Types].xml":
+                            dados = self._sem_overrides(dados.decode("utf-8"), remover).encode("utf-8")
+                        elif re.match(r'xl/worksheets/[^/]+\.xml$', nome):
+                            dados = self._reparar_planilha(dados.decode("utf-8"), relatorio).encode("utf-8")
+                        zout.writestr(item, dados)
+            os.replace(temporario, output_path)
+        except (zipfile.BadZipFile, KeyError, UnicodeDecodeError) as e:
+            raise DataExtractionError(f"Pacote .xlsx danificado: {e}", e)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+        Logger.info(f"Sintético reparado: {relatorio['links_externos']} ligação(ões) externa(s), "
+                    f"{relatorio['nomes_removidos']} nome(s), {relatorio['protecoes']} proteção(ões), "
+                    f"{relatorio['formulas']} fórmula(s) em valor")
+        return relatorio
+
+    @staticmethod
+    def _reparar_workbook(xml: str, relatorio: Dict[str, int]) -> str:
+        planilhas = {unescape(n, {"&quot;": '"', "&apos;": "'"}) for n in _RE_SHEET_NOME.findall(xml)}
+
+        def nome_definido(m):
+            texto = unescape(m.group(1) or "", {"&quot;": '"', "&apos;": "'"})
+            if ExcelSanitizer._nome_quebrado(texto, planilhas):
+                relatorio['nomes_removidos'] += 1
+                return ""
+            return m.group(0)
+
+        xml = _RE_EXTERNAL_REFS.sub("", xml)
+        xml = _RE_DEFINED_NAME.sub(nome_definido, xml)
+        xml = _RE_DEFINED_NAMES_VAZIO.sub("", xml)
+        xml, n = _RE_PROTECAO_WB.subn("", xml)
+        relatorio['protecoes'] += n
+        return xml
+
+    @staticmethod
+    def _nome_quebrado(texto: str, planilhas: Set[str]) -> bool:
+        if "#REF!" in texto.upper() or re.search(r'\[\d+\]', texto):
+            return True
+        for citada, simples in _RE_REF_PLANILHA.findall(texto):
+            if (citada.replace("''", "'") if citada else simples) not in planilhas:
+                return True
+        return False
+
+    @staticmethod
+    def _reparar_planilha(xml: str, relatorio: Dict[str, int]) -> str:
+        xml, n = _RE_PROTECAO_WS.subn("", xml)
+        relatorio['protecoes'] += n
+        # Sem a fórmula fica o <v> com o valor que o Excel calculou na exportação
+        xml, n = _RE_F_SHARED.subn("", xml)
+        relatorio['formulas'] += n
+        xml, n = _RE_F_EXTERNA.subn("", xml)
+        relatorio['formulas'] += n
+        return xml
+
+    @staticmethod
+    def _sem_relacoes(xml: str, tipos: Tuple[str, ...]) -> str:
+        def relacao(m):
+            tipo = re.search(r'\bType="([^"]*)"', m.group(0))
+            return "" if tipo and tipo.group(1).endswith(tipos) else m.group(0)
+        return _RE_RELATIONSHIP.sub(relacao, xml)
+
+    @staticmethod
+    def _sem_overrides(xml: str, partes: Set[str]) -> str:
+        def override(m):
+            parte = re.search(r'\bPartName="/?([^"]*)"', m.group(0))
+            return "" if parte and parte.group(1) in partes else m.group(0)
+        return _RE_OVERRIDE.sub(override, xml)
+
     def limpar_arquivos_temp(self) -> None:
         """Limpeza de arquivos temporários, reservado para expansões futuras."""
         pass
\ No newline at end of file
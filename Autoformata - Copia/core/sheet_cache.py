@@ -0,0 +1,166 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from utils.logger import Logger
+from core.disk_cache import DiskCache
+from core.template_cache import sha256_arquivo
+
+# Sobe quando o formato da grade guardada em disco muda
+VERSAO_GRADE = 1
+
+
+def ler_grade(caminho: str) -> pd.DataFrame:
+    """
+    Células da primeira folha tal como o leitor do pandas as entrega ao
+    parser: colunas de objetos, vazias como "", linhas em branco mantidas,
+    sem cabeçalho nem inferência de tipos. É a parte cara de pd.read_excel.
+    """
+    return pd.read_excel(caminho, header=None, dtype=object, na_filter=False)
+
+
+def fatiar(grade: pd.DataFrame, line_num: int, nrows: Optional[int] = None) -> pd.DataFrame:
+    """
+    Tabela com o cabeçalho na linha `line_num` a partir da grade: o mesmo
+    parser e os mesmos parâmetros de pd.read_excel(caminho, header=line_num),
+    portanto os mesmos nomes de coluna, tipos e índice, sem reabrir o xlsx.
+    """
+    return TextParser(grade.values.tolist(), header=line_num, nrows=nrows, skip_blank_lines=False).read(nrows=nrows)
+
+
+class CacheTabelas:
+    """
+    Sintético lido uma vez e partilhado pela lista de colunas, pela
+    pré-visualização e pela comparação de revisões.
+
+    A grade de células (ler_grade) fica por SHA-256 do arquivo; mudar a
+    linha do cabeçalho só volta a fatiar a grade (fatiar), não o xlsx. Em
+    memória ficam as últimas `em_memoria` grades e tabelas fatiadas por
+    (hash, linha do cabeçalho); com um DiskCache a grade também vai para
+    disco em pickle e sobrevive a reinícios. O hash de cada caminho só é
+    recalculado quando o mtime ou o tamanho mudam.
+    """
+
+    def __init__(self, cache: Optional[DiskCache] = None, em_memoria: int = 2):
+        self.cache = cache
+        self.em_memoria = em_memoria
+        self._hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._grades: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._tabelas: "OrderedDict[Tuple[str, int], pd.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ──────────────────────────────────────────────
+    #  LEITURA
+    # ──────────────────────────────────────────────
+
+    def tabela(self, caminho: str, line_num: int) -> pd.DataFrame:
+        """Igual a pd.read_excel(caminho, header=line_num); a cópia devolvida pode ser alterada à vontade."""
+        chave = (self._sha256(caminho), line_num)
+        with self._lock:
+            df = self._tabelas.get(chave)
+            if df is not None:
+                self._tabelas.move_to_end(chave)
+        if df is None:
+            df = fatiar(self._grade(caminho, chave[0]), line_num)
+            with self._lock:
+                self._guardar_memoria(self._tabelas, chave, df)
+        return df.copy(deep=False)
+
+    def colunas(self, caminho: str, line_num: int) -> List[str]:
+        """
+        Nomes das colunas com o cabeçalho em `line_num` (sem espaços nas
+        pontas). Se a grade ainda não foi lida, lê só as primeiras linhas do
+        xlsx: a leitura completa fica para a pré-visualização.
+        """
+        chave = (self._sha256(caminho), line_num)
+        with self._lock:
+            df = self._tabelas.get(chave)
+        if df is None:
+            grade = self._grade(caminho, chave[0], ler=False)
+            df = fatiar(grade, line_num, nrows=5) if grade is not None else pd.read_excel(caminho, header=line_num, nrows=5)
+        return [str(c).strip() for c in df.columns]
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._hashes.clear()
+            self._grades.clear()
+            self._tabelas.clear()
+
+    # ──────────────────────────────────────────────
+    #  INTERNOS
+    # ──────────────────────────────────────────────
+
+    def _sha256(self, caminho: str) -> str:
+        st = os.stat(caminho)
+        assinatura = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            conhecido = self._hashes.get(caminho)
+        if conhecido is not None and conhecido[0] == assinatura:
+            return conhecido[1]
+        sha = sha256_arquivo(caminho)
+        with self._lock:
+            self._hashes[caminho] = (assinatura, sha)
+        return sha
+
+    def _grade(self, caminho: str, sha: str, ler: bool = True) -> Optional[pd.DataFrame]:
+        """Grade da memória, do disco ou (com `ler`) do xlsx; None se não houver e `ler` for False."""
+        with self._lock:
+            grade = self._grades.get(sha)
+            if grade is not None:
+                self._grades.move_to_end(sha)
+                return grade
+
+        chave_disco = f"g{VERSAO_GRADE}{sha}"
+        grade = self._ler_disco(chave_disco)
+        if grade is None:
+            if not ler:
+                return None
+            grade = ler_grade(caminho)
+            Logger.info(f"Sintético lido: {len(grade)} linha(s) x {len(grade.columns)} coluna(s)")
+            self._gravar_disco(chave_disco, grade, os.path.basename(caminho))
+        with self._lock:
+            self._guardar_memoria(self._grades, sha, grade)
+        return grade
+
+    def _guardar_memoria(self, destino: "OrderedDict", chave, valor: pd.DataFrame) -> None:
+        destino[chave] = valor
+        destino.move_to_end(chave)
+        while len(destino) > self.em_memoria:
+            destino.popitem(last=False)
+
+    def _ler_disco(self, chave: str) -> Optional[pd.DataFrame]:
+        if self.cache is None:
+            return None
+        entrada = self.cache.obter(chave)
+        if entrada is None or "grade" not in entrada.arquivos:
+            return None
+        try:
+            return pd.read_pickle(entrada.arquivos["grade"])
+        except Exception as e:
+            Logger.warning(f"Cache: grade {chave[:12]} ilegível ({e}), descartada")
+            self.cache.remover(chave)
+            return None
+
+    def _gravar_disco(self, chave: str, grade: pd.DataFrame, nome: str) -> None:
+        if self.cache is None:
+            return
+        try:
+            os.makedirs(self.cache.pasta, exist_ok=True)
+            fd, temporario = tempfile.mkstemp(prefix="~grade.", suffix=".pkl", dir=self.cache.pasta)
+            os.close(fd)
+        except OSError as e:
+            Logger.warning(f"Cache: grade não guardada ({e})")
+            return
+        try:
+            grade.to_pickle(temporario)
+            self.cache.guardar(chave, {"grade": temporario}, {"original": nome, "linhas": len(grade)})
+        except OSError as e:
+            Logger.warning(f"Cache: grade não guardada ({e})")
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
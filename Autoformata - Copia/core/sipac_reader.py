@@ -0,0 +1,66 @@
+import re
+from typing import Optional, Dict, List, Any
+
+import pandas as pd
+
+from utils.logger import Logger
+from core.number_parser import converter_coluna, para_lista
+from core.sheet_cache import CacheTabelas
+
+# Radar Inteligente: a leitura para quando encontra o rodapé do orçamento
+PALAVRAS_PARADA = ["TOTAL SEM BDI", "TOTAL DO BDI", "TOTAL GERAL", "VALOR GLOBAL", "CUSTO TOTAL"]
+_RADAR = "|".join(re.escape(p) for p in PALAVRAS_PARADA)
+
+
+def ler_tabela(caminho: str, line_num: int, tabelas: Optional[CacheTabelas] = None) -> pd.DataFrame:
+    """
+    Tabela do sintético com o cabeçalho na linha `line_num` (nomes de coluna
+    sem espaços nas pontas). Com `tabelas` o xlsx só é lido uma vez por arquivo.
+    """
+    df = tabelas.tabela(caminho, line_num) if tabelas is not None else pd.read_excel(caminho, header=line_num)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def linhas_preview(df: pd.DataFrame, line_num: int, m_item: str, m_desc: str, m_cod: str, m_banco: str, m_unit: str) -> List[Dict[str, Any]]:
+    """
+    Linhas do orçamento como a pré-visualização as mostra: até ao rodapé
+    (radar), sem linhas de descrição vazia, com o preço unitário já convertido.
+    Colunas tratadas de uma vez (sem iterrows): a ordem e os valores de cada
+    linha são os da planilha.
+    """
+    if m_desc in df.columns:
+        descricoes = [str(v).strip() for v in df[m_desc].tolist()]
+    else:
+        descricoes = ['nan'] * len(df)
+
+    fim = len(df)
+    parada = pd.Series(descricoes, dtype=object).str.upper().str.contains(_RADAR, regex=True).to_numpy()
+    if parada.any():
+        fim = int(parada.argmax())
+        Logger.info(f"🛑 Fim do orçamento detetado pelo radar na linha {line_num + df.index[fim] + 2}.")
+
+    # Preço unitário convertido numa só passagem (mesmo conversor do motor)
+    if m_unit in df.columns:
+        unit_nums = para_lista(converter_coluna(df[m_unit].iloc[:fim].astype(object)))
+    else:
+        unit_nums = [0.0] * fim
+
+    registros = df.iloc[:fim].to_dict('records')
+    indices = df.index[:fim].tolist()
+    dados_linhas = []
+    for pos, row in enumerate(registros):
+        desc_val = descricoes[pos]
+        if desc_val == 'nan' or desc_val == '' or desc_val == 'None':
+            continue
+        dados_linhas.append({
+            'index_excel': line_num + indices[pos] + 2,
+            'item_val': row.get(m_item, ''),
+            'desc_val': desc_val,
+            'cod_val': row.get(m_cod, ''),
+            'banco_val': row.get(m_banco, ''),
+            'raw_row_data': row,
+            'unit_val': unit_nums[pos]
+        })
+    return dados_linhas
+
@@ -0,0 +1,65 @@
+from copy import copy
+from typing import Dict, Tuple
+
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl.styles.cell_style import StyleArray
+
+
+class StyleCache:
+    """
+    Cache de estilos hierárquicos (N1/N2/N3/ITEM) de um workbook.
+
+    Atribuir `cell.fill = PatternFill(...)` obriga o OpenPyXL a fazer hash do
+    objeto e procurá-lo na tabela de estilos do workbook, célula a célula. Aqui os
+    ids de fonte/preenchimento/borda/alinhamento de cada (nível, coluna) são
+    registados uma única vez e as células recebem directamente o StyleArray
+    final, reaproveitado entre linhas com o mesmo estilo de partida.
+    """
+
+    PALETA = {
+        "N1": {"bg": "9BC2E6", "bold": True, "size": 11},
+        "N2": {"bg": "BDD7EE", "bold": True, "size": 11},
+        "N3": {"bg": "DDEBF7", "bold": True, "size": 11},
+        "ITEM": {"bg": "FFFFFF", "bold": False, "size": 10}
+    }
+
+    def __init__(self, wb):
+        self.wb = wb
+        # (nivel, col) -> (fontId, fillId, borderId, alignmentId)
+        self._ids: Dict[Tuple[str, int], Tuple[int, int, int, int]] = {}
+        # (nivel, col, estilo de partida) -> StyleArray final
+        self._arrays: Dict[Tuple[str, int, Tuple[int, ...]], StyleArray] = {}
+
+    def aplicar(self, cell, nivel: str, col: int) -> None:
+        """Aplica o estilo do nível à célula, preservando formato numérico e proteção."""
+        partida = cell._style or StyleArray()  # células novas ainda não têm StyleArray
+        chave = (nivel, col, tuple(partida))
+        estilo = self._arrays.get(chave)
+        if estilo is None:
+            font_id, fill_id, border_id, alignment_id = self._ids_nivel(nivel, col)
+            estilo = copy(partida)
+            estilo.fontId = font_id
+            estilo.fillId = fill_id
+            estilo.borderId = border_id
+            estilo.alignmentId = alignment_id
+            self._arrays[chave] = estilo
+        # Cada célula precisa da sua própria cópia: o OpenPyXL altera o StyleArray in-place.
+        cell._style = copy(estilo)
+
+    def _ids_nivel(self, nivel: str, col: int) -> Tuple[int, int, int, int]:
+        chave = (nivel, col)
+        ids = self._ids.get(chave)
+        if ids is None:
+            estilo = self.PALETA.get(nivel, self.PALETA["ITEM"])
+            side = Side(style="thin")
+            h = "center"
+            if col == 4: h = "left"
+            if col == 8: h = "right"
+            ids = (
+                self.wb._fonts.add(Font(name="Arial", bold=estilo["bold"], size=estilo["size"])),
+                self.wb._fills.add(PatternFill("solid", fgColor=estilo["bg"])),
+                self.wb._borders.add(Border(left=side, right=side, top=side, bottom=side)),
+                self.wb._alignments.add(Alignment(horizontal=h, vertical="center", wrap_text=(col == 4))),
+            )
+            self._ids[chave] = ids
+        return ids
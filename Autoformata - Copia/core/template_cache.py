@@ -0,0 +1,152 @@
+import io
+import os
+import copyreg
+import pickle
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import openpyxl
+from openpyxl.utils.bound_dictionary import BoundDictionary
+from openpyxl.worksheet.dimensions import DimensionHolder
+
+from utils.logger import Logger
+
+
+def _reduzir_bound_dictionary(obj):
+    # O pickle padrão de defaultdict passa o default_factory como primeiro argumento
+    # posicional, que no BoundDictionary é o `reference`: a fábrica perde-se e
+    # `ws.row_dimensions[n]` passa a lançar KeyError na cópia.
+    return (copyreg.__newobj__, (type(obj),), (obj.__dict__, {"default_factory": obj.default_factory}),
+            None, iter(obj.items()))
+
+
+_DISPATCH = copyreg.dispatch_table.copy()
+_DISPATCH[BoundDictionary] = _reduzir_bound_dictionary
+_DISPATCH[DimensionHolder] = _reduzir_bound_dictionary
+
+
+def _serializar(wb: openpyxl.Workbook) -> bytes:
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = _DISPATCH
+    pickler.dump(wb)
+    return buffer.getvalue()
+
+
+def sha256_arquivo(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _cortar(wb: openpyxl.Workbook, linha: int) -> None:
+    """Remove da planilha ativa tudo o que está da linha indicada para baixo (células, mesclagens e alturas)."""
+    ws = wb.active
+    for merged in [m for m in ws.merged_cells.ranges if m.max_row >= linha]:
+        ws.unmerge_cells(merged.coord)
+    for chave in [k for k in ws._cells if k[0] >= linha]:
+        del ws._cells[chave]
+    for row in [r for r in ws.row_dimensions if r >= linha]:
+        del ws.row_dimensions[row]
+
+
+@dataclass
+class _Entrada:
+    assinatura: Tuple[int, int]  # (mtime_ns, tamanho)
+    sha256: str
+    serializado: Optional[bytes]
+    mestre: Optional[openpyxl.Workbook] = None  # só criado se alguém o pedir
+    # linha de corte -> cópia serializada sem nada a partir dessa linha
+    cortes: Dict[int, Optional[bytes]] = field(default_factory=dict)
+
+
+class TemplateCache:
+    """
+    Cache de templates já interpretados pelo OpenPyXL, partilhado pelo processo.
+
+    Cada template é lido uma única vez e fica guardado só na forma serializada,
+    da qual saem as cópias de trabalho independentes: `pickle.loads` é bem mais
+    barato que voltar a abrir o .xlsx. O workbook mestre (só leitura) é criado
+    apenas se for pedido; a geração não o usa. A entrada é invalidada quando o mtime/tamanho
+    do ficheiro muda e o SHA-256 do conteúdo já não é o mesmo.
+    """
+
+    _entradas: Dict[str, _Entrada] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def mestre(cls, modelo_path: str) -> openpyxl.Workbook:
+        """Workbook mestre do template. Não deve ser alterado nem gravado."""
+        entrada = cls._obter(modelo_path)
+        with cls._lock:
+            if entrada.mestre is None:
+                entrada.mestre = cls._carregar(modelo_path, entrada.serializado)
+            return entrada.mestre
+
+    @classmethod
+    def copia(cls, modelo_path: str, ate_linha: Optional[int] = None) -> openpyxl.Workbook:
+        """
+        Cópia de trabalho independente do template, pronta a ser alterada e gravada.
+        Com `ate_linha`, a cópia já vem sem nada dessa linha para baixo: o corte é
+        feito uma vez por template e guardado, não a cada geração.
+        """
+        entrada = cls._obter(modelo_path)
+        if ate_linha is None:
+            return cls._carregar(modelo_path, entrada.serializado)
+
+        with cls._lock:
+            if ate_linha not in entrada.cortes:
+                wb = cls._carregar(modelo_path, entrada.serializado)
+                _cortar(wb, ate_linha)
+                entrada.cortes[ate_linha] = _serializar(wb) if entrada.serializado is not None else None
+        serializado = entrada.cortes[ate_linha]
+        if serializado is None:
+            wb = openpyxl.load_workbook(modelo_path)
+            _cortar(wb, ate_linha)
+            return wb
+        return pickle.loads(serializado)
+
+    @classmethod
+    def limpar(cls) -> None:
+        with cls._lock:
+            cls._entradas.clear()
+
+    # ──────────────────────────────────────────────
+    #  INTERNOS
+    # ──────────────────────────────────────────────
+
+    @staticmethod
+    def _carregar(modelo_path: str, serializado: Optional[bytes]) -> openpyxl.Workbook:
+        return openpyxl.load_workbook(modelo_path) if serializado is None else pickle.loads(serializado)
+
+    @classmethod
+    def _obter(cls, modelo_path: str) -> _Entrada:
+        chave = os.path.abspath(modelo_path)
+        st = os.stat(chave)
+        assinatura = (st.st_mtime_ns, st.st_size)
+
+        with cls._lock:
+            entrada = cls._entradas.get(chave)
+            if entrada is not None and entrada.assinatura == assinatura:
+                return entrada
+
+            sha = sha256_arquivo(chave)
+            if entrada is not None and entrada.sha256 == sha:
+                # Ficheiro tocado (cópia, sincronização) mas com o mesmo conteúdo
+                entrada.assinatura = assinatura
+                return entrada
+
+            Logger.info(f"Template em cache: {os.path.basename(chave)}")
+            wb = openpyxl.load_workbook(chave)
+            try:
+                serializado = _serializar(wb)
+            except Exception as e:
+                Logger.warning(f"Template não serializável ({e}); cópias serão lidas do disco.")
+                serializado = None
+            entrada = _Entrada(assinatura, sha, serializado)
+            cls._entradas[chave] = entrada
+            return entrada
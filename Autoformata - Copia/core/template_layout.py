@@ -0,0 +1,247 @@
+import os
+import json
+import bisect
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import openpyxl
+from openpyxl.utils import get_column_letter, column_index_from_string, range_boundaries
+
+from utils.logger import Logger
+from core.template_cache import sha256_arquivo
+
+# Incrementar quando o formato ou a análise mudarem: descritores antigos são recompilados
+VERSAO_LAYOUT = 2
+
+# Células escritas por _processar_cabecalho (a âncora real é a origem do merge que as contém)
+CELULAS_CABECALHO = ("A8", "A9", "A10", "A13", "A14", "C15", "A18", "E18", "E21", "D22",
+                     "C20", "D20", "D21", "E20", "G20")
+# Rodapé dos modelos padrão (totais + relatório fotográfico), usado se não for encontrado
+RODAPE_PADRAO = (26, 51)
+
+
+@dataclass
+class LayoutTemplate:
+    """
+    Descritor compilado de um template: tudo o que o motor precisava de descobrir
+    a cada geração (linha inicial da tabela, âncoras do cabeçalho, limites do
+    rodapé, larguras de coluna e estilos da área de dados).
+
+    Inclui também um retrato do bloco do rodapé (valores, estilos, alturas e
+    mesclagens), para que a geração não precise de manter o workbook do template
+    aberto só para o copiar.
+
+    Fica gravado ao lado do .xlsx como `<modelo>.layout.json` e é validado pelo
+    SHA-256 do template.
+    """
+    sha256: str
+    start_row: int
+    ancoras: Dict[str, str]  # célula do cabeçalho -> origem do merge que a contém
+    rodape: Tuple[int, int]
+    larguras: List[Tuple[int, int, float]]  # (coluna inicial, coluna final, largura) das colunas com largura própria
+    largura_padrao: float
+    fonte_padrao: str
+    tamanho_fonte: float
+    # Estilos distintos da área de dados (ids de fonte, borda, preenchimento... do StyleArray).
+    # Os ids dependem da leitura feita pelo OpenPyXL (as mesclagens acrescentam bordas),
+    # por isso a versão também é guardada.
+    paleta: List[List[int]] = field(default_factory=list)
+    # Faixas de linhas com o mesmo padrão: (linha inicial, linha final, {coluna: índice na paleta})
+    estilos: List[Tuple[int, int, Dict[int, int]]] = field(default_factory=list)
+    # Rodapé: (linha, coluna, valor, índice na paleta) das células, alturas e mesclagens
+    rodape_celulas: List[Tuple[int, int, Any, int]] = field(default_factory=list)
+    rodape_alturas: Dict[int, float] = field(default_factory=dict)
+    rodape_merges: List[str] = field(default_factory=list)
+    openpyxl: str = openpyxl.__version__
+    versao: int = VERSAO_LAYOUT
+
+    def __post_init__(self):
+        self._inicios = [ini for ini, _, _ in self.estilos]
+
+    def largura(self, coluna: str) -> float:
+        idx = column_index_from_string(coluna)
+        for c_min, c_max, largura in self.larguras:
+            if c_min <= idx <= c_max:
+                return largura
+        return self.largura_padrao
+
+    def estilos_da_linha(self, row: int) -> Dict[int, int]:
+        """Coluna -> índice na paleta do estilo da célula do template nesta linha (vazio se não havia células)."""
+        i = bisect.bisect_right(self._inicios, row) - 1
+        if i >= 0 and row <= self.estilos[i][1]:
+            return self.estilos[i][2]
+        return {}
+
+    def salvar(self, caminho: str) -> None:
+        dados = asdict(self)
+        dados["estilos"] = [[ini, fim, {str(c): xf for c, xf in padrao.items()}] for ini, fim, padrao in self.estilos]
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(dados, f, indent=1, ensure_ascii=False)
+
+    @classmethod
+    def ler(cls, caminho: str) -> Optional["LayoutTemplate"]:
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if dados.get("versao") != VERSAO_LAYOUT or dados.get("openpyxl") != openpyxl.__version__:
+                return None
+            dados["rodape"] = tuple(dados["rodape"])
+            dados["larguras"] = [tuple(faixa) for faixa in dados["larguras"]]
+            dados["rodape_celulas"] = [tuple(celula) for celula in dados["rodape_celulas"]]
+            dados["rodape_alturas"] = {int(r): h for r, h in dados["rodape_alturas"].items()}
+            dados["estilos"] = [(ini, fim, {int(c): xf for c, xf in padrao.items()}) for ini, fim, padrao in dados["estilos"]]
+            return cls(**dados)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+def caminho_descritor(modelo_path: str) -> str:
+    return os.path.splitext(str(modelo_path))[0] + ".layout.json"
+
+
+def compilar_layout(modelo_path: str, start_line_padrao: int = 15) -> LayoutTemplate:
+    """Analisa o template uma vez (as mesmas procuras que o motor fazia por geração)."""
+    wb = openpyxl.load_workbook(modelo_path)
+    ws = wb.active
+    merges = [range_boundaries(m.coord) for m in ws.merged_cells.ranges]
+
+    def valor(row: int, col: int):
+        cell = ws._cells.get((row, col))
+        return cell.value if cell is not None else None
+
+    start_row = start_line_padrao
+    for r in range(1, 50):
+        val = str(valor(r, 4)).upper()
+        if 'DESCRIÇÃO' in val or 'DISCRIMINAÇÃO' in val:
+            start_row = r + 1
+            break
+
+    ancoras = {}
+    for coord in CELULAS_CABECALHO:
+        min_c, min_r, _, _ = range_boundaries(coord)
+        ancoras[coord] = coord
+        for m_min_c, m_min_r, m_max_c, m_max_r in merges:
+            if m_min_r <= min_r <= m_max_r and m_min_c <= min_c <= m_max_c:
+                ancoras[coord] = f"{get_column_letter(m_min_c)}{m_min_r}"
+                break
+
+    rodape = RODAPE_PADRAO
+    for r in range(start_row, ws.max_row + 1):
+        if str(valor(r, 1) or "").strip().upper().startswith("TOTAL"):
+            fim = max([row for (row, _), cell in ws._cells.items() if row >= r and cell.value is not None] +
+                      [m_max_r for _, m_min_r, _, m_max_r in merges if m_min_r >= r])
+            rodape = (r, fim)
+            break
+
+    larguras = []
+    for letra, dim in ws.column_dimensions.items():
+        if dim.width:
+            c_min = dim.min or column_index_from_string(letra)
+            larguras.append((c_min, dim.max or c_min, float(dim.width)))
+
+    fonte = wb._fonts[0] if len(wb._fonts) else None
+    ids: Dict[Tuple[int, ...], int] = {}
+    faixas = _estilos_area_dados(ws, merges, start_row, ids)
+    return LayoutTemplate(
+        sha256=sha256_arquivo(modelo_path),
+        start_row=start_row,
+        ancoras=ancoras,
+        rodape=rodape,
+        larguras=larguras,
+        largura_padrao=float(ws.sheet_format.defaultColWidth or 8.43),
+        fonte_padrao=fonte.name if fonte is not None and fonte.name else "Calibri",
+        tamanho_fonte=float(fonte.sz) if fonte is not None and fonte.sz else 11.0,
+        estilos=faixas,
+        **_retrato_rodape(ws, merges, rodape, ids),
+        paleta=[list(estilo) for estilo in ids],
+    )
+
+
+def _internas(merges, a_partir_da_linha: int) -> set:
+    """Células de mesclagens (que chegam à linha indicada) que não são a origem do range."""
+    internas = set()
+    for min_c, min_r, max_c, max_r in merges:
+        if max_r >= a_partir_da_linha:
+            internas.update((r, c) for r in range(min_r, max_r + 1) for c in range(min_c, max_c + 1)
+                            if (r, c) != (min_r, min_c))
+    return internas
+
+
+def _estilos_area_dados(ws, merges, start_row: int, ids: Dict[Tuple[int, ...], int]) -> List[Tuple[int, int, Dict[int, int]]]:
+    """
+    Estilo de cada célula do template da linha inicial para baixo, como fica
+    depois de desfeitas as mesclagens (as células internas dos ranges não contam).
+    Linhas consecutivas com o mesmo padrão ficam numa só faixa.
+    """
+    internas = _internas(merges, start_row)
+    por_linha: Dict[int, Dict[int, int]] = {}
+    for (row, col), cell in ws._cells.items():
+        if row >= start_row and (row, col) not in internas and cell._style is not None:
+            por_linha.setdefault(row, {})[col] = ids.setdefault(tuple(cell._style), len(ids))
+
+    faixas: List[Tuple[int, int, Dict[int, int]]] = []
+    for row in sorted(por_linha):
+        padrao = dict(sorted(por_linha[row].items()))
+        if faixas and faixas[-1][1] == row - 1 and faixas[-1][2] == padrao:
+            faixas[-1] = (faixas[-1][0], row, padrao)
+        else:
+            faixas.append((row, row, padrao))
+    return faixas
+
+
+def _retrato_rodape(ws, merges, rodape: Tuple[int, int], ids: Dict[Tuple[int, ...], int]) -> Dict[str, Any]:
+    """Células, alturas e mesclagens do bloco do rodapé (as internas das mesclagens voltam com o merge)."""
+    r_ini, r_fim = rodape
+    internas = _internas(merges, r_ini)
+    celulas = []
+    for (row, col), cell in sorted(ws._cells.items()):
+        if r_ini <= row <= r_fim and (row, col) not in internas:
+            valor = cell.value
+            if not isinstance(valor, (str, int, float, bool, type(None))):
+                valor = str(valor)
+            estilo = ids.setdefault(tuple(cell._style), len(ids)) if cell.has_style else None
+            celulas.append((row, col, valor, estilo))
+    alturas = {}
+    for row in range(r_ini, r_fim + 1):
+        dim = ws.row_dimensions.get(row)
+        if dim is not None and dim.height is not None:
+            alturas[row] = float(dim.height)
+    merges_bloco = sorted(f"{get_column_letter(min_c)}{min_r}:{get_column_letter(max_c)}{max_r}"
+                          for min_c, min_r, max_c, max_r in merges if min_r >= r_ini and max_r <= r_fim)
+    return {"rodape_celulas": celulas, "rodape_alturas": alturas, "rodape_merges": merges_bloco}
+
+
+# ──────────────────────────────────────────────
+#  DESCRITORES EM USO (por processo)
+# ──────────────────────────────────────────────
+
+_layouts: Dict[str, Tuple[Tuple[int, int], LayoutTemplate]] = {}
+_lock = threading.Lock()
+
+
+def obter_layout(modelo_path: str) -> LayoutTemplate:
+    """
+    Descritor do template para o motor. Lido do disco uma vez por processo; se
+    faltar ou não corresponder ao ficheiro (template trocado à mão), é recompilado
+    e regravado.
+    """
+    chave = os.path.abspath(modelo_path)
+    st = os.stat(chave)
+    assinatura = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        memo = _layouts.get(chave)
+        if memo is not None and memo[0] == assinatura:
+            return memo[1]
+
+        caminho = caminho_descritor(chave)
+        layout = LayoutTemplate.ler(caminho)
+        if layout is None or layout.sha256 != sha256_arquivo(chave):
+            Logger.warning(f"Layout de '{os.path.basename(chave)}' ausente ou desatualizado: a compilar.")
+            layout = compilar_layout(chave)
+            try:
+                layout.salvar(caminho)
+            except OSError as e:
+                Logger.warning(f"Não foi possível gravar o layout compilado: {e}")
+        _layouts[chave] = (assinatura, layout)
+        return layout
@@ -0,0 +1,55 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator
+
+# Ordem em que as fases aparecem nos relatórios (as desconhecidas vão no fim)
+FASES = ["cache", "retrato", "preparo", "cabecalho", "itens", "formulas", "rodape", "correcao", "gravacao", "dados", "pdf"]
+
+
+class CronometroFases:
+    """
+    Tempos por fase de uma geração, em relógio monotónico (perf_counter).
+
+    Fases podem repetir-se (os tempos somam) e aninhar-se: o tempo de uma fase
+    é o tempo próprio, sem o das fases abertas dentro dela. Assim, no motor XML,
+    a "gravacao" que envolve a escrita do zip não conta de novo os itens e o
+    rodapé emitidos lá dentro, e a soma das fases é o tempo medido.
+    """
+
+    def __init__(self):
+        self.fases: Dict[str, float] = {}
+        self._inicio = time.perf_counter()
+        self._filhos: List[float] = []  # tempo das fases internas, por nível de aninhamento
+
+    @contextmanager
+    def fase(self, nome: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        self._filhos.append(0.0)
+        try:
+            yield
+        finally:
+            decorrido = time.perf_counter() - t0
+            internas = self._filhos.pop()
+            self.fases[nome] = self.fases.get(nome, 0.0) + decorrido - internas
+            if self._filhos:
+                self._filhos[-1] += decorrido
+
+    def adicionar(self, nome: str, segundos: float) -> None:
+        """Fase medida fora do motor (ex.: o PDF, gerado pelo controller)."""
+        self.fases[nome] = self.fases.get(nome, 0.0) + segundos
+
+    def relatorio(self, **contagens: Any) -> Dict[str, Any]:
+        """Vai para extra_info['tempos']: segundos por fase, total e contagens (linhas, mesclagens...)."""
+        ordem = {nome: i for i, nome in enumerate(FASES)}
+        fases = {nome: round(s, 4) for nome, s in sorted(self.fases.items(), key=lambda f: ordem.get(f[0], len(FASES)))}
+        return {'fases': fases, 'total': round(time.perf_counter() - self._inicio, 4), **contagens}
+
+
+def formatar_fases_lentas(linhas: List[Dict[str, Any]]) -> str:
+    """Texto do relatório de DatabaseManager.fases_mais_lentas (uma fase por linha)."""
+    if not linhas:
+        return "Sem tempos por fase registados."
+    texto = [f"{'Fase':<12}{'Execuções':>10}{'Média (s)':>11}{'Máx. (s)':>10}{'% total':>9}"]
+    for l in linhas:
+        texto.append(f"{l['fase']:<12}{l['execucoes']:>10}{l['media']:>11.3f}{l['maximo']:>10.3f}{l['percentual']:>8.1f}%")
+    return "\n".join(texto)
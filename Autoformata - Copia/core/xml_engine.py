@@ -0,0 +1,539 @@
+import os
+import re
+import math
+import time
+import numbers
+import zipfile
+from typing import Optional, Dict, List, Tuple, Any, Callable
+from xml.sax.saxutils import escape, unescape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE
+from openpyxl.utils import get_column_letter, column_index_from_string, range_boundaries
+
+from utils.logger import Logger
+from core.excel_handler import OrcamentoEngine
+from core.template_layout import obter_layout
+from core.formula_eval import nivel_compressao
+from core.style_cache import StyleCache
+from core.timings import CronometroFases
+from core.exceptions import ExcelProcessError, TemplateNotFoundError
+
+_RE_ROW = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_RE_CELL = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_RE_REF = re.compile(r'\br="([A-Z]+)(\d+)"')
+_RE_ROW_NUM = re.compile(r'\br="(\d+)"')
+_RE_ATTR_S = re.compile(r'\bs="(\d+)"')
+_RE_ATTR_T = re.compile(r'\bt="(\w+)"')
+_RE_MERGE = re.compile(r'<mergeCell\b[^>]*\bref="([A-Z0-9:$]+)"')
+_RE_SI = re.compile(r'<si>(.*?)</si>', re.S)
+_RE_T = re.compile(r'<t\b[^>]*>(.*?)</t>', re.S)
+_RE_V = re.compile(r'<v>(.*?)</v>', re.S)
+
+# Linhas de dados escritas de cada vez no XML da planilha
+LINHAS_POR_BLOCO = 500
+
+
+def planilha_ativa(workbook_xml: str, rels_xml: str) -> str:
+    """Caminho no zip (xl/worksheets/...) da planilha ativa do workbook."""
+    sheets = re.findall(r'<sheet\b[^>]*>', workbook_xml)
+    m_tab = re.search(r'activeTab="(\d+)"', workbook_xml)
+    idx = int(m_tab.group(1)) if m_tab else 0
+    rid = re.search(r'r:id="([^"]+)"', sheets[min(idx, len(sheets) - 1)]).group(1)
+    for rel in re.findall(r'<Relationship\b[^>]*>', rels_xml):
+        if f'Id="{rid}"' in rel:
+            alvo = re.search(r'Target="([^"]+)"', rel).group(1)
+            return alvo.lstrip("/") if alvo.startswith("/") else f"xl/{alvo}"
+    raise ExcelProcessError("Planilha ativa do template não encontrada no workbook.xml.")
+
+
+class _EstilosXML:
+    """
+    Edição textual do xl/styles.xml do template.
+    Acrescenta fontes, preenchimentos, bordas, formatos numéricos e xfs sem
+    reescrever o resto do ficheiro (prefixos de namespace, extLst, etc.).
+    """
+
+    _SECOES = (("numFmts", "numFmt"), ("fonts", "font"), ("fills", "fill"),
+               ("borders", "border"), ("cellXfs", "xf"))
+
+    def __init__(self, xml: str):
+        self.xml = xml
+        self.itens: Dict[str, List[str]] = {}
+        self._ids: Dict[Tuple[str, str], int] = {}
+        for secao, filho in self._SECOES:
+            m = re.search(rf'<{secao}\b[^>]*?(?:/>|>(.*?)</{secao}>)', xml, re.S)
+            corpo = (m.group(1) or "") if m else ""
+            elementos = re.findall(rf'<{filho}\b[^>]*?/>|<{filho}\b[^>]*?>.*?</{filho}>', corpo, re.S)
+            self.itens[secao] = elementos
+            for i, raw in enumerate(elementos):
+                self._ids.setdefault((secao, raw), i)
+        self._formatos = {}
+        for raw in self.itens["numFmts"]:
+            num_id = int(re.search(r'numFmtId="(\d+)"', raw).group(1))
+            codigo = unescape(re.search(r'formatCode="([^"]*)"', raw).group(1), {"&quot;": '"'})
+            self._formatos.setdefault(codigo, num_id)
+
+    def adicionar(self, secao: str, raw: str) -> int:
+        chave = (secao, raw)
+        if chave not in self._ids:
+            self.itens[secao].append(raw)
+            self._ids[chave] = len(self.itens[secao]) - 1
+        return self._ids[chave]
+
+    def num_fmt(self, codigo: Optional[str]) -> int:
+        if not codigo or codigo == "General":
+            return 0
+        if codigo in BUILTIN_FORMATS_REVERSE:
+            return BUILTIN_FORMATS_REVERSE[codigo]
+        if codigo not in self._formatos:
+            usados = [v for v in self._formatos.values()] + [163]
+            self._formatos[codigo] = max(usados) + 1
+            self.itens["numFmts"].append(
+                f'<numFmt numFmtId="{self._formatos[codigo]}" formatCode="{escape(codigo, {chr(34): "&quot;"})}"/>')
+        return self._formatos[codigo]
+
+    def xf_attr(self, xf_id: int, nome: str) -> int:
+        xfs = self.itens["cellXfs"]
+        if not 0 <= xf_id < len(xfs):
+            return 0
+        m = re.search(rf'\b{nome}="(\d+)"', xfs[xf_id])
+        return int(m.group(1)) if m else 0
+
+    def fonte(self, font_id: int) -> str:
+        fontes = self.itens["fonts"]
+        return fontes[font_id] if 0 <= font_id < len(fontes) else "<font/>"
+
+    def xf_derivado(self, xf_id: int, **ids: int) -> int:
+        """Cópia do xf indicado com alguns ids trocados (fontId=..., numFmtId=...)."""
+        xfs = self.itens["cellXfs"]
+        raw = xfs[xf_id] if 0 <= xf_id < len(xfs) else '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        for nome, valor in ids.items():
+            raw = re.sub(rf'\b{nome}="\d+"', f'{nome}="{valor}"', raw)
+            aplicar = {"fontId": "applyFont", "numFmtId": "applyNumberFormat"}.get(nome)
+            if aplicar and f'{aplicar}=' not in raw:
+                raw = re.sub(r'^<xf\b', f'<xf {aplicar}="1"', raw)
+        return self.adicionar("cellXfs", raw)
+
+    def render(self) -> str:
+        xml = self.xml
+        for secao, _ in self._SECOES:
+            corpo = "".join(self.itens[secao])
+            m = re.search(rf'<{secao}\b([^>]*?)(?:/>|>(.*?)</{secao}>)', xml, re.S)
+            if m:
+                attrs = re.sub(r'\s*\bcount="\d+"', '', m.group(1).rstrip('/'))
+                novo = f'<{secao} count="{len(self.itens[secao])}"{attrs}>{corpo}</{secao}>'
+                xml = xml[:m.start()] + novo + xml[m.end():]
+            elif self.itens[secao]:
+                # Secção ausente (normalmente numFmts): entra logo após a abertura do styleSheet
+                m_raiz = re.search(r'<styleSheet\b[^>]*>', xml)
+                novo = f'<{secao} count="{len(self.itens[secao])}">{corpo}</{secao}>'
+                xml = xml[:m_raiz.end()] + novo + xml[m_raiz.end():]
+        return xml
+
+
+class _TemplateXML:
+    """Partes do template lidas directamente do zip (sem modelo em memória do OpenPyXL)."""
+
+    def __init__(self, modelo_path: str):
+        with zipfile.ZipFile(modelo_path) as zf:
+            self.nomes = zf.namelist()
+            self.workbook_xml = zf.read("xl/workbook.xml").decode("utf-8")
+            self.rels_xml = zf.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+            self.content_types = zf.read("[Content_Types].xml").decode("utf-8")
+            self.styles_xml = zf.read("xl/styles.xml").decode("utf-8")
+            sst = zf.read("xl/sharedStrings.xml").decode("utf-8") if "xl/sharedStrings.xml" in self.nomes else ""
+            self.sheet_path = planilha_ativa(self.workbook_xml, self.rels_xml)
+            sheet_xml = zf.read(self.sheet_path).decode("utf-8")
+
+        self.shared_strings = ["".join(unescape(t) for t in _RE_T.findall(si)) for si in _RE_SI.findall(sst)]
+
+        ini = sheet_xml.index("<sheetData")
+        abre = sheet_xml.find(">", ini)
+        if sheet_xml[abre - 1] == "/":  # <sheetData/>
+            fim_dados = abre + 1
+            corpo = ""
+        else:
+            fim_dados = sheet_xml.index("</sheetData>") + len("</sheetData>")
+            corpo = sheet_xml[abre + 1:sheet_xml.index("</sheetData>")]
+        self.prefixo = sheet_xml[:ini]
+        self.sufixo = sheet_xml[fim_dados:]
+
+        self.linhas: Dict[int, str] = {}
+        for raw in _RE_ROW.findall(corpo):
+            self.linhas[int(_RE_ROW_NUM.search(raw).group(1))] = raw
+
+        self.merges: List[Tuple[int, int, int, int]] = []
+        for ref in _RE_MERGE.findall(self.sufixo):
+            self.merges.append(range_boundaries(ref.replace("$", "")))
+
+    # ──────────────────────────────────────────────
+    #  CONSULTAS
+    # ──────────────────────────────────────────────
+
+    def celulas(self, row: int) -> Dict[int, str]:
+        raw = self.linhas.get(row)
+        if not raw:
+            return {}
+        return {column_index_from_string(_RE_REF.search(c).group(1)): c for c in _RE_CELL.findall(raw)}
+
+    def texto(self, celula_raw: str) -> Optional[str]:
+        t = _RE_ATTR_T.search(celula_raw)
+        tipo = t.group(1) if t else "n"
+        if tipo == "inlineStr":
+            return "".join(unescape(x) for x in _RE_T.findall(celula_raw))
+        v = _RE_V.search(celula_raw)
+        if not v:
+            return None
+        if tipo == "s":
+            return self.shared_strings[int(v.group(1))]
+        return unescape(v.group(1))
+
+    def origem_merge(self, row: int, col: int) -> Tuple[int, int]:
+        for min_c, min_r, max_c, max_r in self.merges:
+            if min_r <= row <= max_r and min_c <= col <= max_c:
+                return min_r, min_c
+        return row, col
+
+
+class OrcamentoEngineXML(OrcamentoEngine):
+    """
+    Motor alternativo que escreve o .xlsx directamente em XML.
+
+    Lê do zip do template apenas o cabeçalho, o rodapé e os estilos, emite as
+    linhas de itens em streaming para o zip de saída e copia as restantes partes
+    sem as interpretar. O resultado é equivalente ao do OrcamentoEngine, mas a
+    memória não cresce com o número de linhas do orçamento.
+    Selecionado por geração com info["motor"] = "XML".
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        super().__init__(config)
+        self.tpl: Optional[_TemplateXML] = None
+        self.estilos_xml: Optional[_EstilosXML] = None
+        self._cabecalho: Dict[Tuple[int, int], Tuple[Any, bool]] = {}
+        self._xf_cache: Dict[Tuple[Any, ...], int] = {}
+        self._mesclagens: int = 0  # intervalos mesclados escritos na última planilha
+
+    def gerar_excel_final(self, linhas_aprovadas: List[Dict[str, Any]], modelo_path: str, mapa_colunas: Dict[str, str], info: Dict[str, Any], progress_callback: Optional[Callable[[int], None]] = None) -> Tuple[bool, str, Dict[str, Any]]:
+        Logger.info(">>> PLANIFY ENGINE XML: STREAMING <<<")
+        self.info = info
+        self.mapa_colunas = mapa_colunas
+
+        if not os.path.exists(modelo_path):
+            raise TemplateNotFoundError(f"Template '{modelo_path}' não foi encontrado.")
+
+        self.cronometro = cron = CronometroFases()
+        try:
+            with self._reservar_saida() as saida:
+                try:
+                    with cron.fase("preparo"):
+                        self.layout = obter_layout(modelo_path)
+                        self.tpl = _TemplateXML(modelo_path)
+                        self.estilos_xml = _EstilosXML(self.tpl.styles_xml)
+                        self.alturas = self._criar_estimador_altura()
+                except ExcelProcessError:
+                    raise
+                except Exception as e:
+                    raise ExcelProcessError(f"Falha ao ler o template: {e}")
+
+                self._cabecalho = {}
+                self._xf_cache = {}
+                with cron.fase("cabecalho"):
+                    self._processar_cabecalho()
+                start_row = self._encontrar_inicio_tabela()
+
+                try:
+                    # Em streaming a escrita das linhas e a gravação do zip são a mesma fase:
+                    # cabeçalho, itens, fórmulas e rodapé são medidos dentro dela (tempo próprio)
+                    with cron.fase("gravacao"):
+                        inicio_gravacao = time.perf_counter()
+                        totais = self._escrever_zip(modelo_path, saida.temporario, linhas_aprovadas, start_row, progress_callback)
+                        save_path = saida.concluir()
+                    gravacao = self._relatorio_gravacao(save_path, inicio_gravacao)
+                except PermissionError as e:
+                    raise ExcelProcessError(f"O arquivo '{saida.caminho}' está aberto em outro programa. Feche-o e tente novamente.", e)
+
+            with cron.fase("dados"):
+                dados = self._exportar_dados(save_path, linhas_aprovadas, start_row)
+            tempos = cron.relatorio(linhas=len(linhas_aprovadas), mesclagens=self._mesclagens)
+            Logger.info(f"✅ Concluído: {save_path}")
+            return True, save_path, {'valor_total': totais['total_geral'], 'totais': totais, 'gravacao': gravacao, 'dados': dados, 'tempos': tempos}
+
+        except ExcelProcessError as e:
+            Logger.error(f"Erro ExcelProcessError: {e}")
+            return False, str(e), {}
+        except Exception as e:
+            Logger.error(f"Erro Inesperado Engine: {e}")
+            import traceback
+            traceback.print_exc()
+            return False, f"Erro crítico: {str(e)}", {}
+
+    # ──────────────────────────────────────────────
+    #  CABEÇALHO E LAYOUT (mesma API do OrcamentoEngine)
+    # ──────────────────────────────────────────────
+
+    def _write_cell(self, coord: str, text: Any, bold: bool = True) -> None:
+        ancora = self.layout.ancoras.get(coord)
+        min_c, min_r, _, _ = range_boundaries(ancora or coord)
+        origem = (min_r, min_c) if ancora else self.tpl.origem_merge(min_r, min_c)
+        self._cabecalho[origem] = (text, bold)
+
+    # ──────────────────────────────────────────────
+    #  ESCRITA DO ZIP
+    # ──────────────────────────────────────────────
+
+    def _escrever_zip(self, modelo_path: str, save_path: str, linhas: List[Dict[str, Any]], start_row: int, progress_callback: Optional[Callable[[int], None]]) -> Dict[str, float]:
+        tpl = self.tpl
+        ignorar = {tpl.sheet_path, "xl/styles.xml", "xl/workbook.xml", "xl/_rels/workbook.xml.rels",
+                   "[Content_Types].xml", "xl/calcChain.xml"}
+
+        nivel = nivel_compressao(self.info.get('perfil_gravacao'))
+        with zipfile.ZipFile(modelo_path) as zin, \
+                zipfile.ZipFile(save_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=nivel) as zout:
+            zout.writestr("[Content_Types].xml", re.sub(r'<Override\b[^>]*calcChain[^>]*/>', '', tpl.content_types))
+            with zout.open(tpl.sheet_path, "w", force_zip64=True) as destino:
+                totais = self._escrever_planilha(destino, linhas, start_row, progress_callback)
+            # styles.xml só depois da planilha: as linhas acrescentam xfs novos
+            zout.writestr("xl/styles.xml", self.estilos_xml.render())
+            zout.writestr("xl/workbook.xml", self._workbook_xml())
+            zout.writestr("xl/_rels/workbook.xml.rels",
+                          re.sub(r'<Relationship\b[^>]*calcChain[^>]*/>', '', tpl.rels_xml))
+            for nome in tpl.nomes:
+                if nome not in ignorar:
+                    zout.writestr(zin.getinfo(nome), zin.read(nome), compresslevel=nivel)
+        return totais
+
+    def _workbook_xml(self) -> str:
+        """Sem calcChain, o Excel recalcula as fórmulas ao abrir."""
+        xml = self.tpl.workbook_xml
+        if re.search(r'<calcPr\b', xml):
+            xml = re.sub(r'<calcPr\b([^>]*?)\s*fullCalcOnLoad="[^"]*"', r'<calcPr\1', xml)
+            return re.sub(r'<calcPr\b', '<calcPr fullCalcOnLoad="1"', xml, count=1)
+        return xml.replace("</workbook>", '<calcPr fullCalcOnLoad="1"/></workbook>')
+
+    def _escrever_planilha(self, destino, linhas: List[Dict[str, Any]], start_row: int, progress_callback: Optional[Callable[[int], None]]) -> Dict[str, float]:
+        tpl = self.tpl
+        merges_finais: List[str] = []
+        buffer: List[str] = []
+
+        def emitir(texto: str) -> None:
+            buffer.append(texto)
+            if len(buffer) >= LINHAS_POR_BLOCO:
+                destino.write("".join(buffer).encode("utf-8"))
+                buffer.clear()
+
+        total_linhas = len(linhas)
+        current_row = start_row + total_linhas
+        rodape_ini, rodape_fim = self.layout.rodape
+        fim_rodape = current_row + (rodape_fim - rodape_ini)
+        ultima_col = 8
+
+        emitir(re.sub(r'<dimension\b[^>]*/>', '', tpl.prefixo))
+        emitir("<sheetData>")
+
+        cron = self.cronometro
+
+        # 1. Cabeçalho: linhas do template acima da tabela, com os campos preenchidos
+        with cron.fase("cabecalho"):
+            for row in sorted(r for r in tpl.linhas if r < start_row):
+                emitir(self._linha_cabecalho(row))
+            for min_c, min_r, max_c, max_r in tpl.merges:
+                if max_r < start_row:
+                    merges_finais.append(f"{get_column_letter(min_c)}{min_r}:{get_column_letter(max_c)}{max_r}")
+                ultima_col = max(ultima_col, max_c)
+
+        # 2. Itens e títulos, em streaming
+        with cron.fase("formulas"):
+            mapa = [{'row': start_row + i, 'nivel': d.get("_NIVEL_FORCADO", "ITEM")} for i, d in enumerate(linhas)]
+            subtotais = self._calcular_subtotais(mapa)
+        with cron.fase("itens"):
+            base_template = self._estilos_base_area_dados(start_row)
+            cols = self._colunas_mapeadas()
+            calc_mode = self.info.get('calc_mode', 'EXACT')
+            altura_base = self.info.get('altura_linha', 24.75)
+
+            qtds, units = self._valores_numericos(linhas, cols, calc_mode)
+            self.numeros = (qtds, units)
+            alturas = self._alturas_linhas(linhas, cols, altura_base)
+        with cron.fase("formulas"):
+            valores_h, totais = self._avaliar_formulas([m['nivel'] for m in mapa], start_row, current_row)
+
+        with cron.fase("itens"):
+            for i, row_data in enumerate(linhas):
+                row = start_row + i
+                emitir(self._linha_item(row, row_data, cols, (qtds[i], units[i]), alturas[i], subtotais.get(row), base_template.get(row, {}), valores_h.get(row)))
+                if progress_callback and total_linhas > 0:
+                    pct = int(((i + 1) / total_linhas) * 100)
+                    progress_callback(pct)
+
+        # 3. Rodapé copiado do template para a posição final
+        with cron.fase("rodape"):
+            formulas = self._formulas_rodape(current_row, start_row, current_row - 1)
+            offset = current_row - rodape_ini
+            for row in range(rodape_ini, rodape_fim + 1):
+                emitir(self._linha_rodape(row, row + offset, formulas, valores_h))
+            for min_c, min_r, max_c, max_r in tpl.merges:
+                if min_r >= rodape_ini and max_r <= rodape_fim:
+                    merges_finais.append(f"{get_column_letter(min_c)}{min_r + offset}:{get_column_letter(max_c)}{max_r + offset}")
+        self._mesclagens = len(merges_finais)
+
+        emitir("</sheetData>")
+        sufixo = re.sub(r'<mergeCells\b[^>]*?(?:/>|>.*?</mergeCells>)', '', tpl.sufixo, flags=re.S)
+        if merges_finais:
+            bloco = "".join(f'<mergeCell ref="{m}"/>' for m in merges_finais)
+            sufixo = f'<mergeCells count="{len(merges_finais)}">{bloco}</mergeCells>' + sufixo
+        emitir(sufixo)
+        if buffer:
+            destino.write("".join(buffer).encode("utf-8"))
+        return totais
+
+    # ──────────────────────────────────────────────
+    #  LINHAS
+    # ──────────────────────────────────────────────
+
+    def _linha_cabecalho(self, row: int) -> str:
+        raw = self.tpl.linhas[row]
+        alvos = {col: v for (r, col), v in self._cabecalho.items() if r == row}
+        if not alvos:
+            return raw
+        abertura = re.match(r'<row\b[^>]*?/?>', raw).group(0)
+        abertura = abertura[:-2] + ">" if abertura.endswith("/>") else abertura
+        celulas = self.tpl.celulas(row)
+        for col, (texto, bold) in alvos.items():
+            s_antigo = self._attr_s(celulas.get(col, ""))
+            xf = self._xf_cabecalho(s_antigo, bold)
+            celulas[col] = self._celula(row, col, texto, xf)
+        return abertura + "".join(celulas[c] for c in sorted(celulas)) + "</row>"
+
+    def _linha_item(self, row: int, row_data: Dict[str, Any], cols: Dict[str, str], numeros: Tuple[Optional[float], Optional[float]], altura: float, subtotal: Optional[Tuple[int, int]], base: Dict[int, str], valor_h: Optional[float] = None) -> str:
+        nivel, valores, formatos, fonte_total = self._conteudo_linha(row, row_data, cols, numeros, subtotal)
+
+        partes = []
+        for col in range(1, 9):
+            s_base = self._attr_s(base.get(col, ""))
+            xf = self._xf_nivel(nivel, col, s_base, formatos.get(col), fonte_total and col == 8)
+            partes.append(self._celula(row, col, valores.get(col), xf, valor_h if col == 8 else None))
+        # Colunas do template à direita da tabela permanecem como estavam
+        for col in sorted(c for c in base if c > 8):
+            partes.append(self._realocar(base[col], row))
+
+        return f'<row r="{row}" ht="{altura}" customHeight="1">' + "".join(partes) + "</row>"
+
+    def _linha_rodape(self, row_src: int, row_tgt: int, formulas: Dict[int, str], valores_h: Dict[int, float]) -> str:
+        tpl = self.tpl
+        raw = tpl.linhas.get(row_src, "")
+        m_ht = re.search(r'\bht="([^"]+)"', raw)
+        altura = 30.0 if row_tgt in formulas else (float(m_ht.group(1)) if m_ht else None)
+        celulas = {col: self._realocar(c, row_tgt) for col, c in tpl.celulas(row_src).items()}
+
+        if row_tgt in formulas:
+            s_base = self._attr_s(celulas.get(8, ""))
+            chave = ("rodape", s_base)
+            if chave not in self._xf_cache:
+                fonte = self.estilos_xml.adicionar("fonts", '<font><b val="1"/><sz val="10"/><name val="Arial"/></font>')
+                self._xf_cache[chave] = self.estilos_xml.xf_derivado(
+                    s_base, fontId=fonte, numFmtId=self.estilos_xml.num_fmt(self.FMT_CONTABIL))
+            celulas[8] = self._celula(row_tgt, 8, formulas[row_tgt], self._xf_cache[chave], valores_h.get(row_tgt))
+
+        attrs = f' ht="{altura}" customHeight="1"' if altura is not None else ""
+        return f'<row r="{row_tgt}"{attrs}>' + "".join(celulas[c] for c in sorted(celulas)) + "</row>"
+
+    def _estilos_base_area_dados(self, start_row: int) -> Dict[int, Dict[int, str]]:
+        """
+        Células do template na área de dados (row >= start_row), tal como ficam no
+        OrcamentoEngine depois de desfeitas as mesclagens: as células internas dos
+        ranges desaparecem e as demais mantêm estilo e conteúdo.
+        """
+        internas = set()
+        for min_c, min_r, max_c, max_r in self.tpl.merges:
+            if max_r >= start_row:
+                for r in range(min_r, max_r + 1):
+                    for c in range(min_c, max_c + 1):
+                        if (r, c) != (min_r, min_c):
+                            internas.add((r, c))
+        base: Dict[int, Dict[int, str]] = {}
+        for row in self.tpl.linhas:
+            if row < start_row:
+                continue
+            base[row] = {col: raw for col, raw in self.tpl.celulas(row).items() if (row, col) not in internas}
+        return base
+
+    # ──────────────────────────────────────────────
+    #  ESTILOS
+    # ──────────────────────────────────────────────
+
+    def _xf_nivel(self, nivel: str, col: int, s_base: int, formato: Optional[str], fonte_total: bool) -> int:
+        est = self.estilos_xml
+        num_fmt = est.num_fmt(formato) if formato else est.xf_attr(s_base, "numFmtId")
+        chave = ("nivel", nivel, col, num_fmt, fonte_total)
+        if chave in self._xf_cache:
+            return self._xf_cache[chave]
+
+        estilo = StyleCache.PALETA.get(nivel, StyleCache.PALETA["ITEM"])
+        if fonte_total:
+            fonte = est.adicionar("fonts", '<font><b val="1"/></font>')
+        else:
+            negrito = '<b val="1"/>' if estilo["bold"] else ''
+            fonte = est.adicionar("fonts", f'<font>{negrito}<sz val="{estilo["size"]}"/><name val="Arial"/></font>')
+        fill = est.adicionar("fills", f'<fill><patternFill patternType="solid"><fgColor rgb="00{estilo["bg"]}"/><bgColor rgb="00000000"/></patternFill></fill>')
+        borda = est.adicionar("borders", '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/></border>')
+        h = "center"
+        if col == 4: h = "left"
+        if col == 8: h = "right"
+        wrap = ' wrapText="1"' if col == 4 else ''
+        xf = est.adicionar("cellXfs",
+                           f'<xf numFmtId="{num_fmt}" fontId="{fonte}" fillId="{fill}" borderId="{borda}" xfId="0" '
+                           f'applyNumberFormat="1" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1">'
+                           f'<alignment horizontal="{h}" vertical="center"{wrap}/></xf>')
+        self._xf_cache[chave] = xf
+        return xf
+
+    def _xf_cabecalho(self, s_base: int, bold: bool) -> int:
+        """Mesma fonte do template (nome, tamanho e cor), com o negrito pedido."""
+        chave = ("cabecalho", s_base, bold)
+        if chave not in self._xf_cache:
+            est = self.estilos_xml
+            raw = est.fonte(est.xf_attr(s_base, "fontId"))
+            partes = ['<b val="1"/>' if bold else '']
+            for tag in ("sz", "color", "name"):
+                m = re.search(rf'<{tag}\b[^>]*/>', raw)
+                if m:
+                    partes.append(m.group(0))
+            fonte = est.adicionar("fonts", f'<font>{"".join(partes)}</font>')
+            self._xf_cache[chave] = est.xf_derivado(s_base, fontId=fonte)
+        return self._xf_cache[chave]
+
+    # ──────────────────────────────────────────────
+    #  CÉLULAS
+    # ──────────────────────────────────────────────
+
+    @staticmethod
+    def _attr_s(celula_raw: str) -> int:
+        m = _RE_ATTR_S.search(celula_raw)
+        return int(m.group(1)) if m else 0
+
+    @staticmethod
+    def _realocar(celula_raw: str, row: int) -> str:
+        """Move uma célula do template para outra linha (fórmulas são copiadas tal como estão)."""
+        celula_raw = _RE_REF.sub(lambda m: f'r="{m.group(1)}{row}"', celula_raw, count=1)
+        # Fórmulas partilhadas não sobrevivem à mudança de linha: fica o valor em cache
+        celula_raw = re.sub(r'<f\b[^>]*\bt="shared"[^>]*/>', '', celula_raw)
+        return re.sub(r'<f\b([^>]*?)\s*\bt="shared"[^>]*>', r'<f\1>', celula_raw)
+
+    @staticmethod
+    def _celula(row: int, col: int, valor: Any, xf: int, cache: Optional[float] = None) -> str:
+        ref = f'{get_column_letter(col)}{row}'
+        if valor is None or valor == '':
+            return f'<c r="{ref}" s="{xf}"/>'
+        if isinstance(valor, bool):
+            return f'<c r="{ref}" s="{xf}" t="b"><v>{int(valor)}</v></c>'
+        if isinstance(valor, numbers.Number):
+            if isinstance(valor, float) and (math.isnan(valor) or math.isinf(valor)):
+                return f'<c r="{ref}" s="{xf}"/>'
+            return f'<c r="{ref}" s="{xf}"><v>{repr(float(valor)) if isinstance(valor, float) else int(valor)}</v></c>'
+        texto = ILLEGAL_CHARACTERS_RE.sub('', str(valor))
+        if texto.startswith('=') and len(texto) > 1:
+            v = f'<v>{repr(float(cache))}</v>' if cache is not None else ''
+            return f'<c r="{ref}" s="{xf}"><f>{escape(texto[1:])}</f>{v}</c>'
+        return f'<c r="{ref}" s="{xf}" t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
@@ -123,4 +123,7 @@ def iniciar():
 
 
 if __name__ == "__main__":
+    # Necessário para os processos do GeradorLote no executável (PyInstaller)
+    import multiprocessing
+    multiprocessing.freeze_support()
     iniciar()
\ No newline at end of file
@@ -0,0 +1,34 @@
+import pytest
+import sys
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.atomic_output import SaidaAtomica
+
+
+def test_saida_atomica_nomes_concorrentes(tmp_path):
+    pasta = str(tmp_path)
+    barreira = threading.Barrier(4)
+
+    def gerar(i):
+        with SaidaAtomica(pasta, "Orcamento") as saida:
+            barreira.wait()  # as quatro gerações com o nome reservado ao mesmo tempo
+            with open(saida.temporario, "w") as f:
+                f.write(str(i))
+            # Até concluir, o nome final não existe
+            assert not os.path.exists(saida.caminho)
+            return saida.concluir()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        caminhos = list(pool.map(gerar, range(4)))
+    assert len(set(caminhos)) == 4
+    assert sorted(os.listdir(pasta)) == sorted(os.path.basename(c) for c in caminhos)
+
+    # Sem concluir (erro na geração), não sobra temporário nem lock
+    with pytest.raises(RuntimeError):
+        with SaidaAtomica(pasta, "Falhou") as saida:
+            raise RuntimeError()
+    assert not [n for n in os.listdir(pasta) if "Falhou" in n]
@@ -0,0 +1,43 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.batch import GeradorLote, JobOrcamento
+
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+class _DBFalso:
+    def __init__(self):
+        self.registros = []
+
+    montar_registro = staticmethod(lambda info, linhas, arquivo, duracao, valor_total, tempos=None: {"valor_total": valor_total, "nome_obra": info["nome_arquivo"], "arquivo_saida": arquivo})
+
+    def inserir_orcamento(self, dados):
+        self.registros.append(dados)
+
+def test_gerador_lote(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active["D3"] = "DESCRIÇÃO"
+    wb.save(modelo)
+
+    linhas = [{"ITEM": "1", "DESCRICAO": "TITULO", "_NIVEL_FORCADO": "N1"},
+              {"ITEM": "1.1", "DESCRICAO": "SERVIÇO", "QUANT": "2,5", "UNIT": "10", "_NIVEL_FORCADO": "ITEM"}]
+    jobs = [JobOrcamento(linhas, MAPA, {"nome_arquivo": "Lote"}, modelo),
+            JobOrcamento(linhas, MAPA, {"nome_arquivo": "Lote", "motor": "XML"}, modelo),
+            JobOrcamento(linhas, MAPA, {"nome_arquivo": "Falha"}, str(tmp_path / "inexistente.xlsx"))]
+    db = _DBFalso()
+
+    resultados = GeradorLote(max_workers=2, db_manager=db).gerar(jobs)
+
+    assert [r.indice for r in resultados] == [0, 1, 2]
+    assert resultados[0].ok and resultados[1].ok and not resultados[2].ok
+    assert resultados[0].msg != resultados[1].msg  # nomes repetidos não colidem
+    assert all(os.path.exists(r.msg) for r in resultados[:2])
+    assert len(db.registros) == 2
+    assert all(r["valor_total"] == 25.0 for r in db.registros)  # 2,5 x 10 sem BDI
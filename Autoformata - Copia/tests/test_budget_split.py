@@ -0,0 +1,76 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.excel_handler import OrcamentoEngine
+from core.budget_split import GeradorPorCapitulo
+
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+def test_divisao_por_capitulo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active["D3"] = "DESCRIÇÃO"
+    wb.save(modelo)
+
+    linhas = [{"ITEM": "0.1", "DESCRICAO": "SOLTO", "QUANT": 1, "UNIT": 1, "_NIVEL_FORCADO": "ITEM"}]
+    for c in range(1, 4):
+        linhas.append({"ITEM": str(c), "DESCRICAO": f"CAPITULO {c}", "_NIVEL_FORCADO": "N1"})
+        linhas += [{"ITEM": f"{c}.{i}", "DESCRICAO": "SERVIÇO", "QUANT": "2,5", "UNIT": c * 10, "_NIVEL_FORCADO": "ITEM"}
+                   for i in range(1, 4)]
+    info = {"nome_arquivo": "Grande", "dividir_linhas": 10, "bdi": 0.0}
+
+    assert GeradorPorCapitulo.precisa_dividir(linhas, info, MAPA)
+    assert not GeradorPorCapitulo.precisa_dividir(linhas, {"dividir_linhas": 0, "dividir_bytes": 0})
+    assert [len(p) for p in GeradorPorCapitulo.capitulos(linhas)] == [5, 4, 4]
+
+    ok, resumo, extra_info = GeradorPorCapitulo(OrcamentoEngine({})).gerar_excel_final(linhas, modelo, MAPA, info)
+    assert ok and len(extra_info['partes']) == 3
+    assert all(os.path.exists(p) for p in extra_info['partes'])
+    assert extra_info['valor_total'] == 1 + 3 * 25 + 3 * 50 + 3 * 75
+
+    ws = openpyxl.load_workbook(resumo, data_only=True).active
+    assert [ws.cell(r, 2).value for r in (4, 5, 6)] == ["CAPITULO 1", "CAPITULO 2", "CAPITULO 3"]
+    assert ws["F7"].value == extra_info['valor_total']
+
+def test_totais_divididos_iguais_ao_inteiro(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active["D3"] = "DESCRIÇÃO"
+    wb.save(modelo)
+
+    # BDI e desconto arredondados por capítulo perderiam um centavo na soma
+    linhas = []
+    for c in (1, 2):
+        linhas.append({"ITEM": str(c), "DESCRICAO": f"CAPITULO {c}", "_NIVEL_FORCADO": "N1"})
+        linhas.append({"ITEM": f"{c}.1", "DESCRICAO": "SERVIÇO", "QUANT": 1, "UNIT": 1.03, "_NIVEL_FORCADO": "ITEM"})
+    info = {"nome_arquivo": "Contrato", "bdi": 0.2882}
+
+    ok, _, inteiro = OrcamentoEngine({}).gerar_excel_final(linhas, modelo, MAPA, info)
+    assert ok and inteiro['totais']['total_bdi'] == 0.59 and inteiro['totais']['total_geral'] == 2.65
+
+    ok, resumo, dividido = GeradorPorCapitulo(OrcamentoEngine({})).gerar_excel_final(linhas, modelo, MAPA, {**info, "dividir_linhas": 2})
+    assert ok and len(dividido['partes']) == 2
+    assert dividido['totais'] == inteiro['totais']
+    assert dividido['valor_total'] == inteiro['valor_total']
+
+    ws = openpyxl.load_workbook(resumo, data_only=True).active
+    assert [ws.cell(6, col).value for col in range(4, 9)] == list(inteiro['totais'].values())
+    formulas = openpyxl.load_workbook(resumo)
+    ws_f = formulas.active
+    assert ws_f["E6"].value == "=ROUNDDOWN(D6*0.2882, 2)" and ws_f["G6"].value == "=ROUNDDOWN(F6*0.19, 2)"
+
+    # Os totais de cada capítulo são referências ao rodapé do arquivo do capítulo
+    assert [l.file_link.Target for l in formulas._external_links] == [os.path.basename(p) for p in dividido['partes']]
+    for n, parte in enumerate(dividido['partes'], start=1):
+        ws_parte = openpyxl.load_workbook(parte, data_only=True).active
+        for col in range(4, 9):
+            ref = ws_f.cell(3 + n, col).value
+            assert ref.startswith(f"='[{n}]{ws_parte.title}'!$H$")
+            assert ws.cell(3 + n, col).value == ws_parte[ref.split("!")[1].replace("$", "")].value
@@ -0,0 +1,82 @@
+import pytest
+import sys
+import os
+import shutil
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.excel_handler import OrcamentoEngine
+from core.consolidation import Consolidador, ler_resumo
+
+MODELO = os.path.join(os.path.dirname(__file__), '..', 'config', 'templates', 'MODELO_SUP(2025).xlsx')
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+def test_consolidacao_de_orcamentos_gerados(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "MODELO_SUP.xlsx")
+    shutil.copy(MODELO, modelo)
+
+    linhas = [{"ITEM": "1", "DESCRICAO": "SERVIÇOS PRELIMINARES", "_NIVEL_FORCADO": "N1"},
+              {"ITEM": "1.1", "DESCRICAO": "PLACA", "QUANT": 2, "UNIT": 50, "_NIVEL_FORCADO": "ITEM"},
+              {"ITEM": "2", "DESCRICAO": "PINTURA", "_NIVEL_FORCADO": "N1"},
+              {"ITEM": "2.1", "DESCRICAO": "LÁTEX", "QUANT": 10, "UNIT": 10, "_NIVEL_FORCADO": "ITEM"}]
+    for nome, campus, data in (("A", "BELÉM", "10/03/2026"), ("B", "CASTANHAL", "12/03/2026"), ("C", "BELÉM", "01/04/2026")):
+        info = {"nome_arquivo": nome, "campus": campus, "data": data, "bdi": 0.0}
+        ok, _, _ = OrcamentoEngine({}).gerar_excel_final(linhas, modelo, MAPA, info)
+        assert ok
+
+    resumo = ler_resumo(str(tmp_path / "Output" / "A.xlsx"))
+    assert resumo.cabecalho["campus"] == "BELÉM" and resumo.cabecalho["data"] == "10/03/2026"
+    assert [(c[1], c[2]) for c in resumo.capitulos] == [("SERVIÇOS PRELIMINARES", 100.0), ("PINTURA", 100.0)]
+    assert resumo.totais["total_geral"] == 200.0
+    outro = str(tmp_path / "outro.xlsx")
+    openpyxl.Workbook().save(outro)
+    assert ler_resumo(outro) is None
+
+    caminhos = Consolidador.arquivos(str(tmp_path / "Output"))
+    assert [os.path.basename(c) for c in caminhos] == ["A.xlsx", "B.xlsx", "C.xlsx"]
+    caminho, n = Consolidador(1).consolidar(caminhos, str(tmp_path / "Output"), campus="belém", mes="03/2026")
+    assert n == 1 and os.path.basename(caminho) == "CONSOLIDADO.xlsx"
+    # O próprio resumo não entra numa consolidação seguinte
+    assert len(Consolidador.arquivos(str(tmp_path / "Output"))) == 3
+
+    caminho, n = Consolidador(1).consolidar(caminhos, str(tmp_path / "Output"))
+    wb = openpyxl.load_workbook(caminho, data_only=True)
+    orcamentos = list(wb["ORÇAMENTOS"].iter_rows(values_only=True))
+    assert n == 3 and [r[0] for r in orcamentos[1:]] == ["A.xlsx", "B.xlsx", "C.xlsx", "TOTAL"]
+    assert orcamentos[-1][-3] == 600.0  # Total Geral
+    assert wb["CAPÍTULOS"].max_row == 1 + 3 * 2
+    assert openpyxl.load_workbook(caminho)["ORÇAMENTOS"]["L5"].value == "=SUM(L2:L4)"
+
+def test_orcamento_dividido_conta_uma_vez(tmp_path, monkeypatch):
+    from core.budget_split import GeradorPorCapitulo
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "MODELO_SUP.xlsx")
+    shutil.copy(MODELO, modelo)
+
+    linhas = []
+    for c in (1, 2, 3):
+        linhas.append({"ITEM": str(c), "DESCRICAO": f"CAPITULO {c}", "_NIVEL_FORCADO": "N1"})
+        linhas.append({"ITEM": f"{c}.1", "DESCRICAO": "SERVIÇO", "QUANT": 1, "UNIT": 100 * c, "_NIVEL_FORCADO": "ITEM"})
+    info = {"nome_arquivo": "Grande", "campus": "BELÉM", "data": "10/03/2026", "bdi": 0.0, "dividir_linhas": 2}
+    ok, resumo, extra_info = GeradorPorCapitulo(OrcamentoEngine({})).gerar_excel_final(linhas, modelo, MAPA, info)
+    assert ok and len(extra_info['partes']) == 3
+    ok, _, _ = OrcamentoEngine({}).gerar_excel_final(linhas[:2], modelo, MAPA, {**info, "nome_arquivo": "Pequeno"})
+    assert ok
+    # Temporários do controller na mesma pasta
+    openpyxl.Workbook().save(str(tmp_path / "Output" / "temp_sintetico_limpo.xlsx"))
+
+    pasta = str(tmp_path / "Output")
+    assert [os.path.basename(c) for c in Consolidador.arquivos(pasta)] == ["Grande_RESUMO.xlsx", "Pequeno.xlsx"]
+
+    dividido = ler_resumo(resumo)
+    assert dividido.cabecalho["campus"] == "BELÉM"
+    assert [(c[1], c[2]) for c in dividido.capitulos] == [("CAPITULO 1", 100.0), ("CAPITULO 2", 200.0), ("CAPITULO 3", 300.0)]
+    assert dividido.totais["total_geral"] == extra_info['valor_total'] == 600.0
+
+    caminho, n = Consolidador(1).consolidar(Consolidador.arquivos(pasta), pasta, campus="belém")
+    orcamentos = list(openpyxl.load_workbook(caminho, data_only=True)["ORÇAMENTOS"].iter_rows(values_only=True))
+    assert n == 2 and [r[0] for r in orcamentos[1:]] == ["Grande_RESUMO.xlsx", "Pequeno.xlsx", "TOTAL"]
+    assert orcamentos[-1][-3] == 700.0
@@ -0,0 +1,43 @@
+import pytest
+import sys
+import os
+import csv
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML
+from core.data_export import CAMPOS
+
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+@pytest.mark.parametrize("motor", [OrcamentoEngine, OrcamentoEngineXML])
+def test_exportacao_das_linhas_classificadas(tmp_path, monkeypatch, motor):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active["D3"] = "DESCRIÇÃO"
+    wb.save(modelo)
+
+    linhas = [{"ITEM": "1", "DESCRICAO": "CAPITULO", "_NIVEL_FORCADO": "N1"},
+              {"ITEM": "1.1", "CODIGO": 1234.0, "BANCO": "SINAPI", "DESCRICAO": "PINTURA", "UNID": "m2",
+               "QUANT": "2,5", "UNIT": "R$ 10,01", "_NIVEL_FORCADO": "ITEM"},
+              {"ITEM": "1.2", "DESCRICAO": "SEM PREÇO", "UNID": "un", "QUANT": 3, "_NIVEL_FORCADO": "ITEM"}]
+
+    ok, caminho, extra_info = motor({}).gerar_excel_final(linhas, modelo, MAPA, {"nome_arquivo": "Dados", "exportar_dados": "CSV"})
+    assert ok and os.path.basename(extra_info['dados']) == "Dados.csv"
+    with open(extra_info['dados'], encoding="utf-8", newline="") as f:
+        registros = list(csv.DictReader(f))
+    assert list(registros[0]) == CAMPOS
+    assert [r["nivel"] for r in registros] == ["N1", "ITEM", "ITEM"]
+    assert registros[0]["total"] == "25.02" and registros[0]["quantidade"] == ""
+    assert registros[1]["codigo"] == "1234" and registros[1]["preco_unitario"] == "10.01"
+
+    ok, _, extra_info = motor({}).gerar_excel_final(linhas, modelo, MAPA, {"nome_arquivo": "Dados", "exportar_dados": "JSONL"})
+    with open(extra_info['dados'], encoding="utf-8") as f:
+        registros = [json.loads(linha) for linha in f]
+    assert registros[2] == {"nivel": "ITEM", "item": "1.2", "codigo": None, "banco": None, "descricao": "SEM PREÇO",
+                            "unidade": "un", "quantidade": 3.0, "preco_unitario": None, "total": 0.0}
@@ -30,3 +30,106 @@ def test_aplicar_precisao():
     assert engine._aplicar_precisao(10.559, "TRUNC") == 10.55
     assert engine._aplicar_precisao(10.559, "ROUND") == 10.56
     assert engine._aplicar_precisao(10.559, "EXACT") == 10.559
+
+def test_estilo_hierarquico_cache():
+    import openpyxl
+    from core.style_cache import StyleCache
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    cache = StyleCache(wb)
+    ws.cell(1, 7).number_format = '"R$ "#,##0.00'
+
+    for row in (1, 2):
+        for col in range(1, 9):
+            cache.aplicar(ws.cell(row, col), "N1" if row == 1 else "ITEM", col)
+
+    assert ws.cell(1, 1).fill.fgColor.rgb == "009BC2E6"
+    assert ws.cell(1, 1).font.b is True
+    assert ws.cell(2, 1).font.sz == 10
+    assert ws.cell(1, 4).alignment.horizontal == "left"
+    assert ws.cell(1, 4).alignment.wrap_text is True
+    assert ws.cell(1, 7).number_format == '"R$ "#,##0.00'
+    # Cada célula recebe a sua cópia do StyleArray
+    ws.cell(2, 8).number_format = '0.00'
+    assert ws.cell(2, 7).number_format == 'General'
+
+def test_conversao_vetorizada_igual_escalar():
+    import numpy as np
+    from core.number_parser import converter_coluna, aplicar_precisao, para_lista
+
+    engine = OrcamentoEngine({})
+    valores = [5, 10.55, "R$ 1.500,20", "  R$  30 ", "1.234.567,89", "nan", "None", "", None,
+               float('nan'), "abc", "2,5", "1.500", True, np.int64(7), 25891.675, 0.285, "1_000"]
+
+    for modo in ("TRUNC", "ROUND", "EXACT"):
+        vetor = para_lista(aplicar_precisao(converter_coluna(valores), modo))
+        escalar = [engine._aplicar_precisao(engine._parse_num(v), modo) for v in valores]
+        assert vetor == escalar
+
+def test_arvore_hierarquia():
+    from core.hierarquia import ArvoreHierarquia
+
+    niveis = ["N1", "N2", "ITEM", "ITEM", "N2", "N3", "ITEM", "N1", "N2", "N1", "ITEM"]
+    mapa = [{'row': 25 + i, 'nivel': n} for i, n in enumerate(niveis)]
+    arvore = ArvoreHierarquia(mapa)
+
+    assert arvore.intervalos() == {25: (26, 31), 26: (27, 28), 29: (30, 31), 30: (31, 31), 32: (33, 33), 34: (35, 35)}
+    assert [n.row for n in arvore.raizes] == [25, 32, 34]
+    assert [f.row for f in arvore.raizes[0].filhos] == [26, 29]
+    assert arvore.raizes[0].filhos[0].itens == [27, 28]
+    assert arvore.raizes[1].filhos[0].primeira is None  # N2 sem filhos não recebe SUBTOTAL
+
+def test_avaliador_formulas():
+    from core.formula_eval import rounddown, AvaliadorOrcamento
+    from core.hierarquia import ArvoreHierarquia
+
+    assert rounddown(0.29) == 0.29  # 0.29 * 100 = 28.999... em binário
+    assert rounddown(10.559) == 10.55
+    assert rounddown(-1.239) == -1.23
+
+    niveis = ["N1", "ITEM", "ITEM", "N1", "ITEM"]
+    av = AvaliadorOrcamento(25, niveis, [None, 2.5, 3, None, None], [None, 10.559, 1.1, None, 7])
+    av.subtotais(ArvoreHierarquia([{'row': 25 + i, 'nivel': n} for i, n in enumerate(niveis)]))
+    totais = av.rodape([30, 31, 32, 33, 34], 0.2882, 0.19)
+
+    assert av.valores[26] == 26.39 and av.valores[27] == 3.3 and av.valores[29] == 0.0
+    assert av.valores[25] == 29.69
+    assert totais["total_sem_bdi"] == 29.69
+    assert totais["total_bdi"] == 8.55
+    assert totais["total_geral"] == 38.24
+    assert totais["desconto"] == 7.26
+    assert totais["total_com_desconto"] == 30.98
+
+def test_estimador_altura():
+    from core.row_height import EstimadorAltura, largura_coluna_px
+
+    # Coluna D do MODELO SUP (130,57 caracteres de Calibri 11 = 914 px)
+    assert largura_coluna_px(130.5703125, "Calibri", 11) == 914
+    est = EstimadorAltura(914)
+
+    assert est.altura("PINTURA", 24.75) == 24.75
+    assert est.linhas("X" * 102) == 1 and est.linhas("X" * 103) == 2
+    assert est.linhas("i" * 300) == 1  # letras estreitas cabem mais por linha
+    assert est.linhas("LINHA 1\nLINHA 2\nLINHA 3") == 3
+    assert est.altura(" ".join(["ALVENARIA"] * 40), 24.75) == 4 * 12.75
+    assert est.linhas(" ".join(["ALVENARIA"] * 110), 11, True) > est.linhas(" ".join(["ALVENARIA"] * 110))
+
+def test_perfis_gravacao(tmp_path):
+    import openpyxl
+    from core.formula_eval import salvar_com_valores, nivel_compressao
+
+    assert nivel_compressao("fast") == 1 and nivel_compressao("COMPACT") == 9
+    assert nivel_compressao(None) == nivel_compressao("desconhecido") == 6
+
+    wb = openpyxl.Workbook()
+    for r in range(1, 2001):
+        wb.active.cell(r, 1, f"SERVIÇO {r % 37}")
+        wb.active.cell(r, 2, f"=A{r}")
+    tamanhos = {}
+    for perfil in ("FAST", "COMPACT"):
+        caminho = str(tmp_path / f"{perfil}.xlsx")
+        salvar_com_valores(wb, caminho, {"B1": 1.5}, nivel_compressao(perfil))
+        tamanhos[perfil] = os.path.getsize(caminho)
+        assert openpyxl.load_workbook(caminho, data_only=True).active["B1"].value == 1.5
+    assert tamanhos["COMPACT"] <= tamanhos["FAST"]
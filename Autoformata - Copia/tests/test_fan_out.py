@@ -0,0 +1,39 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.fan_out import GeradorMultiModelo
+
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+def test_mesmo_orcamento_em_varios_templates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelos = []
+    for nome, linha_cabecalho in (("MODELO_A", 3), ("MODELO_B", 6)):
+        wb = openpyxl.Workbook()
+        wb.active[f"D{linha_cabecalho}"] = "DESCRIÇÃO"
+        wb.active.column_dimensions["D"].width = 20 * linha_cabecalho
+        modelos.append(str(tmp_path / f"{nome}.xlsx"))
+        wb.save(modelos[-1])
+
+    linhas = [{"ITEM": "1", "DESCRICAO": "CAPITULO", "_NIVEL_FORCADO": "N1"}]
+    linhas += [{"ITEM": f"1.{i}", "DESCRICAO": "SERVIÇO " * 10, "QUANT": "2,5", "UNIT": 10, "_NIVEL_FORCADO": "ITEM"}
+               for i in range(1, 4)]
+    info = {"nome_arquivo": "Multi", "bdi": 0.0}
+
+    resultados = GeradorMultiModelo().gerar(linhas, modelos + [str(tmp_path / "NAO_EXISTE.xlsx")], MAPA, info)
+    assert [r.ok for r in resultados] == [True, True, False]
+    assert [os.path.basename(r.msg) for r in resultados[:2]] == ["Multi_MODELO_A.xlsx", "Multi_MODELO_B.xlsx"]
+    assert all(r.extra_info['valor_total'] == 75.0 for r in resultados[:2])
+
+    # Mesma árvore preparada uma vez, deslocada para a linha inicial de cada template
+    ws_a = openpyxl.load_workbook(resultados[0].msg).active
+    ws_b = openpyxl.load_workbook(resultados[1].msg).active
+    assert ws_a["H4"].value == "=SUBTOTAL(9, H5:H7)"
+    assert ws_b["H7"].value == "=SUBTOTAL(9, H8:H10)"
+    # Coluna D mais larga no segundo template: menos quebras na descrição
+    assert ws_a.row_dimensions[5].height > ws_b.row_dimensions[8].height
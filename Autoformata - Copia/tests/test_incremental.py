@@ -0,0 +1,47 @@
+import pytest
+import sys
+import os
+import shutil
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.excel_handler import OrcamentoEngine
+from core.incremental import RegeneradorIncremental
+
+MODELO = os.path.join(os.path.dirname(__file__), '..', 'config', 'templates', 'MODELO_SUP(2025).xlsx')
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+def test_regeneracao_corrige_arquivo_anterior(tmp_path, monkeypatch):
+    modelo = str(tmp_path / "modelo.xlsx")
+    shutil.copy(MODELO, modelo)
+    monkeypatch.chdir(tmp_path)
+    RegeneradorIncremental.limpar()
+
+    linhas = []
+    for c in range(1, 3):
+        linhas.append({"ITEM": str(c), "DESCRICAO": f"CAPITULO {c}", "_NIVEL_FORCADO": "N1"})
+        linhas += [{"ITEM": f"{c}.{i}", "DESCRICAO": "SERVIÇO", "UNID": "m2", "QUANT": 2, "UNIT": 10, "_NIVEL_FORCADO": "ITEM"}
+                   for i in range(1, 5)]
+    info = {"nome_arquivo": "Inc", "setor": "TI", "bdi": 0.0}
+
+    ok, caminho, extra_info = RegeneradorIncremental(OrcamentoEngine({})).gerar_excel_final(linhas, modelo, MAPA, info)
+    assert ok and 'incremental' not in extra_info
+
+    # Um campo do cabeçalho e uma quantidade: só essas linhas (e os totais) são reescritas
+    linhas[2] = {**linhas[2], "QUANT": 5}
+    ok, caminho2, extra_info = RegeneradorIncremental(OrcamentoEngine({})).gerar_excel_final(linhas, modelo, MAPA, {**info, "setor": "OBRAS"})
+    assert ok and caminho2 == caminho
+    assert extra_info['incremental'] == {'linhas': 2}
+    assert extra_info['valor_total'] == 190.0
+
+    ws = openpyxl.load_workbook(caminho, data_only=True).active
+    assert ws["A9"].value == "SETOR:  OBRAS"
+    assert ws["F27"].value == 5 and ws["H27"].value == 50.0
+    assert ws["H25"].value == 110.0
+    assert ws.row_dimensions[27].height == ws.row_dimensions[26].height
+
+    # Linha nova: as posições mudam e a geração volta a ser completa
+    ok, _, extra_info = RegeneradorIncremental(OrcamentoEngine({})).gerar_excel_final(linhas + linhas[-1:], modelo, MAPA, info)
+    assert ok and 'incremental' not in extra_info
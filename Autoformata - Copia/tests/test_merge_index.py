@@ -0,0 +1,40 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.merge_index import MergeIndex
+
+def _planilha():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.merge_cells("A1:C2")
+    ws.merge_cells("E1:H1")
+    ws.merge_cells("A33:H51")
+    return ws
+
+def test_encontrar():
+    idx = MergeIndex(_planilha())
+
+    assert idx.encontrar(2, 3).coord == "A1:C2"
+    assert idx.encontrar(1, 8).coord == "E1:H1"
+    assert idx.encontrar(40, 4).coord == "A33:H51"
+    assert idx.encontrar(1, 4) is None
+    assert idx.encontrar(3, 1) is None
+    assert [m.coord for m in idx.na_linha(1)] == ["A1:C2", "E1:H1"]
+
+def test_mesclar_desmesclar_mantem_indice():
+    ws = _planilha()
+    idx = MergeIndex(ws)
+
+    idx.desmesclar(idx.encontrar(1, 1))
+    assert idx.encontrar(2, 2) is None
+    assert "A1:C2" not in [m.coord for m in ws.merged_cells.ranges]
+    assert not isinstance(ws.cell(2, 2), openpyxl.cell.cell.MergedCell)
+
+    idx.mesclar("B5:D6")
+    assert idx.encontrar(6, 4).coord == "B5:D6"
+    assert isinstance(ws.cell(6, 4), openpyxl.cell.cell.MergedCell)
+    assert len(idx) == 3
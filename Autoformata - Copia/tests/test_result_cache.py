@@ -0,0 +1,85 @@
+import pytest
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.excel_handler import OrcamentoEngine
+from core.disk_cache import DiskCache
+from core.result_cache import CacheGeracao, chave_geracao
+from core.template_cache import sha256_arquivo
+
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+class _MotorContado(OrcamentoEngine):
+    chamadas = 0
+
+    def gerar_excel_final(self, *args, **kwargs):
+        _MotorContado.chamadas += 1
+        return super().gerar_excel_final(*args, **kwargs)
+
+def test_cache_de_resultados(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active["D3"] = "DESCRIÇÃO"
+    wb.save(modelo)
+    linhas = [{"ITEM": "1", "DESCRICAO": "CAPITULO", "_NIVEL_FORCADO": "N1"},
+              {"ITEM": "1.1", "DESCRICAO": "SERVIÇO", "QUANT": "2,5", "UNIT": 10, "_NIVEL_FORCADO": "ITEM"}]
+    info = {"nome_arquivo": "Primeiro", "bdi": 0.0, "exportar_dados": "CSV"}
+    cache = CacheGeracao(_MotorContado({}), DiskCache(tmp_path / "cache"))
+
+    ok, primeiro, extra_info = cache.gerar_excel_final(linhas, modelo, MAPA, info)
+    assert ok and extra_info['cache']['acerto'] is False and _MotorContado.chamadas == 1
+
+    # Mesmas entradas com outro nome de arquivo: cópia do cache, sem motor
+    ok, segundo, extra_info = cache.gerar_excel_final(linhas, modelo, MAPA, {**info, "nome_arquivo": "Segundo"})
+    assert ok and extra_info['cache']['acerto'] is True and _MotorContado.chamadas == 1
+    assert os.path.basename(segundo) == "Segundo.xlsx" and sha256_arquivo(segundo) == sha256_arquivo(primeiro)
+    assert extra_info['valor_total'] == 25.0 and os.path.basename(extra_info['dados']) == "Segundo.csv"
+    assert list(extra_info['tempos']['fases']) == ["cache"]
+
+    # Qualquer mudança nas entradas ou no template muda a chave
+    chave = chave_geracao(linhas, modelo, MAPA, info)
+    assert chave == chave_geracao(linhas, modelo, MAPA, {**info, "nome_arquivo": "Outro", "gerar_pdf": 1})
+    assert chave != chave_geracao(linhas[:1], modelo, MAPA, info)
+    assert chave != chave_geracao(linhas, modelo, MAPA, {**info, "bdi": 0.25})
+
+    # PDF convertido uma vez e depois copiado da mesma entrada
+    def converter(caminho):
+        destino = os.path.splitext(caminho)[0] + ".pdf"
+        with open(destino, "wb") as f:
+            f.write(b"%PDF-1.4 teste")
+        return True, destino, "ok"
+    assert cache.pdf(segundo, extra_info, converter)[0]
+    ok_pdf, caminho_pdf, mensagem = cache.pdf(primeiro, extra_info, lambda c: (False, "", "não devia converter"))
+    assert ok_pdf and caminho_pdf.endswith("Primeiro.pdf") and mensagem == "PDF copiado do cache"
+
+    # Entrada corrompida não é usada: gera de novo e substitui
+    entrada = cache.cache.obter(chave)
+    with open(entrada.arquivos["xlsx"], "r+b") as f:
+        f.write(b"XX")
+    ok, _, extra_info = cache.gerar_excel_final(linhas, modelo, MAPA, info)
+    assert ok and extra_info['cache']['acerto'] is False and _MotorContado.chamadas == 2
+    assert cache.cache.obter(chave) is not None
+
+def test_expulsao_por_idade_e_tamanho(tmp_path):
+    arquivo = tmp_path / "dados.bin"
+    arquivo.write_bytes(b"x" * 1000)
+    cache = DiskCache(tmp_path / "cache", limite_bytes=10 ** 6)
+    for i, chave in enumerate(("aa01", "bb02", "cc03")):
+        assert cache.guardar(chave, {"bin": str(arquivo)})
+        meta = os.path.join(cache.pasta, chave[:2], chave, "meta.json")
+        os.utime(meta, (time.time() - 100 + i, time.time() - 100 + i))
+    cache.obter("aa01")  # acesso recente: "aa01" passa a ser a mais usada
+
+    cache.limite_bytes = cache.tamanho() - 500  # cabe tudo menos uma entrada
+    assert cache.expulsar() == 1
+    assert cache.obter("bb02") is None and cache.obter("aa01") and cache.obter("cc03")
+
+    cache.idade_maxima_s = 50
+    os.utime(os.path.join(cache.pasta, "cc", "cc03", "meta.json"), (time.time() - 60, time.time() - 60))
+    assert cache.expulsar() == 1 and cache.obter("cc03") is None and cache.obter("aa01")
@@ -0,0 +1,48 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.revision_diff import comparar_arquivos
+
+MAPA = {"ITEM": "Item", "CODIGO": "Código", "BANCO": "Banco", "DESCRICAO": "Descrição",
+        "UNID": "Und", "QUANT": "Quant.", "UNIT": "Valor Unit"}
+
+def _sintetico(caminho, linhas):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["SINTÉTICO SIPAC"])
+    ws.append(["Item", "Código", "Banco", "Descrição", "Und", "Quant.", "Valor Unit"])
+    for linha in linhas:
+        ws.append(linha)
+    ws.append([None, None, None, "TOTAL SEM BDI", None, None, None])
+    ws.append([None, None, None, "LINHA DEPOIS DO RODAPÉ", "un", 1, 1])
+    wb.save(caminho)
+    return str(caminho)
+
+def test_diferenca_entre_revisoes(tmp_path):
+    v1 = _sintetico(tmp_path / "v1.xlsx", [
+        ["1", None, None, "PRELIMINARES", None, None, None],
+        ["1.1", 1001, "SINAPI", "PLACA", "m2", 2, "R$ 100,00"],
+        ["1.2", 1002, "SINAPI", "TAPUME", "m2", 10, 5],
+        ["2", None, None, "PINTURA", None, None, None],
+        ["2.1", 2001, "SINAPI", "LÁTEX", "m2", "1,5", 20],
+    ])
+    v2 = _sintetico(tmp_path / "v2.xlsx", [
+        ["1", None, None, "PRELIMINARES", None, None, None],
+        ["1.1", 1001.0, "SINAPI", "PLACA", "m2", 2, 100],      # mesmo item (código lido como float)
+        ["2", None, None, "PINTURA", None, None, None],
+        ["2.1", 2001, "SINAPI", "LÁTEX", "m2", 3, 20],
+        ["2.2", 2002, "ORSE", "MASSA CORRIDA", "m2", 3, 10],
+    ])
+
+    diff = comparar_arquivos(v1, v2, 1, MAPA)
+    assert [it.item for it in diff.removidos] == ["1.2"]
+    assert [(it.item, it.linha_excel) for it in diff.adicionados] == [("2.2", 7)]
+    assert [(a.depois.item, a.campos) for a in diff.alterados] == [("2.1", ["quantidade"])]
+    assert diff.capitulos["1"] == (250.0, 200.0)
+    assert diff.delta_capitulos() == {"1": -50.0, "2": 60.0}
+
+    assert comparar_arquivos(v1, v1, 1, MAPA).sem_alteracoes
@@ -0,0 +1,53 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.disk_cache import DiskCache
+from core.sanitizer import ExcelSanitizer
+from core.sanitize_cache import CacheSanitizados, chave_sanitizado
+from core.template_cache import sha256_arquivo
+
+def test_sintetico_ja_visto_nao_e_sanitizado(tmp_path):
+    original = str(tmp_path / "sintetico.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active.append(["Item", "Descrição", "Quant."])
+    wb.active.append(["1.1", "PLACA", 2])
+    wb.save(original)
+
+    chamadas = []
+    def sanitizar(origem, destino):
+        chamadas.append(origem)
+        ExcelSanitizer().reparar_pacote(origem, destino)
+
+    cache = CacheSanitizados(DiskCache(tmp_path / "cache"))
+    limpo = str(tmp_path / "limpo.xlsx")
+    chave, acerto = cache.limpar(original, limpo, sanitizar)
+    assert not acerto and len(chamadas) == 1
+    assert chave == chave_sanitizado(original)
+    primeiro = sha256_arquivo(limpo)
+
+    # Mesmo original (ex.: depois de reiniciar): cópia do cache, sem sanitizar
+    os.remove(limpo)
+    chave2, acerto = cache.limpar(original, limpo, sanitizar)
+    assert acerto and chave2 == chave and len(chamadas) == 1
+    assert sha256_arquivo(limpo) == primeiro
+
+    # Original alterado: outra chave, sanitiza de novo
+    wb.active.append(["1.2", "TAPUME", 3])
+    wb.save(original)
+    chave3, acerto = cache.limpar(original, limpo, sanitizar)
+    assert not acerto and chave3 != chave and len(chamadas) == 2
+
+def test_erro_ao_sanitizar_nao_entra_no_cache(tmp_path):
+    original = tmp_path / "sintetico.xls"
+    original.write_bytes(b"nao e um zip")
+    def falha(origem, destino):
+        raise ValueError("sem Excel")
+
+    cache = CacheSanitizados(DiskCache(tmp_path / "cache"))
+    with pytest.raises(ValueError):
+        cache.limpar(str(original), str(tmp_path / "limpo.xlsx"), falha)
+    assert cache.cache.tamanho() == 0
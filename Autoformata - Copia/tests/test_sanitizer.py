@@ -0,0 +1,90 @@
+import pytest
+import sys
+import os
+import re
+import zipfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+import pandas as pd
+from core.sanitizer import ExcelSanitizer
+from core.exceptions import DataExtractionError
+
+def _sintetico_sipac(caminho):
+    """Sintético com o que o SIPAC costuma deixar: fórmulas partilhadas, ligação externa, proteção e nomes quebrados."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Sintético"
+    ws.append(["ORÇAMENTO SINTÉTICO"])
+    ws.append([])
+    ws.append(["Item", "Código", "Banco", "Descrição", "Und", "Quant.", "Valor Unit", "Total", "Ref"])
+    ws.append(["1.1", 1001, "SINAPI", "PLACA", "m2", 2, 10, 20, 7])
+    ws.append(["1.2", 1002, "SINAPI", "TAPUME", "m2", 3, 5, 15])
+    ws.append(["1.3", 1003, "SINAPI", "PINTURA", "m2", 1.5, 4, 6])
+    wb.save(caminho)
+
+    with zipfile.ZipFile(caminho) as z:
+        partes = {n: z.read(n) for n in z.namelist()}
+    sheet = partes["xl/worksheets/sheet1.xml"].decode()
+    sheet = re.sub(r'(<c r="H4"[^>]*>)', r'\1<f t="shared" ref="H4:H6" si="0">F4*G4</f>', sheet)
+    sheet = re.sub(r'(<c r="H[56]"[^>]*>)', r'\1<f t="shared" si="0"/>', sheet)
+    sheet = re.sub(r'(<c r="I4"[^>]*>)', r'\1<f>[1]Plan1!A1</f>', sheet)
+    sheet = sheet.replace("</sheetData>", '</sheetData><sheetProtection sheet="1" objects="1" scenarios="1"/>')
+    partes["xl/worksheets/sheet1.xml"] = sheet.encode()
+
+    wbxml = partes["xl/workbook.xml"].decode()
+    wbxml = re.sub(r'<workbookProtection\b[^>]*/>', '<workbookProtection lockStructure="1"/>', wbxml)
+    wbxml = re.sub(r'<definedNames\b[^>]*/>', '', wbxml)
+    wbxml = wbxml.replace("</sheets>", '</sheets><externalReferences><externalReference r:id="rIdExt"/></externalReferences>'
+                          '<definedNames><definedName name="Quebrado">#REF!</definedName>'
+                          '<definedName name="Externo">[1]Plan1!$A$1</definedName>'
+                          '<definedName name="Velha">\'Planilha Velha\'!$A$1</definedName>'
+                          '<definedName name="Tabela">\'Sintético\'!$A$3:$H$6</definedName></definedNames>')
+    partes["xl/workbook.xml"] = wbxml.encode()
+    partes["xl/_rels/workbook.xml.rels"] = partes["xl/_rels/workbook.xml.rels"].decode().replace(
+        "</Relationships>", '<Relationship Id="rIdExt" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/externalLink" '
+        'Target="externalLinks/externalLink1.xml"/></Relationships>').encode()
+    partes["[Content_Types].xml"] = partes["[Content_Types].xml"].decode().replace(
+        "</Types>", '<Override PartName="/xl/externalLinks/externalLink1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.externalLink+xml"/></Types>').encode()
+    partes["xl/externalLinks/externalLink1.xml"] = (
+        b'<externalLink xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        b'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        b'<externalBook r:id="rId1"><sheetNames><sheetName val="Plan1"/></sheetNames></externalBook></externalLink>')
+    partes["xl/externalLinks/_rels/externalLink1.xml.rels"] = (
+        b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        b'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/externalLinkPath" '
+        b'Target="file:///C:/SIPAC/base.xlsx" TargetMode="External"/></Relationships>')
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as z:
+        for nome, dados in partes.items():
+            z.writestr(nome, dados)
+    return str(caminho)
+
+def test_reparacao_sem_excel(tmp_path):
+    original = _sintetico_sipac(tmp_path / "sipac.xlsx")
+    limpo = str(tmp_path / "limpo.xlsx")
+
+    relatorio = ExcelSanitizer().reparar_pacote(original, limpo)
+    assert relatorio == {'links_externos': 1, 'nomes_removidos': 3, 'protecoes': 2, 'formulas': 4}
+
+    with zipfile.ZipFile(limpo) as z:
+        assert not any(n.startswith("xl/externalLinks/") for n in z.namelist())
+        assert "externalLink" not in z.read("[Content_Types].xml").decode()
+        assert "externalLink" not in z.read("xl/_rels/workbook.xml.rels").decode()
+
+    # Mesmos valores para o pandas (que lê os valores em cache)
+    pd.testing.assert_frame_equal(pd.read_excel(original, header=2), pd.read_excel(limpo, header=2))
+
+    wb = openpyxl.load_workbook(limpo)
+    ws = wb.active
+    assert [ws[f"H{r}"].value for r in (4, 5, 6)] == [20, 15, 6] and ws["I4"].value == 7
+    assert not ws.protection.sheet and wb.security is None
+    assert list(wb.defined_names) == ["Tabela"] and not wb._external_links
+
+def test_arquivo_que_nao_e_xlsx(tmp_path):
+    xls = tmp_path / "antigo.xls"
+    xls.write_bytes(b"\xd0\xcf\x11\xe0 binario")
+    with pytest.raises(DataExtractionError):
+        ExcelSanitizer().reparar_pacote(str(xls), str(tmp_path / "limpo.xlsx"))
+    assert not os.path.exists(tmp_path / "limpo.xlsx")
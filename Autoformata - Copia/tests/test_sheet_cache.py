@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+import pandas as pd
+import core.sheet_cache as sheet_cache
+from core.disk_cache import DiskCache
+from core.sheet_cache import CacheTabelas
+from core.sipac_reader import ler_tabela
+
+def _sintetico(caminho):
+    """Cabeçalho na linha 3, linha em branco a meio, colunas repetidas e sem nome, tipos misturados."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["ORÇAMENTO SINTÉTICO"])
+    ws.append([None, "Campus", datetime.datetime(2025, 3, 1)])
+    ws.append(["Item", "Código", "Banco", "Descrição", None, "Quant.", "Quant.", " Valor Unit "])
+    ws.append(["1", None, None, "CAPÍTULO"])
+    ws.append(["1.1", 1001, "SINAPI", "PLACA", "m2", 2, "2,5", 10.25])
+    ws.append([])
+    ws.append(["1.2", "98765", "PRÓPRIO", "TAPUME", "m2", 3.0, "NA", "1.234,56"])
+    ws.append([None, None, None, "TOTAL GERAL", None, None, None, 1000])
+    wb.save(caminho)
+
+def test_mesmo_resultado_que_read_excel(tmp_path):
+    caminho = str(tmp_path / "sintetico.xlsx")
+    _sintetico(caminho)
+    tabelas = CacheTabelas()
+    for linha in range(0, 7):
+        pd.testing.assert_frame_equal(tabelas.tabela(caminho, linha), pd.read_excel(caminho, header=linha), check_exact=True)
+        pd.testing.assert_frame_equal(ler_tabela(caminho, linha, tabelas), ler_tabela(caminho, linha), check_exact=True)
+    assert tabelas.colunas(caminho, 2)[7] == "Valor Unit"
+
+def test_xlsx_lido_uma_vez(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "sintetico.xlsx")
+    _sintetico(caminho)
+    leituras = []
+    original = sheet_cache.ler_grade
+    monkeypatch.setattr(sheet_cache, "ler_grade", lambda c: leituras.append(c) or original(c))
+
+    disco = DiskCache(tmp_path / "cache")
+    tabelas = CacheTabelas(disco)
+    assert tabelas.colunas(caminho, 2)[:2] == ["Item", "Código"]
+    assert leituras == []  # só as primeiras linhas, a leitura completa fica para a tabela
+    tabelas.tabela(caminho, 2)
+    tabelas.tabela(caminho, 3)  # outra linha de cabeçalho: só fatia
+    assert tabelas.colunas(caminho, 4)[:2] == ["1.1", "1001"]
+    assert len(leituras) == 1
+
+    # A cópia devolvida não mexe na tabela guardada
+    df = tabelas.tabela(caminho, 2)
+    df.columns = ["x"] * len(df.columns)
+    assert tabelas.tabela(caminho, 2).columns[0] == "Item"
+
+    # Outro processo (ex.: depois de reiniciar) encontra a grade em disco
+    assert CacheTabelas(disco).tabela(caminho, 2).equals(tabelas.tabela(caminho, 2))
+    assert len(leituras) == 1
+
+    # Arquivo alterado: lido de novo
+    wb = openpyxl.load_workbook(caminho)
+    wb.active["D5"] = "PLACA DE OBRA"
+    wb.save(caminho)
+    assert tabelas.tabela(caminho, 2)["Descrição"].iloc[1] == "PLACA DE OBRA"
+    assert len(leituras) == 2
@@ -0,0 +1,53 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.template_cache import TemplateCache
+
+def test_template_cache_copias_e_invalidacao(tmp_path):
+    path = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active["A1"] = "ORIGINAL"
+    wb.save(path)
+    TemplateCache.limpar()
+
+    mestre = TemplateCache.mestre(path)
+    c1 = TemplateCache.copia(path)
+    c2 = TemplateCache.copia(path)
+    assert TemplateCache.mestre(path) is mestre
+
+    # Cópias independentes entre si e do mestre
+    c1.active["A1"] = "ALTERADO"
+    c1.active.row_dimensions[40].height = 30
+    assert c2.active["A1"].value == "ORIGINAL"
+    assert mestre.active["A1"].value == "ORIGINAL"
+
+    # Conteúdo novo no disco invalida a entrada
+    wb.active["A1"] = "NOVO"
+    wb.save(path)
+    os.utime(path, ns=(0, 0))
+    assert TemplateCache.mestre(path) is not mestre
+    assert TemplateCache.copia(path).active["A1"].value == "NOVO"
+
+
+def test_template_cache_copia_cortada(tmp_path):
+    path = str(tmp_path / "modelo.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["D4"] = "Descrição"
+    ws["A5"] = "LIXO"
+    ws["A5"].font = openpyxl.styles.Font(bold=True)
+    ws.merge_cells("A6:H9")
+    ws.row_dimensions[7].height = 50
+    wb.save(path)
+    TemplateCache.limpar()
+
+    copia = TemplateCache.copia(path, ate_linha=5).active
+    assert copia["D4"].value == "Descrição"
+    assert not [k for k in copia._cells if k[0] >= 5]
+    assert not copia.merged_cells.ranges
+    assert 7 not in copia.row_dimensions
+    assert TemplateCache.mestre(path).active.merged_cells.ranges
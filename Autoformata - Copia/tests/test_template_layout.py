@@ -0,0 +1,32 @@
+import pytest
+import sys
+import os
+import shutil
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.template_layout import LayoutTemplate, compilar_layout, obter_layout, caminho_descritor
+
+MODELO = os.path.join(os.path.dirname(__file__), '..', 'config', 'templates', 'MODELO_SUP(2025).xlsx')
+
+
+def test_layout_compilado_e_regravado(tmp_path):
+    path = str(tmp_path / "modelo.xlsx")
+    shutil.copy(MODELO, path)
+
+    layout = compilar_layout(path)
+    assert layout.start_row == 25
+    assert layout.rodape == (26, 51)
+    assert layout.ancoras["G20"] == "G20" and layout.ancoras["D22"] == "D22"
+    assert layout.largura("D") == pytest.approx(130.5703125)
+    # Origem do merge A26:G26 conta, as células internas não
+    assert 1 in layout.estilos_da_linha(26) and 2 not in layout.estilos_da_linha(26)
+    assert layout.estilos_da_linha(500) == layout.estilos_da_linha(1012)
+    # Retrato do rodapé: copiado pelo motor sem reabrir o template
+    assert "A33:H51" in layout.rodape_merges
+    assert any(r == 26 and v for r, _, v, _ in layout.rodape_celulas)
+
+    # Sem descritor no disco, o motor compila e grava; depois lê o mesmo conteúdo
+    assert not os.path.exists(caminho_descritor(path))
+    assert obter_layout(path) == layout
+    assert LayoutTemplate.ler(caminho_descritor(path)) == layout
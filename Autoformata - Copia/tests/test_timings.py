@@ -0,0 +1,57 @@
+import pytest
+import sys
+import os
+import shutil
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML
+from core.database import DatabaseManager
+from core.timings import CronometroFases, formatar_fases_lentas
+
+MODELO = os.path.join(os.path.dirname(__file__), '..', 'config', 'templates', 'MODELO_SUP(2025).xlsx')
+MAPA = {"ITEM": "ITEM", "CODIGO": "CODIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRICAO",
+        "UNID": "UNID", "QUANT": "QUANT", "UNIT": "UNIT"}
+
+def test_fases_aninhadas_contam_tempo_proprio():
+    cron = CronometroFases()
+    with cron.fase("gravacao"):
+        with cron.fase("itens"):
+            sum(range(100000))
+        with cron.fase("itens"):
+            pass
+    tempos = cron.relatorio(linhas=3)
+    assert list(tempos['fases']) == ["itens", "gravacao"]
+    assert tempos['linhas'] == 3
+    assert sum(tempos['fases'].values()) <= tempos['total'] + 1e-3
+
+def test_tempos_por_fase_no_historico(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modelo = str(tmp_path / "MODELO_SUP.xlsx")
+    shutil.copy(MODELO, modelo)
+    linhas = [{"ITEM": "1", "DESCRICAO": "CAPITULO", "_NIVEL_FORCADO": "N1"},
+              {"ITEM": "1.1", "DESCRICAO": "SERVIÇO", "QUANT": 2, "UNIT": 10, "_NIVEL_FORCADO": "ITEM"}]
+    db = DatabaseManager({'database': {'nome_arquivo': str(tmp_path / "historico.db")}})
+
+    mesclagens = []
+    for motor, nome in ((OrcamentoEngine, "Openpyxl"), (OrcamentoEngineXML, "Xml")):
+        info = {"nome_arquivo": nome}
+        ok, caminho, extra_info = motor({}).gerar_excel_final(linhas, modelo, MAPA, info)
+        assert ok
+        tempos = extra_info['tempos']
+        assert {"preparo", "cabecalho", "itens", "formulas", "rodape", "gravacao"} <= set(tempos['fases'])
+        assert tempos['linhas'] == 2
+        mesclagens.append(tempos['mesclagens'])
+        db.inserir_orcamento(db.montar_registro(info, linhas, caminho, tempos['total'], extra_info['valor_total'], tempos=tempos))
+    # Os dois motores escrevem as mesmas mesclagens (cabeçalho e rodapé do template)
+    assert mesclagens[0] == mesclagens[1] > 0
+
+    registro = db.buscar_orcamentos(1)[0]
+    assert registro['num_linhas'] == 2 and registro['num_mesclagens'] == mesclagens[1]
+
+    relatorio = db.fases_mais_lentas(ultimas=10)
+    assert [l['execucoes'] for l in relatorio if l['fase'] == "gravacao"] == [2]
+    assert relatorio == sorted(relatorio, key=lambda l: -l['media'])
+    assert abs(sum(l['percentual'] for l in relatorio) - 100.0) < 0.5
+    assert "gravacao" in formatar_fases_lentas(relatorio)
@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openpyxl
+from core.excel_handler import OrcamentoEngine
+from core.xml_engine import OrcamentoEngineXML, _EstilosXML
+
+ESTILOS = (
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Arial"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '</styleSheet>'
+)
+
+def test_celula_xml():
+    celula = OrcamentoEngineXML._celula
+
+    assert celula(25, 4, "A & B <C>", 3) == '<c r="D25" s="3" t="inlineStr"><is><t xml:space="preserve">A &amp; B &lt;C&gt;</t></is></c>'
+    assert celula(25, 6, 2.5, 3) == '<c r="F25" s="3"><v>2.5</v></c>'
+    assert celula(25, 8, "=ROUNDDOWN(F25*G25, 2)", 3) == '<c r="H25" s="3"><f>ROUNDDOWN(F25*G25, 2)</f></c>'
+    assert celula(25, 1, None, 3) == '<c r="A25" s="3"/>'
+    assert celula(25, 7, float('nan'), 3) == '<c r="G25" s="3"/>'
+
+def test_estilos_xml_dedup():
+    est = _EstilosXML(ESTILOS)
+
+    assert est.num_fmt("0.00") == 2
+    custom = est.num_fmt('"R$ "#,##0.00')
+    assert custom >= 164
+    assert est.num_fmt('"R$ "#,##0.00') == custom
+
+    fonte = est.adicionar("fonts", '<font><b val="1"/></font>')
+    assert est.adicionar("fonts", '<font><b val="1"/></font>') == fonte == 1
+
+    xml = est.render()
+    assert '<fonts count="2">' in xml
+    assert '<numFmts count="1">' in xml
+    assert 'formatCode="&quot;R$ &quot;#,##0.00"' in xml
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), '..', 'config', 'templates')
+MAPA = {"ITEM": "ITEM", "CODIGO": "CÓDIGO", "BANCO": "BANCO", "DESCRICAO": "DESCRIÇÃO",
+        "UNID": "UND", "QUANT": "QUANT.", "UNIT": "VALOR UNIT"}
+
+def _linhas():
+    """Orçamento com os três níveis, números em texto, vazios, NaN e descrições longas (altura variável)."""
+    linhas = []
+    quants = [1.5, "2,5", "R$ 1.500,20", 3, None, "abc", 0.333]
+    units = [10.559, "1.234,56", 7, "R$ 12,34", float("nan")]
+    k = 0
+    for c1 in range(1, 4):
+        linhas.append({"ITEM": str(c1), "DESCRIÇÃO": f"CAPITULO {c1}", "_NIVEL_FORCADO": "N1"})
+        for c2 in range(1, 3):
+            linhas.append({"ITEM": f"{c1}.{c2}", "DESCRIÇÃO": f"SUB {c1}.{c2}", "_NIVEL_FORCADO": "N2"})
+            for c3 in range(1, 5):
+                k += 1
+                linhas.append({"ITEM": f"{c1}.{c2}.{c3}", "CÓDIGO": str(1000 + c3), "BANCO": "SINAPI",
+                               "DESCRIÇÃO": "SERVIÇO " + "X" * (k * 23 % 300), "UND": "m2",
+                               "QUANT.": quants[k % len(quants)], "VALOR UNIT": units[k % len(units)], "_NIVEL_FORCADO": "ITEM"})
+    return linhas
+
+def _retrato(caminho):
+    """Tudo o que a equivalência entre motores cobre, por célula e por planilha."""
+    wb, valores = openpyxl.load_workbook(caminho), openpyxl.load_workbook(caminho, data_only=True)
+    ws, ws_v = wb.active, valores.active
+    celulas = {}
+    for row in ws.iter_rows():
+        for c in row:
+            if c.value is None and not c.has_style:
+                continue
+            celulas[c.coordinate] = (c.value, ws_v[c.coordinate].value, c.number_format,
+                                     repr(c.font), repr(c.fill), repr(c.border), repr(c.alignment))
+    alturas = {r: d.height for r, d in ws.row_dimensions.items() if d.height}
+    return celulas, alturas, sorted(str(m) for m in ws.merged_cells.ranges), ws.max_row
+
+@pytest.mark.parametrize("modelo", ["MODELO_SUP(2025).xlsx", "MODELO_PRUMO(2025-26).xlsx"])
+def test_mesma_saida_que_o_motor_openpyxl(modelo, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    caminho_modelo = os.path.join(TEMPLATES, modelo)
+    info = {"campus": "BELÉM", "setor": "TI", "servidor": "FULANO", "data": "01/01/2026", "processo": "999",
+            "num_orcamento": "7", "bdi": 0.2882, "calc_mode": "TRUNC", "altura_linha": 24.75}
+
+    ok, caminho_openpyxl, _ = OrcamentoEngine({}).gerar_excel_final(_linhas(), caminho_modelo, MAPA, {**info, "nome_arquivo": "openpyxl"})
+    assert ok
+    ok, caminho_xml, _ = OrcamentoEngineXML({}).gerar_excel_final(_linhas(), caminho_modelo, MAPA, {**info, "nome_arquivo": "xml"})
+    assert ok
+
+    celulas_a, alturas_a, merges_a, max_a = _retrato(caminho_openpyxl)
+    celulas_b, alturas_b, merges_b, max_b = _retrato(caminho_xml)
+    assert max_a == max_b
+    assert merges_a == merges_b
+    assert alturas_a == alturas_b
+    diferentes = sorted(k for k in set(celulas_a) | set(celulas_b) if celulas_a.get(k) != celulas_b.get(k))
+    assert diferentes == [], [(k, celulas_a.get(k), celulas_b.get(k)) for k in diferentes[:3]]
@@ -75,6 +75,26 @@ class ConfigPanel(ctk.CTkScrollableFrame):
             fin_grid, text="Gerar PDF automaticamente após Excel", text_color="lime")
         self.chk_pdf.grid(row=1, column=2, columnspan=2, padx=(20, 5), pady=5, sticky="w")
 
+        self.chk_streaming = ctk.CTkCheckBox(
+            fin_grid, text="Motor XML (streaming, orçamentos grandes)")
+        self.chk_streaming.grid(row=2, column=2, columnspan=2, padx=(20, 5), pady=5, sticky="w")
+
+        ctk.CTkLabel(fin_grid, text="Gravação:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        self.combo_gravacao = ctk.CTkComboBox(
+            fin_grid, width=250,
+            values=["Equilibrado (Padrão)",
+                    "Rápido (Rascunho - arquivo maior)",
+                    "Compacto (Entrega final)"])
+        self.combo_gravacao.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        self.combo_gravacao.set("Equilibrado (Padrão)")
+
+        ctk.CTkLabel(fin_grid, text="Dados p/ BI:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        self.combo_exportar = ctk.CTkComboBox(
+            fin_grid, width=250,
+            values=["Não exportar", "CSV", "JSON Lines", "Parquet"])
+        self.combo_exportar.grid(row=3, column=1, padx=5, pady=5, sticky="w")
+        self.combo_exportar.set("Não exportar")
+
         # === SEÇÃO 3: Mapeamento de Colunas ===
         f_map = ctk.CTkFrame(self)
         f_map.pack(fill="x", pady=10, padx=10)
@@ -119,6 +139,16 @@ class ConfigPanel(ctk.CTkScrollableFrame):
         else:
             calc_mode = "EXACT"
 
+        gravacao = self.combo_gravacao.get()
+        if "Rápido" in gravacao:
+            perfil_gravacao = "FAST"
+        elif "Compacto" in gravacao:
+            perfil_gravacao = "COMPACT"
+        else:
+            perfil_gravacao = "BALANCED"
+
+        exportar_dados = {"CSV": "CSV", "JSON Lines": "JSONL", "Parquet": "PARQUET"}.get(self.combo_exportar.get())
+
         try:
             altura = float(self.ent_altura.get().replace(',', '.'))
         except (ValueError, TypeError):
@@ -129,6 +159,9 @@ class ConfigPanel(ctk.CTkScrollableFrame):
             "calc_mode": calc_mode,
             "altura_linha": altura,
             "gerar_pdf": self.chk_pdf.get(),
+            "motor": "XML" if self.chk_streaming.get() == 1 else "OPENPYXL",
+            "perfil_gravacao": perfil_gravacao,
+            "exportar_dados": exportar_dados,
             "start_line": self.ent_line.get(),
         }
 
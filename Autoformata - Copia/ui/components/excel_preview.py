@@ -1,6 +1,8 @@
 import customtkinter as ctk
 from tkinter import ttk
 
+from core.number_parser import converter_numero
+
 
 class LevelSelector(ctk.CTkFrame):
     """
@@ -126,29 +128,10 @@ class LevelSelector(ctk.CTkFrame):
     @staticmethod
     def _parse_numeric(val):
         """
-        Conversor seguro: deteta se o valor do Pandas já é float/int nativo
-        e preserva-o. Se for string, faz .replace de forma segura.
+        Conversor seguro: o mesmo do motor (core.number_parser). O controller já
+        entrega o preço unitário convertido; aqui só passam valores avulsos.
         """
-        if val is None:
-            return None
-
-        # Se já for numérico nativo do Pandas/Python, preserva
-        if isinstance(val, (int, float)):
-            return float(val)
-
-        # Se for string, tenta converter
-        try:
-            s = str(val).replace('R$', '').strip()
-            if not s or s.lower() == 'nan' or s.lower() == 'none':
-                return None
-            # Formato PT-BR: 1.500,50 → 1500.50
-            if ',' in s and '.' in s:
-                s = s.replace('.', '').replace(',', '.')
-            elif ',' in s:
-                s = s.replace(',', '.')
-            return float(s)
-        except (ValueError, TypeError):
-            return None
+        return converter_numero(val)
 
     @staticmethod
     def format_ptbr(val):
@@ -572,6 +572,9 @@ class PlanifyApp(ctk.CTk, TkinterDnD.DnDWrapper):
             "calc_mode": config_data["calc_mode"],
             "altura_linha": config_data["altura_linha"],
             "gerar_pdf": config_data["gerar_pdf"],
+            "motor": config_data["motor"],
+            "perfil_gravacao": config_data["perfil_gravacao"],
+            "exportar_dados": config_data["exportar_dados"],
         }
 
         # Salva autocomplete para as chaves DB
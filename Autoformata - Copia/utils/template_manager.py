@@ -3,6 +3,7 @@ import os
 import shutil
 from pathlib import Path
 from core.paths import get_app_dir
+from core.template_layout import compilar_layout, caminho_descritor
 
 class TemplateManager:
     def __init__(self):
@@ -57,11 +58,16 @@ class TemplateManager:
         
         try:
             shutil.copy2(source_path, dest_path)
+
+            # Layout analisado uma vez aqui: o motor não volta a procurá-lo a cada geração
+            layout_path = caminho_descritor(dest_path)
+            compilar_layout(str(dest_path), int(start_line)).salvar(layout_path)
             
             # Salva no JSON
             self.templates[name] = {
                 "filename": filename,
                 "start_line": int(start_line),
+                "layout": os.path.basename(layout_path),
                 "date_added": str(os.path.getmtime(dest_path))
             }
             self._save_config(self.templates)
@@ -79,11 +85,12 @@ class TemplateManager:
             del self.templates[name]
             self._save_config(self.templates)
             
-            # Tenta remover o arquivo físico
-            try:
-                if file_path.exists():
-                    os.remove(file_path)
-            except: pass 
+            # Tenta remover o arquivo físico e o layout compilado
+            for path in (file_path, Path(caminho_descritor(file_path))):
+                try:
+                    if path.exists():
+                        os.remove(path)
+                except: pass 
             
             return True
         return False
\ No newline at end of file